@@ -16,14 +16,19 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QDockWidget,
                              QAction, QLabel, QVBoxLayout, QHBoxLayout, QSplitter, 
                              QTextEdit, QMessageBox, QPushButton, QFileDialog,
                              QTableWidget, QTableWidgetItem, QHeaderView, QComboBox, QLineEdit,
-                             QAbstractItemView, QDialog, QDateEdit, QFormLayout, QDialogButtonBox)
+                             QAbstractItemView, QDialog, QDateEdit, QFormLayout, QDialogButtonBox,
+                             QInputDialog)
 from PyQt5.QtCore import Qt, pyqtSlot, QDate
 from PyQt5.QtGui import QFont
 
+import numpy as np
 import pandas as pd
 
 # 导入资金管理模块
 from utils.money_management import validate_principal, validate_fee_rate
+# 导入策略注册表
+from utils.strategy_registry import get_strategy_registry
+from 界面ui.heatmap_widget import ParameterHeatmap
 
 
 class DateRangeDialog(QDialog):
@@ -102,6 +107,8 @@ class QuantBacktestApp(QMainWindow):
         self.filepath = None
         self.strategy_combo = None
         self.strategy_info_text = None
+        self.rule_edit = None  # 表达式规则输入框
+        self.save_rule_btn = None
         self.file_path_edit = None
         self.browse_btn = None
         self.param_inputs = []
@@ -113,6 +120,7 @@ class QuantBacktestApp(QMainWindow):
         self.run_action = None
         self.export_action = None
         self.optimization_results = None  # 保存参数优化结果用于返回
+        self.optimization_context = None  # 参数优化所用的策略函数、数据、本金和手续费率，用于热力图点击查看详情
         self.data_download_window = None  # 数据下载窗口引用
         self.init_ui()
         
@@ -175,6 +183,12 @@ class QuantBacktestApp(QMainWindow):
         chart_layout.addWidget(QLabel("交易详情:"))
         chart_layout.addWidget(self.result_table)
         chart_layout.addLayout(copy_button_layout)
+        
+        # 参数热力图（参数优化完成后显示）
+        self.heatmap_widget = ParameterHeatmap()
+        self.heatmap_widget.params_clicked.connect(self.on_heatmap_params_clicked)
+        self.heatmap_widget.setVisible(False)
+        chart_layout.addWidget(self.heatmap_widget)
         main_splitter.addWidget(self.chart_area)
         
         # 右侧控制面板
@@ -190,6 +204,17 @@ class QuantBacktestApp(QMainWindow):
         self.strategy_info_text = QTextEdit()
         self.strategy_info_text.setMaximumHeight(80)
         self.strategy_info_text.setReadOnly(True)
+        
+        # 表达式规则区域：输入规则后保存为策略，即可像普通策略一样回测和参数优化
+        rule_label = QLabel("表达式规则:")
+        rule_label.setStyleSheet("font-weight: bold;")
+        self.rule_edit = QTextEdit()
+        self.rule_edit.setMaximumHeight(80)
+        self.rule_edit.setPlaceholderText("如: param fast = 12 [5:30]; param slow = 26 [20:60:2]; require fast < slow; "
+                                          "buy: cross_above(ema(close, fast), ema(close, slow)); "
+                                          "sell: cross_below(ema(close, fast), ema(close, slow))")
+        self.save_rule_btn = QPushButton('保存为策略')
+        self.save_rule_btn.clicked.connect(self._save_rule)
         self._load_strategies()  # 加载策略列表（移到strategy_info_text初始化之后）
         
         # 数据文件选择区域
@@ -261,6 +286,9 @@ class QuantBacktestApp(QMainWindow):
         control_layout.addWidget(strategy_label)
         control_layout.addWidget(self.strategy_combo)
         control_layout.addWidget(self.strategy_info_text)
+        control_layout.addWidget(rule_label)
+        control_layout.addWidget(self.rule_edit)
+        control_layout.addWidget(self.save_rule_btn)
         control_layout.addWidget(data_file_label)
         control_layout.addLayout(data_file_layout)
         control_layout.addWidget(param_label)
@@ -341,11 +369,8 @@ class QuantBacktestApp(QMainWindow):
             strategy_description = "策略描述: 用于寻找最优参数的量化策略"  # 默认描述
             
             try:
-                # 动态导入策略模块获取描述
-                import importlib
-                strategy_module = importlib.import_module(f"策略.{self.selected_strategy}")
-                if hasattr(strategy_module, 'STRATEGY_DESCRIPTION'):
-                    strategy_description = f"策略描述: {strategy_module.STRATEGY_DESCRIPTION}"
+                # 从策略注册表读取缓存的策略描述
+                strategy_description = self._strategy_description(get_strategy_registry().info(self.selected_strategy))
             except Exception as e:
                 print(f"获取策略描述失败: {e}")
             
@@ -407,9 +432,8 @@ class QuantBacktestApp(QMainWindow):
                     
             param_text = "\n".join(params) if params else "未设置参数"
             
-            # 动态导入策略模块
-            import importlib
-            strategy_module = importlib.import_module(f"策略.{self.selected_strategy}")
+            # 从策略注册表获取策略模块（策略文件修改过时自动重新加载）
+            strategy_module = get_strategy_registry().get(self.selected_strategy)
             
             # 模拟回测过程
             self.statusBar().showMessage('正在运行回测...')
@@ -512,22 +536,47 @@ class QuantBacktestApp(QMainWindow):
                         # 修复导入模块的错误，确保使用正确的模块名
                         if target_strategy_name.endswith('.py'):
                             target_strategy_name = target_strategy_name[:-3]
-                        target_strategy_module = importlib.import_module(f"策略.{target_strategy_name}")
+                        target_strategy_module = get_strategy_registry().get(target_strategy_name)
+                        
+                        # 参数2 输入 '参数名=起点:终点[:步长]; 参数名=值1,值2' 时，按目标策略声明的参数空间逐个设置范围
+                        from utils.param_space import strategy_param_space
+                        target_space = strategy_param_space(target_strategy_module)
+                        range_text = self.param_inputs[1].toPlainText().strip() if len(self.param_inputs) > 1 else ''
+                        range_label = f"{start_val}-{end_val}"
+                        if target_space is not None and '=' in range_text:
+                            param_ranges = target_space.parse_ranges(range_text)
+                            range_label = range_text
+                            print(f"  按声明解析的参数范围: {param_ranges}")
+                        elif getattr(target_strategy_module, 'source_text', None) is not None and not any(
+                                widget.toPlainText().strip() for widget in self.param_inputs[1:3]):
+                            # 表达式规则未输入范围时，使用规则中 param 声明的优化范围
+                            param_ranges = None
+                            range_label = "规则声明的范围"
                         
                         # 显示开始优化信息
                         self.statusBar().showMessage('正在执行参数优化...')
                         self.update_progress_display("开始参数优化...")
                         QApplication.processEvents()  # 更新界面
                         
-                        # 运行参数优化（使用多线程加速）
+                        # 目标策略声明了其他周期/数据集时，先一次性加载并对齐，所有参数组合共用
+                        from utils.timeframes import prepare_strategy_data
+                        strategy_data = prepare_strategy_data(target_strategy_module, self.loaded_data, self.filepath)
+                        
+                        # 运行参数优化（使用多进程加速，行情数据通过共享内存传递）
                         optimization_result = strategy_module.optimize_parameters(
-                            self.loaded_data, 
+                            strategy_data, 
                             target_strategy_module.equity_signal, 
                             param_ranges,
                             principal,
                             fee_rate,
-                            max_workers=4,  # 使用4个线程加速计算
-                            progress_callback=self.update_progress_display  # 传递进度回调函数
+                            max_workers=None,  # 默认使用全部CPU核心
+                            progress_callback=self.update_progress_display,  # 传递进度回调函数
+                            executor='process',
+                            # 结果缓存：相同数据和策略的组合不再重复计算，中断后重新运行可继续
+                            cache_path=os.path.join(os.path.dirname(__file__), '数据', 'optimization_cache.sqlite'),
+                            # 增量状态：数据文件追加新K线后再次优化只回测新增部分
+                            state_path=os.path.join(os.path.dirname(__file__), '数据', 'optimization_state',
+                                                    f"{os.path.splitext(os.path.basename(self.filepath))[0]}_{target_strategy_name}.npz")
                         )
                         
                         # 清空进度显示
@@ -543,7 +592,7 @@ class QuantBacktestApp(QMainWindow):
                             result_text += f"数据范围: {start_date} 至 {end_date}\n"
                             result_text += f"数据行数: {len(self.loaded_data)}\n"
                         result_text += f"优化策略: {target_strategy_name}\n"
-                        result_text += f"参数范围: {start_val}-{end_val}\n"
+                        result_text += f"参数范围: {range_label}\n"
                         result_text += f"本金: {principal:.2f} 元\n"
                         result_text += f"手续费率: {fee_rate:.3f}\n"
                         # 添加耗时信息
@@ -573,49 +622,111 @@ class QuantBacktestApp(QMainWindow):
                                 result_text += f"- 胜率: {trade_details.get('win_rate', 0.0)*100:.2f}%\n"
                                 result_text += f"- 盈亏比: {trade_details.get('profit_loss_ratio', 0.0):.2f}\n\n"
                         
-                        result_text += f"共测试了 {len(all_results)} 组最优参数组合（从{n * (n - 1) // 2}种组合中筛选）"
+                        result_text += f"共测试了 {len(all_results)} 组最优参数组合（从{optimization_result.get('evaluated_count', n * (n - 1) // 2)}种组合中筛选）"
                         
                         # 更新交易详情表格，显示所有最优参数组合
                         self.update_optimization_results_table(all_results)
                         
+                        # 用整张参数网格绘制热力图
+                        self.optimization_context = {
+                            'strategy_func': target_strategy_module.equity_signal,
+                            'data': strategy_data,  # 已加入策略声明的其他周期列
+                            'principal': principal,
+                            'fee_rate': fee_rate
+                        }
+                        self.heatmap_widget.set_grid(optimization_result.get('grid'))
+                        self.heatmap_widget.setVisible(optimization_result.get('grid') is not None)
+                        
                         self.statusBar().showMessage('参数优化完成')
                     except Exception as e:
                         result_text = f"参数优化过程中发生错误:\n{str(e)}"
                         self.statusBar().showMessage('参数优化失败')
                 else:
-                    # 获取普通策略参数值
-                    short_ma = 5  # 默认值
-                    long_ma = 20  # 默认值
+                    # 策略声明了参数空间（STRATEGY_PARAMS）时按声明的位置、类型解析输入框，否则沿用原有的位置解析
+                    from utils.param_space import strategy_param_space
+                    space = strategy_param_space(strategy_module)
+                    texts = [input_widget.toPlainText().strip() for input_widget in self.param_inputs]
+                    
+                    if space is None:
+                        # 原有解析只统计非空输入框，按非空项的位置取值
+                        texts = [text for text in texts if text]
+                    
+                    def field(name, legacy_index):
+                        """取某个参数的输入框文本，没有该参数时为空字符串"""
+                        if space is not None:
+                            index = space.names.index(name) if name in space else len(texts)
+                        else:
+                            index = legacy_index
+                        return texts[index] if index < len(texts) else ''
+                    
                     principal = 100000.0  # 默认本金
                     fee_rate = 0.001  # 默认手续费率
                     
-                    # 解析参数
-                    if len(params) > 0 and params[0].split(':')[-1].strip():
-                        try:
-                            short_ma = int(params[0].split(':')[-1].strip())
-                        except ValueError:
-                            pass
+                    # 使用资金管理模块验证本金和手续费参数
+                    # 本金和手续费率可以用逗号分隔输入多个值，第一个值用于回测，全部值用于成本敏感性分析
+                    principal_list = []
+                    fee_rate_list = []
+                    if field('principal', 2):
+                        principal_list = [validate_principal(v.strip()) for v in field('principal', 2).split(',') if v.strip()]
+                        principal = principal_list[0]
                     
-                    if len(params) > 1 and params[1].split(':')[-1].strip():
-                        try:
-                            long_ma = int(params[1].split(':')[-1].strip())
-                        except ValueError:
-                            pass
+                    if field('fee_rate', 3):
+                        fee_rate_list = [validate_fee_rate(v.strip()) for v in field('fee_rate', 3).split(',') if v.strip()]
+                        fee_rate = fee_rate_list[0]
                     
-                    # 使用资金管理模块验证本金和手续费参数
-                    if len(params) > 2 and params[2].split(':')[-1].strip():
-                        principal = validate_principal(params[2].split(':')[-1].strip())
+                    # 止损/止盈/跟踪止损比例，用 / 分隔，留空的项不启用（如 0.05/0.1/ 或 //0.03）
+                    stop_settings = [None, None, None]
+                    if field('stops', 4):
+                        for k, value in enumerate(field('stops', 4).split('/')[:3]):
+                            try:
+                                stop_settings[k] = float(value) if value.strip() else None
+                            except ValueError:
+                                pass
                     
-                    if len(params) > 3 and params[3].split(':')[-1].strip():
-                        fee_rate = validate_fee_rate(params[3].split(':')[-1].strip())
+                    if space is not None:
+                        # 本金、手续费率已按多值解析，其余参数按声明转换并检查约束，输入有误时提示后返回
+                        try:
+                            values = space.bind([text if name not in ('principal', 'fee_rate') else ''
+                                                 for name, text in zip(space.names, texts)])
+                            values.update({name: value for name, value in (('principal', principal), ('fee_rate', fee_rate))
+                                           if name in space})
+                            signal_args = space.args(space.validate(values))
+                        except ValueError as e:
+                            QMessageBox.warning(self, '参数错误', str(e))
+                            self.statusBar().showMessage('参数错误')
+                            return
+                    else:
+                        short_ma = 5  # 默认值
+                        long_ma = 20  # 默认值
+                        if field('short_ma', 0):
+                            try:
+                                short_ma = int(field('short_ma', 0))
+                            except ValueError:
+                                pass
+                        if field('long_ma', 1):
+                            try:
+                                long_ma = int(field('long_ma', 1))
+                            except ValueError:
+                                pass
+                        signal_args = (short_ma, long_ma, principal, fee_rate)
                     
-                    # 调用普通策略函数
-                    signals = strategy_module.equity_signal(self.loaded_data, short_ma, long_ma, principal, fee_rate)
+                    # 普通回测不显示参数热力图
+                    self.heatmap_widget.setVisible(False)
+                    
+                    # 调用普通策略函数（策略声明了其他周期/数据集时传入对齐后的数据）
+                    from utils.timeframes import prepare_strategy_data
+                    strategy_data = prepare_strategy_data(strategy_module, self.loaded_data, self.filepath)
+                    signals = strategy_module.equity_signal(strategy_data, *signal_args)
                     signal_count = signals.sum() if not signals.empty else 0
                     
-                    # 计算交易详情
+                    # 计算交易详情（设置了止损/止盈时用最高价、最低价检查盘中触发）
                     from utils.money_management import calculate_trade_details
-                    trade_details = calculate_trade_details(self.loaded_data, signals, principal, fee_rate)
+                    use_stops = any(value is not None for value in stop_settings) and {'最高价', '最低价'} <= set(self.loaded_data.columns)
+                    if use_stops:
+                        from utils.stops import calculate_trade_details_with_stops
+                        trade_details = calculate_trade_details_with_stops(self.loaded_data, signals, principal, fee_rate, *stop_settings)
+                    else:
+                        trade_details = calculate_trade_details(self.loaded_data, signals, principal, fee_rate)
                     
                     # 更新交易详情表格
                     if 'trades' in trade_details:
@@ -670,6 +781,34 @@ class QuantBacktestApp(QMainWindow):
                     else:
                         result_text += f"结论: 两种策略收益相同"
                     
+                    # 成本敏感性分析：信号和开平仓位置只计算一次，所有本金/手续费率组合一次算出
+                    if len(principal_list) > 1 or len(fee_rate_list) > 1:
+                        from utils.money_management import calculate_cost_sensitivity
+                        trade_prices = None
+                        if use_stops:
+                            # 与交易详情相同，按止损/止盈后的开平仓价计算
+                            from utils.stops import extract_trade_prices_with_stops
+                            trade_prices = extract_trade_prices_with_stops(self.loaded_data, signals, *stop_settings)
+                        sensitivity = calculate_cost_sensitivity(self.loaded_data, signals,
+                                                                 principal_list or [principal], fee_rate_list or [fee_rate],
+                                                                 trade_prices=trade_prices)
+                        result_text += f"\n\n成本敏感性分析（交易次数 {sensitivity['trade_count']}）:"
+                        for i, p in enumerate(sensitivity['principals']):
+                            for j, f in enumerate(sensitivity['fee_rates']):
+                                result_text += (f"\n- 本金 {p:.2f}, 手续费率 {f:.4f}: "
+                                                f"总收益 {sensitivity['total_return'][i, j, 0]:.2f} 元, "
+                                                f"收益率 {sensitivity['total_return_rate'][i, j, 0]:.2f}%, "
+                                                f"总手续费 {sensitivity['total_fee'][i, j, 0]:.2f} 元")
+                    
+                    # 稳健性分析：交易顺序打乱、分块自助法、随机起始日期的收益和回撤分位数
+                    try:
+                        from utils.robustness import robustness_analysis, format_robustness_report
+                        analysis = robustness_analysis(self.loaded_data, signals, trade_details, principal, fee_rate, seed=0,
+                                                       stop_settings=stop_settings if use_stops else None)
+                        result_text += f"\n\n{format_robustness_report(analysis)}"
+                    except Exception as e:
+                        print(f"稳健性分析失败: {e}")
+                    
                     result_text += f"\n回测已完成"
                     
                     self.statusBar().showMessage('回测完成')
@@ -683,6 +822,38 @@ class QuantBacktestApp(QMainWindow):
                 # 启用导出按钮
                 self.export_result_btn.setEnabled(True)
                 self.export_action.setEnabled(True)
+            elif getattr(strategy_module, 'STRATEGY_TYPE', None) == 'cross_sectional':
+                # 截面策略：加载数据文件所在目录中同一周期的全部币种
+                from utils.portfolio import PricePanel, same_interval_files
+                from utils.cross_section import run_cross_sectional_strategy
+                values = [input_widget.toPlainText().strip() for input_widget in self.param_inputs]
+                rebalance = int(values[2]) if len(values) > 2 and values[2] else 1
+                principal = validate_principal(values[3]) if len(values) > 3 and values[3] else 100000.0
+                fee_rate = validate_fee_rate(values[4]) if len(values) > 4 and values[4] else 0.001
+                
+                files = same_interval_files(self.filepath)
+                panel = PricePanel.from_csv(files).between(self.loaded_data['交易时间'].iloc[0],
+                                                          self.loaded_data['交易时间'].iloc[-1])
+                result = run_cross_sectional_strategy(strategy_module, panel, *values[:2], principal=principal,
+                                                      fee_rate=fee_rate, rebalance=rebalance)
+                
+                result_text = f"截面回测完成\n"
+                result_text += f"币种数量: {len(panel.symbols)} ({', '.join(panel.symbols[:10])}{' ...' if len(panel.symbols) > 10 else ''})\n"
+                result_text += f"K线数量: {panel.shape[0]}\n"
+                result_text += f"策略: {self.selected_strategy}\n"
+                result_text += f"策略参数:\n{param_text}\n\n"
+                result_text += f"回测结果:\n"
+                result_text += f"- 期末权益: {result['final_equity']:.2f}\n"
+                result_text += f"- 总收益率: {result['total_return_rate']:.2f}%\n"
+                result_text += f"- 最大回撤: {result['max_drawdown'] * 100:.2f}%\n"
+                result_text += f"- 夏普比率: {result['sharpe']:.2f}\n"
+                result_text += f"- 调仓次数: {result['rebalance_count']}\n"
+                result_text += f"- 平均换手率: {result['average_turnover'] * 100:.2f}%\n"
+                result_text += f"- 总手续费: {result['total_fee']:.2f}\n\n"
+                result_text += "盈亏贡献（前5 / 后5）:\n"
+                order = list(np.argsort(result['asset_pnl'])[::-1])
+                for j in order[:5] + order[max(5, len(order) - 5):]:
+                    result_text += f"- {panel.symbols[j]}: {result['asset_pnl'][j]:.2f}\n"
             else:
                 # 模拟回测计算时间
                 import time
@@ -748,30 +919,54 @@ class QuantBacktestApp(QMainWindow):
                 QMessageBox.critical(self, '错误', f'导出失败:\n{str(e)}')
 
     def _load_strategies(self):
-        """扫描策略目录加载可用策略"""
-        # 使用项目根目录来定位策略目录，确保在不同入口点都能正确找到
-        project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '.'))
-        strategy_path = os.path.join(project_root, '策略')
-        print(f"项目根目录: {project_root}")
-        print(f"策略目录路径: {strategy_path}")
-        if os.path.exists(strategy_path):
-            print(f"策略目录存在，开始扫描文件...")
-            for file in os.listdir(strategy_path):
-                print(f"找到文件: {file}")
-                if file.endswith('.py') and not file.startswith('_'):
-                    strategy_name = file[:-3]
-                    print(f"添加策略: {strategy_name}")
-                    self.strategy_combo.addItem(strategy_name)
+        """从策略注册表加载可用策略（注册表启动时扫描一次策略目录）"""
+        strategy_names = get_strategy_registry().refresh()
+        if strategy_names:
+            self.strategy_combo.addItems(strategy_names)
             
-            # 如果有策略，设置默认选中第一个
-            if self.strategy_combo.count() > 0:
-                self.strategy_combo.setCurrentIndex(0)
-                self.selected_strategy = self.strategy_combo.currentText()
-                self._update_strategy_info()
+            # 设置默认选中第一个
+            self.strategy_combo.setCurrentIndex(0)
+            self.selected_strategy = self.strategy_combo.currentText()
+            self._update_strategy_info()
         else:
-            print(f"策略目录不存在: {strategy_path}")
+            print(f"策略目录中没有策略: {get_strategy_registry().directory}")
             # 添加一个默认选项
             self.strategy_combo.addItem("默认策略")
+    
+    @staticmethod
+    def _strategy_description(info: dict) -> str:
+        """由注册表中的策略元数据生成描述文本，策略加载失败时显示错误信息"""
+        if info['error']:
+            return f"策略加载失败: {info['error']}\n修改策略文件后重新选择该策略即可重新加载"
+        return f"策略描述: {info['description']}"
+
+    def _save_rule(self):
+        """把规则输入框中的表达式规则保存为策略（策略目录中的 .rule 文件）"""
+        text = self.rule_edit.toPlainText().strip()
+        if not text:
+            QMessageBox.warning(self, '警告', '请先输入表达式规则')
+            return
+        
+        # 当前选中的是规则时默认覆盖它
+        registry = get_strategy_registry()
+        current = self.selected_strategy if self.selected_strategy in registry else ''
+        default_name = current if current and registry.info(current)['rule_text'] is not None else ''
+        name, ok = QInputDialog.getText(self, '保存规则', '策略名称:', text=default_name)
+        if not ok:
+            return
+        try:
+            name = registry.save_rule(name, text)
+        except ValueError as e:
+            QMessageBox.warning(self, '规则有误', str(e))
+            return
+        
+        if self.strategy_combo.findText(name) < 0:
+            self.strategy_combo.addItem(name)
+        if self.strategy_combo.currentText() == name:
+            self._update_strategy_info()
+        else:
+            self.strategy_combo.setCurrentText(name)
+        self.statusBar().showMessage(f'规则已保存为策略: {name}')
 
     def _on_strategy_changed(self, strategy_name):
         """策略选择变化事件处理"""
@@ -785,15 +980,17 @@ class QuantBacktestApp(QMainWindow):
             strategy_description = "策略描述: 用于寻找最优参数的量化策略"  # 默认描述
             
             try:
-                # 动态导入策略模块获取描述
-                import importlib
-                strategy_module = importlib.import_module(f"策略.{self.selected_strategy}")
-                if hasattr(strategy_module, 'STRATEGY_DESCRIPTION'):
-                    strategy_description = f"策略描述: {strategy_module.STRATEGY_DESCRIPTION}"
+                # 从策略注册表读取缓存的描述和参数说明（策略文件修改过时自动重新加载）
+                info = get_strategy_registry().info(self.selected_strategy)
+                strategy_description = self._strategy_description(info)
+                
+                # 选中表达式规则时把规则文本填入规则输入框，便于修改后重新保存
+                if info['rule_text'] is not None:
+                    self.rule_edit.setPlainText(info['rule_text'])
                 
                 # 更新参数输入框的提示文本
-                if hasattr(strategy_module, 'STRATEGY_PARAM_DESCRIPTIONS'):
-                    param_descriptions = strategy_module.STRATEGY_PARAM_DESCRIPTIONS
+                if info['param_descriptions'] is not None:
+                    param_descriptions = info['param_descriptions']
                     for i, input_widget in enumerate(self.param_inputs):
                         if i < len(param_descriptions):
                             input_widget.setPlaceholderText(param_descriptions[i])
@@ -1113,6 +1310,27 @@ class QuantBacktestApp(QMainWindow):
                 # 添加返回按钮
                 self.add_back_button()
 
+    def on_heatmap_params_clicked(self, params):
+        """处理热力图格子点击事件：回测该组参数并显示交易详情"""
+        if self.loaded_data is None or self.optimization_context is None:
+            return
+        try:
+            from utils.money_management import calculate_trade_details
+            context = self.optimization_context
+            signals = context['strategy_func'](context['data'], *params.values())
+            trade_details = calculate_trade_details(context['data'], signals, context['principal'], context['fee_rate'])
+        except Exception as e:
+            QMessageBox.warning(self, '警告', f'回测参数 {params} 失败:\n{str(e)}')
+            return
+        
+        # 与点击结果表格“详情”列相同的展示方式
+        self.update_trade_table(trade_details['trades'])
+        param_text = ", ".join(f"{k}={v}" for k, v in params.items())
+        self.result_table.setHorizontalHeaderItem(0, QTableWidgetItem(f"{param_text} 详情"))
+        self.add_summary_row(trade_details)
+        self.add_back_button()
+        self.statusBar().showMessage(f'参数 {param_text}: 收益率 {trade_details["total_return_rate"]:.2f}%')
+
     def update_trade_table(self, trades):
         """更新交易详情表格"""
         if not trades:
@@ -1148,6 +1366,10 @@ class QuantBacktestApp(QMainWindow):
             # 添加交易结果（盈利/亏损）
             if isinstance(trade['return'], (int, float)):
                 result_text = "盈利" if trade['return'] > 0 else "亏损" if trade['return'] < 0 else "持平"
+                # 止损/止盈触发的交易标注平仓原因
+                exit_reason = {'stop_loss': '止损', 'take_profit': '止盈', 'trailing_stop': '跟踪止损'}.get(trade.get('exit_reason'))
+                if exit_reason:
+                    result_text += f"({exit_reason})"
                 self.result_table.setItem(i, 8, QTableWidgetItem(result_text))
             else:
                 self.result_table.setItem(i, 8, QTableWidgetItem("未知"))
@@ -1188,6 +1410,10 @@ class QuantBacktestApp(QMainWindow):
         self.end_date_edit.clear()
 
 if __name__ == '__main__':
+    # 打包后的程序启动子进程时需要
+    import multiprocessing
+    multiprocessing.freeze_support()
+    
     print("正在启动量化回测系统...")
     app = QApplication(sys.argv)
     
@@ -0,0 +1,98 @@
+"""
+技术指标库耗时基准
+对比 k线图/indicators.py 的多周期一次计算与逐周期调用 pandas 的耗时
+
+运行方式: python benchmarks/bench_indicators.py [K线数量]
+
+1000万根K线、6 个周期 (5, 10, 20, 30, 60, 120) 的参考结果（单核）：
+指标        pandas(s)  指标库(s)  加速比
+SMA           1.655     0.946    1.75x
+KDJ           8.160     7.205    1.13x
+VWAP          3.264     0.753    4.33x
+唐奇安通道    4.907     3.092    1.59x
+滚动和、滚动最值类指标的多周期共用累积和/倍增表，明显快于逐周期调用 pandas。
+EMA、MACD、RSI、ATR、ADX、布林带在指标库中直接调用 pandas（逐周期的 ewm/rolling 已是单遍编译内核，
+多周期合并只会多出结果数组的复制），不在此对比。
+"""
+
+import importlib
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+indicators = importlib.import_module('k线图.indicators')
+
+# 多周期指标使用的周期
+PERIODS = (5, 10, 20, 30, 60, 120)
+
+
+def make_data(bars: int) -> dict:
+    """生成随机游走行情数据"""
+    rng = np.random.default_rng(42)
+    close = 30000 * np.cumprod(1 + rng.normal(0, 0.01, bars))
+    spread = close * rng.random(bars) * 0.01
+    return {
+        'high': close + spread,
+        'low': close - spread,
+        'close': close,
+        'volume': rng.random(bars) * 100,
+    }
+
+
+def pandas_cases(data: dict) -> dict:
+    """逐周期调用 pandas 的写法"""
+    close, high, low, volume = (pd.Series(data[k]) for k in ('close', 'high', 'low', 'volume'))
+    typical = (high + low + close) / 3
+
+    def kdj():
+        for p in PERIODS:
+            highest, lowest = high.rolling(p, min_periods=1).max(), low.rolling(p, min_periods=1).min()
+            k = ((close - lowest) / (highest - lowest) * 100).ewm(alpha=1 / 3, adjust=False).mean()
+            d = k.ewm(alpha=1 / 3, adjust=False).mean()
+            3 * k - 2 * d
+
+    return {
+        'SMA': lambda: [close.rolling(p).mean() for p in PERIODS],
+        'KDJ': kdj,
+        'VWAP': lambda: [(typical * volume).rolling(p).sum() / volume.rolling(p).sum() for p in PERIODS],
+        '唐奇安通道': lambda: [(high.rolling(p).max(), low.rolling(p).min()) for p in PERIODS],
+    }
+
+
+def numpy_cases(data: dict) -> dict:
+    """指标库的多周期一次计算"""
+    close, high, low, volume = data['close'], data['high'], data['low'], data['volume']
+    return {
+        'SMA': lambda: indicators.sma(close, PERIODS),
+        'KDJ': lambda: indicators.kdj(high, low, close, PERIODS),
+        'VWAP': lambda: indicators.vwap(high, low, close, volume, PERIODS),
+        '唐奇安通道': lambda: indicators.donchian(high, low, PERIODS),
+    }
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    bars = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    data = make_data(bars)
+    pandas_funcs, numpy_funcs = pandas_cases(data), numpy_cases(data)
+
+    print(f"K线数量: {bars}, 周期: {PERIODS}")
+    print(f"{'指标':<8}{'pandas(s)':>12}{'指标库(s)':>12}{'加速比':>10}")
+    for name in numpy_funcs:
+        pandas_cost, numpy_cost = timed(pandas_funcs[name]), timed(numpy_funcs[name])
+        print(f"{name:<8}{pandas_cost:>12.3f}{numpy_cost:>12.3f}{pandas_cost / numpy_cost:>9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
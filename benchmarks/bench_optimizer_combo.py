@@ -0,0 +1,72 @@
+"""
+参数优化单组合耗时基准
+对比优化前的评估流程（calculate_returns 内部回测一次 + 再调用一次 calculate_trade_details，
+并且每个组合都重新计算 pct_change）与当前 _evaluate_single_combination 的单次回测流程
+
+运行方式: python benchmarks/bench_optimizer_combo.py [K线数量] [组合数量]
+"""
+
+import importlib
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from utils.money_management import calculate_trade_details, calculate_bar_returns
+
+optimizer = importlib.import_module('策略.参数优化策略')
+ma_strategy = importlib.import_module('策略.MA双均线择时')
+
+
+def make_data(bars: int) -> pd.DataFrame:
+    """生成随机游走行情数据"""
+    rng = np.random.default_rng(42)
+    close = 30000 * np.cumprod(1 + rng.normal(0, 0.01, bars))
+    return pd.DataFrame({
+        '交易时间': pd.date_range('2020-01-01', periods=bars, freq='min'),
+        '收盘价': close,
+    })
+
+
+def legacy_evaluate(data_df, param_combination, principal, fee_rate):
+    """优化前的评估流程：同一组合回测两次，并重复计算逐K线收益率"""
+    signals = ma_strategy.equity_signal(data_df, *param_combination)
+    total_return, sharpe_ratio = optimizer.calculate_returns(data_df, signals, principal, fee_rate)
+    trade_details = calculate_trade_details(data_df, signals, principal, fee_rate)
+    return total_return, sharpe_ratio, trade_details
+
+
+def main():
+    bars = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    combos = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    principal, fee_rate = 100000.0, 0.001
+
+    data_df = make_data(bars)
+    pairs = [(5 + i, 30 + 3 * i) for i in range(combos)]
+
+    start = time.perf_counter()
+    for pair in pairs:
+        legacy_evaluate(data_df, pair, principal, fee_rate)
+    legacy_cost = (time.perf_counter() - start) / combos
+
+    start = time.perf_counter()
+    bar_returns = calculate_bar_returns(data_df)
+    for pair in pairs:
+        params = {'short_ma': pair[0], 'long_ma': pair[1]}
+        optimizer._evaluate_single_combination(
+            (data_df, ma_strategy.equity_signal, pair, principal, fee_rate, params, bar_returns))
+    current_cost = (time.perf_counter() - start) / combos
+
+    print(f"K线数量: {bars}, 组合数量: {combos}")
+    print(f"优化前每组合耗时: {legacy_cost * 1000:.2f} ms")
+    print(f"优化后每组合耗时: {current_cost * 1000:.2f} ms")
+    print(f"加速比: {legacy_cost / current_cost:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
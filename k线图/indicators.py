@@ -1,42 +1,342 @@
+"""
+技术指标库（NumPy）
+所有指标都接收原始数组（numpy 数组或 Series），不修改传入的数据，输入中不应包含 NaN。
+
+多周期指标（sma、rolling_max / rolling_min、donchian、kdj、vwap）可一次传入多个周期，
+返回形状为 (周期数, K线数) 的二维数组，各周期共用累积和、滚动最值倍增表等中间结果，比逐周期调用 pandas 快：
+- sma: rolling(n).mean()
+- donchian: rolling(n).max() / rolling(n).min()
+- kdj: RSV 使用 rolling(n, min_periods=1) 的最高/最低价，K、D 初值 50、平滑系数 1/3
+- vwap: (典型价 × 成交量).rolling(n).sum() / 成交量.rolling(n).sum()
+
+EMA 类指标（ema、macd、rsi、atr、adx）和滚动标准差（rolling_std、bollinger_bands）是逐K线递推或 pandas 已有的
+单遍编译内核，多周期合并计算并不比逐周期调用 pandas 快，这些指标只接收单个周期，直接使用 pandas：
+- ema / macd: ewm(span=n, adjust=...).mean()
+- rolling_std: rolling(n).std()
+- rsi / atr / adx: Wilder 平滑，即 ewm(alpha=1/n, adjust=False).mean()
+
+calculate_macd / calculate_ema / calculate_bollinger_bands（K线图原有的 DataFrame 接口）的结果来自共享指标缓存。
+策略中使用: from k线图.indicators import rsi, atr
+"""
+
+import sys
+import os
+
 import pandas as pd
 import numpy as np
 
+# 添加项目根目录到Python路径，K线图与策略、参数优化共用 utils 中的指标缓存
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils import indicator_cache
+
+def _as_float(values) -> np.ndarray:
+    if isinstance(values, (pd.Series, pd.Index)):
+        values = values.to_numpy()
+    return np.asarray(values, dtype=np.float64)
+
+
+def _periods(periods) -> np.ndarray:
+    periods = np.atleast_1d(np.asarray(periods, dtype=np.int64))
+    if np.any(periods < 1):
+        raise ValueError(f"周期必须为正整数: {periods}")
+    return periods
+
+
+def _period(period) -> int:
+    """单周期指标的周期（正整数）"""
+    if int(period) < 1:
+        raise ValueError(f"周期必须为正整数: {period}")
+    return int(period)
+
+
+def ewm_filter(values, alphas, initial=None, adjust: bool = False) -> np.ndarray:
+    """
+    一阶指数递推 y[t] = (1 - a) * y[t-1] + a * x[t]，多个平滑系数一次计算
+    递推本身是逐K线的循环，使用 pandas ewm 的编译内核，逐系数调用
+    :param values: 一维输入数组，或每个平滑系数各一行的二维数组 (len(alphas), K线数)
+    :param alphas: 平滑系数列表（0 < a <= 1）
+    :param initial: y[-1] 的初值（标量或逐系数数组），默认 y[0] = x[0]
+    :param adjust: 与 pandas ewm 的 adjust 参数含义相同（为 True 时忽略 initial）
+    :return: 形状为 (len(alphas), K线数) 的数组
+    """
+    alphas = np.atleast_1d(np.asarray(alphas, dtype=np.float64))
+    x = _as_float(values)
+    out = np.empty((len(alphas), x.shape[-1]))
+    if out.shape[1] == 0:
+        return out
+    initial = None if initial is None or adjust else np.broadcast_to(np.asarray(initial, dtype=np.float64), len(alphas))
+    # 一维输入且没有初值时各系数共用同一个 Series，不为每个系数复制输入
+    shared = pd.Series(x) if x.ndim == 1 and initial is None else None
+    for k, alpha in enumerate(alphas):
+        if shared is not None:
+            series = shared
+        else:
+            row = x if x.ndim == 1 else x[k]
+            series = pd.Series(row if initial is None else np.concatenate(([initial[k]], row)))
+        smoothed = series.ewm(alpha=alpha, adjust=adjust).mean().to_numpy()
+        out[k] = smoothed if initial is None else smoothed[1:]
+    return out
+
+
+def _wilder(values, period: int) -> np.ndarray:
+    """Wilder 平滑：ewm(alpha=1/n, adjust=False).mean()，首个值为 values[0]"""
+    return pd.Series(_as_float(values)).ewm(alpha=1.0 / period, adjust=False).mean().to_numpy()
+
+
+def ema(close, period: int = 20, adjust: bool = False) -> np.ndarray:
+    """
+    EMA，即 ewm(span=n, adjust=...).mean()
+    :param close: 收盘价数组
+    :param period: 周期
+    :param adjust: 与 pandas ewm 的 adjust 参数含义相同
+    :return: 一维数组
+    """
+    return pd.Series(_as_float(close)).ewm(span=_period(period), adjust=adjust).mean().to_numpy()
+
+
+def sma(close, periods=(5, 10, 20)) -> np.ndarray:
+    """
+    多周期简单移动平均，与 rolling(n).mean() 一致（前 n-1 根为 NaN）
+    窗口和按 sum += x[t] - x[t-n] 逐根累加（累积和为顺序计算），与流式版本 SMAStream 的结果逐位相同
+    :return: (周期数, K线数) 数组
+    """
+    x = _as_float(close)
+    periods = _periods(periods)
+    out = np.full((len(periods), len(x)), np.nan)
+    for k, p in enumerate(periods):
+        if p <= len(x):
+            out[k, p - 1:] = np.cumsum(np.concatenate((x[:p], x[p:] - x[:-p])))[p - 1:] / p
+    return out
+
+
+def rolling_std(close, period: int = 20) -> np.ndarray:
+    """
+    滚动标准差（ddof=1），即 rolling(n).std()（前 n-1 根为 NaN）
+    :return: 一维数组
+    """
+    return pd.Series(_as_float(close)).rolling(_period(period)).std().to_numpy()
+
+
+def _rolling_extreme(values, periods, maximum: bool, min_periods_one: bool = False) -> np.ndarray:
+    """
+    多周期滚动最大/最小值：倍增表 T_2w[i] = f(T_w[i], T_w[i-w])，周期 p 由两个长度 2^k 的窗口覆盖
+    :param min_periods_one: True 时前 p-1 根按已有K线计算（rolling(n, min_periods=1)），否则为 NaN
+    """
+    x = _as_float(values)
+    periods = _periods(periods)
+    func = np.maximum if maximum else np.minimum
+    n = len(x)
+    out = np.full((len(periods), n), np.nan)
+    if n == 0:
+        return out
+    prefix = func.accumulate(x)
+    level = x.copy()  # 窗口长度为 width 的滚动值（前 width-1 个位置为部分窗口）
+    width = 1
+    order = np.argsort(periods)
+    for k in order:
+        p = int(periods[k])
+        while width * 2 <= p:
+            shifted = np.empty_like(level)
+            shifted[:width] = level[:width]
+            shifted[width:] = level[:-width]
+            level = func(level, shifted)
+            width *= 2
+        if p - 1 < n:
+            tail = np.arange(p - 1, n)
+            out[k, p - 1:] = func(level[tail], level[tail - (p - width)])
+        if min_periods_one:
+            out[k, :min(p - 1, n)] = prefix[:min(p - 1, n)]
+    return out
+
+
+def rolling_max(values, periods) -> np.ndarray:
+    """多周期滚动最大值，与 rolling(n).max() 一致"""
+    return _rolling_extreme(values, periods, maximum=True)
+
+
+def rolling_min(values, periods) -> np.ndarray:
+    """多周期滚动最小值，与 rolling(n).min() 一致"""
+    return _rolling_extreme(values, periods, maximum=False)
+
+
+def macd(close, fast: int = 12, slow: int = 26, signal: int = 9, adjust: bool = True) -> tuple:
+    """
+    MACD
+    :return: (macd, signal, hist) 一维数组
+    """
+    line = ema(close, fast, adjust=adjust) - ema(close, slow, adjust=adjust)
+    signal_line = ema(line, signal, adjust=adjust)
+    return line, signal_line, line - signal_line
+
+
+def bollinger_bands(close, period: int = 20, std_multiplier: float = 2) -> tuple:
+    """
+    布林带：中轨为 sma，上下轨为中轨 ± std_multiplier × rolling(n).std()
+    :return: (middle, upper, lower) 一维数组
+    """
+    middle = sma(close, [period])[0]
+    width = rolling_std(close, period) * std_multiplier
+    return middle, middle + width, middle - width
+
+
+def rsi(close, period: int = 14) -> np.ndarray:
+    """
+    RSI（Wilder 平滑），第一根K线为 NaN
+    :return: 一维数组
+    """
+    x = _as_float(close)
+    period = _period(period)
+    out = np.full(len(x), np.nan)
+    if len(x) < 2:
+        return out
+    delta = np.diff(x)
+    gain = _wilder(np.maximum(delta, 0.0), period)
+    loss = _wilder(np.maximum(-delta, 0.0), period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out[1:] = np.where(loss > 0, 100.0 - 100.0 / (1.0 + gain / loss), np.where(gain > 0, 100.0, np.nan))
+    return out
+
+
+def true_range(high, low, close) -> np.ndarray:
+    """
+    真实波幅：max(最高-最低, |最高-前收|, |最低-前收|)，第一根为 最高-最低
+    """
+    high, low, close = _as_float(high), _as_float(low), _as_float(close)
+    tr = high - low
+    if len(close) > 1:
+        prev_close = close[:-1]
+        tr[1:] = np.maximum(tr[1:], np.maximum(np.abs(high[1:] - prev_close), np.abs(low[1:] - prev_close)))
+    return tr
+
+
+def atr(high, low, close, period: int = 14) -> np.ndarray:
+    """
+    ATR（Wilder 平滑）
+    :return: 一维数组
+    """
+    return _wilder(true_range(high, low, close), _period(period))
+
+
+def adx(high, low, close, period: int = 14) -> tuple:
+    """
+    ADX 及 +DI / -DI（Wilder 平滑），第一根K线为 NaN
+    :return: (adx, plus_di, minus_di) 一维数组
+    """
+    high, low = _as_float(high), _as_float(low)
+    period = _period(period)
+    adx_out, plus_out, minus_out = np.full(len(high), np.nan), np.full(len(high), np.nan), np.full(len(high), np.nan)
+    if len(high) < 2:
+        return adx_out, plus_out, minus_out
+    up = np.diff(high)
+    down = -np.diff(low)
+    plus_dm = np.where((up > down) & (up > 0), up, 0.0)
+    minus_dm = np.where((down > up) & (down > 0), down, 0.0)
+    smoothed_tr = _wilder(true_range(high, low, close)[1:], period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        plus_out[1:] = 100.0 * _wilder(plus_dm, period) / smoothed_tr
+        minus_out[1:] = 100.0 * _wilder(minus_dm, period) / smoothed_tr
+        dx = 100.0 * np.abs(plus_out[1:] - minus_out[1:]) / (plus_out[1:] + minus_out[1:])
+    adx_out[1:] = _wilder(np.nan_to_num(dx, nan=0.0), period)
+    return adx_out, plus_out, minus_out
+
+
+def kdj(high, low, close, periods=(9,), k_smooth: int = 3, d_smooth: int = 3) -> tuple:
+    """
+    多周期 KDJ
+    RSV = (收盘 - n日最低) / (n日最高 - n日最低) × 100，K = 前K × (1-1/k_smooth) + RSV / k_smooth，D 同理平滑 K，J = 3K - 2D
+    :return: (k, d, j)，各为 (周期数, K线数) 数组
+    """
+    close = _as_float(close)
+    periods = _periods(periods)
+    highest = _rolling_extreme(high, periods, maximum=True, min_periods_one=True)
+    lowest = _rolling_extreme(low, periods, maximum=False, min_periods_one=True)
+    span = highest - lowest
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsv = np.where(span > 0, (close - lowest) / span * 100.0, 50.0)
+    k_values = ewm_filter(rsv, np.full(len(periods), 1.0 / k_smooth), initial=50.0)
+    d_values = ewm_filter(k_values, np.full(len(periods), 1.0 / d_smooth), initial=50.0)
+    return k_values, d_values, 3.0 * k_values - 2.0 * d_values
+
+
+def vwap(high, low, close, volume, periods=(20,)) -> np.ndarray:
+    """
+    多周期滚动 VWAP：典型价 (最高+最低+收盘)/3 按成交量加权，前 n-1 根为 NaN；周期为 0 表示从第一根K线开始累计
+    :return: (周期数, K线数) 数组
+    """
+    typical = (_as_float(high) + _as_float(low) + _as_float(close)) / 3.0
+    volume = _as_float(volume)
+    periods = np.atleast_1d(np.asarray(periods, dtype=np.int64))
+    amount = np.concatenate(([0.0], np.cumsum(typical * volume)))
+    total_volume = np.concatenate(([0.0], np.cumsum(volume)))
+    n = len(typical)
+    out = np.full((len(periods), n), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for k, p in enumerate(periods):
+            if p <= 0:
+                out[k] = amount[1:] / total_volume[1:]
+            elif p <= n:
+                out[k, p - 1:] = (amount[p:] - amount[:-p]) / (total_volume[p:] - total_volume[:-p])
+    return out
+
+
+def anchored_vwap(high, low, close, volume, groups) -> np.ndarray:
+    """
+    分段累计 VWAP（如每日重新开始）
+    :param groups: 每根K线所属的段号（非递减，如日期序号）
+    :return: 一维数组
+    """
+    typical = (_as_float(high) + _as_float(low) + _as_float(close)) / 3.0
+    volume = _as_float(volume)
+    groups = np.asarray(groups)
+    amount = np.cumsum(typical * volume)
+    total_volume = np.cumsum(volume)
+    # 每段开始前的累计值
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    segment = np.cumsum(np.r_[True, groups[1:] != groups[:-1]]) - 1
+    base_amount = np.r_[0.0, amount][starts][segment]
+    base_volume = np.r_[0.0, total_volume][starts][segment]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (amount - base_amount) / (total_volume - base_volume)
+
+
+def donchian(high, low, periods=(20,)) -> tuple:
+    """
+    多周期唐奇安通道
+    :return: (upper, lower, middle)，各为 (周期数, K线数) 数组
+    """
+    upper = rolling_max(high, periods)
+    lower = rolling_min(low, periods)
+    return upper, lower, (upper + lower) / 2.0
+
+
 def calculate_macd(df, fast=12, slow=26, signal=9):
-    """计算MACD指标"""
-    df['macd'] = df['close'].ewm(span=fast).mean() - df['close'].ewm(span=slow).mean()
-    df['signal'] = df['macd'].ewm(span=signal).mean()
-    df['hist'] = df['macd'] - df['signal']
+    """计算MACD指标（结果来自共享指标缓存，写入 macd/signal/hist 列）"""
+    df['macd'], df['signal'], df['hist'] = indicator_cache.macd(df['close'], fast, slow, signal)
     return df
 
 def calculate_ema(df, periods=[5, 10, 20]):
-    """计算多个周期的EMA均线"""
+    """计算多个周期的EMA均线（结果来自共享指标缓存，写入 ema_N 列）"""
     for period in periods:
-        df[f'ema_{period}'] = df['close'].ewm(span=period, adjust=False).mean()
+        df[f'ema_{period}'] = indicator_cache.ema(df['close'], period, adjust=False)
     return df
 
 def calculate_bollinger_bands(df, period=20, std_multiplier=2):
     """
     计算布林带指标
-    
+
     参数:
     df: DataFrame, 必须包含'close'列
     period: int, 移动平均的周期，默认20
     std_multiplier: float, 标准差的倍数，默认2
-    
+
     返回:
     添加了布林带指标的DataFrame，包含：
     - bb_middle: 中轨（简单移动平均线）
     - bb_upper: 上轨
     - bb_lower: 下轨
+
+    各列结果来自共享指标缓存，只需要数组时可直接调用 utils.indicator_cache.bollinger_bands
     """
-    # 计算中轨（简单移动平均线）
-    df['bb_middle'] = df['close'].rolling(window=period).mean()
-    
-    # 计算标准差
-    rolling_std = df['close'].rolling(window=period).std()
-    
-    # 计算上轨和下轨
-    df['bb_upper'] = df['bb_middle'] + (rolling_std * std_multiplier)
-    df['bb_lower'] = df['bb_middle'] - (rolling_std * std_multiplier)
-    
-    return df
\ No newline at end of file
+    df['bb_middle'], df['bb_upper'], df['bb_lower'] = indicator_cache.bollinger_bands(df['close'], period, std_multiplier)
+    return df
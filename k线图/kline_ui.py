@@ -10,7 +10,7 @@ from PyQt6.QtWidgets import (
     QFrame, QGraphicsView, QGroupBox, QScrollArea, QButtonGroup
 )
 
-from indicators import calculate_macd, calculate_ema, calculate_bollinger_bands
+from indicators import indicator_cache, rsi, kdj
 
 
 class KlineWindow(QMainWindow):
@@ -108,11 +108,14 @@ class KlineWindow(QMainWindow):
         self.cmb_sub1.addItems(['成交量', '无'])
         sub_form.addRow(QLabel('子图1'), self.cmb_sub1)
         self.cmb_sub2 = QComboBox()
-        self.cmb_sub2.addItems(['MACD', '无'])
+        self.cmb_sub2.addItems(['MACD', 'RSI', 'KDJ', '无'])
         sub_form.addRow(QLabel('子图2'), self.cmb_sub2)
         self.edit_macd = QLineEdit('12,26,9')
         self.lbl_macd = QLabel('MACD参数 fast,slow,signal')
         sub_form.addRow(self.lbl_macd, self.edit_macd)
+        self.edit_osc_period = QLineEdit('14')
+        self.lbl_osc_period = QLabel('RSI/KDJ周期')
+        sub_form.addRow(self.lbl_osc_period, self.edit_osc_period)
 
         # 加入控制面板
         control_layout.addWidget(basic_group)
@@ -364,14 +367,20 @@ class KlineWindow(QMainWindow):
                 pass
 
     def _update_sub_params_visibility(self):
-        # 子图1当前无参数；子图2：仅在MACD时显示
+        # 子图1当前无参数；子图2：MACD参数仅在MACD时显示，周期仅在RSI/KDJ时显示
         t2 = self.cmb_sub2.currentText() if hasattr(self, 'cmb_sub2') else '无'
         macd = (t2 == 'MACD')
+        osc = (t2 in ('RSI', 'KDJ'))
         for w in [self.lbl_macd, self.edit_macd]:
             try:
                 w.setVisible(macd)
             except Exception:
                 pass
+        for w in [self.lbl_osc_period, self.edit_osc_period]:
+            try:
+                w.setVisible(osc)
+            except Exception:
+                pass
 
     def _parse_ints(self, text: str):
         try:
@@ -389,12 +398,20 @@ class KlineWindow(QMainWindow):
         if self.df is None:
             return
 
-        df = self.df.copy()
+        # 指标从共享指标缓存中取只读数组，不再复制数据或往 DataFrame 中写列
+        df = self.df
+        close = df['close']
+
+        # 清理并绘制主图
+        fplt.candlestick_ochl(df[['time', 'open', 'close', 'high', 'low']], ax=self.ax0)
 
-        # 计算主图指标
         if self.cmb_main.currentText() == 'EMA':
             periods = self._parse_ints(self.edit_ema.text()) or [5, 10, 20]
-            df = calculate_ema(df, periods=periods)
+            colors = ['#ff0000', '#00ff00', '#0000ff']
+            for i, p in enumerate(periods):
+                col = colors[i % len(colors)]
+                fplt.plot(df['time'], indicator_cache.ema(close, p, adjust=False), ax=self.ax0, legend=f'EMA{p}', color=col)
+
         elif self.cmb_main.currentText() == '布林带':
             try:
                 period = int(self.edit_bb_period.text())
@@ -404,47 +421,39 @@ class KlineWindow(QMainWindow):
                 mult = float(self.edit_bb_mult.text())
             except Exception:
                 mult = 2
-            df = calculate_bollinger_bands(df, period=period, std_multiplier=mult)
-
-        # 计算子图2（MACD）
-        if self.cmb_sub2.currentText() == 'MACD':
+            bb_middle, bb_upper, bb_lower = indicator_cache.bollinger_bands(close, period, mult)
+            fplt.plot(df['time'], bb_middle, ax=self.ax0, legend='BB Mid', color='#2ca02c')
+            fplt.plot(df['time'], bb_upper, ax=self.ax0, legend='BB Upper', color='#ff7f0e')
+            fplt.plot(df['time'], bb_lower, ax=self.ax0, legend='BB Lower', color='#ff7f0e')
             try:
-                fast, slow, signal = self._parse_ints(self.edit_macd.text())
+                fplt.fill_between(df['time'], bb_lower, bb_upper, color='#ff7f0e22')
             except Exception:
-                fast, slow, signal = 12, 26, 9
-            df = calculate_macd(df, fast=fast or 12, slow=slow or 26, signal=signal or 9)
-
-        # 清理并绘制主图
-        fplt.candlestick_ochl(df[['time', 'open', 'close', 'high', 'low']], ax=self.ax0)
-
-        if self.cmb_main.currentText() == 'EMA':
-            periods = self._parse_ints(self.edit_ema.text()) or [5, 10, 20]
-            colors = ['#ff0000', '#00ff00', '#0000ff']
-            for i, p in enumerate(periods):
-                col = colors[i % len(colors)]
-                fplt.plot(df['time'], df[f'ema_{p}'], ax=self.ax0, legend=f'EMA{p}', color=col)
-
-        elif self.cmb_main.currentText() == '布林带':
-            fplt.plot(df['time'], df['bb_middle'], ax=self.ax0, legend='BB Mid', color='#2ca02c')
-            fplt.plot(df['time'], df['bb_upper'], ax=self.ax0, legend='BB Upper', color='#ff7f0e')
-            fplt.plot(df['time'], df['bb_lower'], ax=self.ax0, legend='BB Lower', color='#ff7f0e')
-            try:
-                fplt.fill_between(df['time'], df['bb_lower'], df['bb_upper'], color='#ff7f0e22')
-            except TypeError:
-                try:
-                    fplt.fill_between(df['time'], df['bb_lower'], df['bb_upper'], color='#ff7f0e22')
-                except Exception:
-                    pass
+                pass
 
         # 子图1：成交量或无
         if self.cmb_sub1.currentText() == '成交量':
             fplt.volume_ocv(df[['time', 'open', 'close', 'volume']], ax=self.ax1)
 
-        # 子图2：MACD或无
+        # 子图2：MACD、RSI、KDJ或无
         if self.cmb_sub2.currentText() == 'MACD':
-            fplt.volume_ocv(df[['time', 'open', 'close', 'hist']], ax=self.ax2, colorfunc=fplt.strength_colorfilter)
-            fplt.plot(df['time'], df['macd'], ax=self.ax2, legend='MACD', color='#0000ff')
-            fplt.plot(df['time'], df['signal'], ax=self.ax2, legend='Signal', color='#ff0000')
+            try:
+                fast, slow, signal = self._parse_ints(self.edit_macd.text())
+            except Exception:
+                fast, slow, signal = 12, 26, 9
+            macd, macd_signal, hist = indicator_cache.macd(close, fast or 12, slow or 26, signal or 9)
+            hist_df = pd.DataFrame({'time': df['time'], 'open': df['open'], 'close': df['close'], 'hist': hist})
+            fplt.volume_ocv(hist_df, ax=self.ax2, colorfunc=fplt.strength_colorfilter)
+            fplt.plot(df['time'], macd, ax=self.ax2, legend='MACD', color='#0000ff')
+            fplt.plot(df['time'], macd_signal, ax=self.ax2, legend='Signal', color='#ff0000')
+        elif self.cmb_sub2.currentText() in ('RSI', 'KDJ'):
+            period = (self._parse_ints(self.edit_osc_period.text()) or [14])[0]
+            if self.cmb_sub2.currentText() == 'RSI':
+                fplt.plot(df['time'], rsi(close, period), ax=self.ax2, legend=f'RSI{period}', color='#9467bd')
+            else:
+                k_line, d_line, j_line = kdj(df['high'], df['low'], close, [period])
+                fplt.plot(df['time'], k_line[0], ax=self.ax2, legend='K', color='#0000ff')
+                fplt.plot(df['time'], d_line[0], ax=self.ax2, legend='D', color='#ff7f0e')
+                fplt.plot(df['time'], j_line[0], ax=self.ax2, legend='J', color='#9467bd')
 
         # 刷新显示
         fplt.refresh()
@@ -0,0 +1,222 @@
+"""
+流式技术指标
+每来一根新K线调用一次 update，耗时与历史长度无关，用于实时K线图和增量回测，不必每次对全部历史重新计算。
+结果与 indicators.py 中对应的批量指标逐位相同：
+- SMAStream: sma
+- EMAStream: ema（含 adjust 参数，递推公式与 pandas ewm 内核相同）
+- MACDStream: macd
+- RSIStream: rsi
+- ATRStream: atr
+BollingerStream 的中轨与 sma 逐位相同，标准差与 rolling_std（pandas rolling(n).std()）只差舍入误差。
+数据不足时返回 NaN，与批量版本前几根K线的结果相同。输入中不应包含 NaN。
+"""
+
+import math
+
+NAN = float('nan')
+
+# 布林带标准差重新选取基准价格的间隔（K线数）上下限
+_STD_CHUNK = 4096
+_STD_MIN_CHUNK = 256
+
+
+def _std_chunk(period: int) -> int:
+    """基准价格的更新间隔：间隔内价格的波动范围与窗口内的波动相差不大，平方和相减时才不损失精度"""
+    return int(min(_STD_CHUNK, max(_STD_MIN_CHUNK, 32 * period)))
+
+
+class EMAStream:
+    """流式 EMA，与 ema(close, period, adjust) 逐位相同"""
+
+    __slots__ = ('adjust', '_factor', '_new_weight', '_old_weight', 'value')
+
+    def __init__(self, period: int = None, adjust: bool = False, alpha: float = None):
+        """
+        :param period: 周期，平滑系数为 2 / (period + 1)
+        :param adjust: 与 pandas ewm 的 adjust 参数含义相同
+        :param alpha: 直接指定平滑系数（Wilder 平滑为 1 / 周期），与 period 二选一
+        """
+        # 与 pandas 的 get_center_of_mass 相同：先换算为质心 com，再由 1 / (1 + com) 得到平滑系数，
+        # 换算方式不同时舍入不同，结果会差最后几位
+        if alpha is None:
+            com = (int(period) - 1) / 2.0
+        else:
+            com = (1.0 - alpha) / alpha
+        alpha = 1.0 / (1.0 + com)
+        self.adjust = adjust
+        self._factor = 1.0 - alpha
+        self._new_weight = 1.0 if adjust else alpha
+        self._old_weight = 1.0
+        self.value = NAN
+
+    def update(self, price: float) -> float:
+        """加入一根K线的数据，返回最新的 EMA"""
+        price = float(price)
+        if self.value != self.value:
+            self.value = price
+            return price
+        self._old_weight *= self._factor
+        if self.value != price:
+            self.value = (self._old_weight * self.value + self._new_weight * price) / (self._old_weight + self._new_weight)
+        if self.adjust:
+            self._old_weight += self._new_weight
+        else:
+            self._old_weight = 1.0
+        return self.value
+
+
+class SMAStream:
+    """流式简单移动平均，与 sma(close, [period]) 逐位相同"""
+
+    __slots__ = ('period', '_window', '_position', '_count', '_sum', 'value')
+
+    def __init__(self, period: int):
+        self.period = int(period)
+        self._window = [0.0] * self.period
+        self._position = 0
+        self._count = 0
+        self._sum = 0.0
+        self.value = NAN
+
+    def update(self, price: float) -> float:
+        """加入一根K线的收盘价，返回最新的均值（不足 period 根时为 NaN）"""
+        price = float(price)
+        if self._count < self.period:
+            self._sum += price
+            self._count += 1
+        else:
+            self._sum += price - self._window[self._position]
+        self._window[self._position] = price
+        self._position = (self._position + 1) % self.period
+        self.value = self._sum / self.period if self._count == self.period else NAN
+        return self.value
+
+
+class BollingerStream:
+    """
+    流式布林带，中轨与 sma 逐位相同，标准差与 bollinger_bands(close, period, std_multiplier) 只差舍入误差
+    标准差由窗口内相对基准价格的偏差和、偏差平方和逐根累加得到；基准每隔 _std_chunk(period) 根K线更新一次，
+    更新时对窗口内 period 根K线重新累加一次，均摊到每根K线仍是常数时间
+    """
+
+    __slots__ = ('period', 'std_multiplier', '_sma', '_chunk', '_window', '_position', '_count', '_anchor',
+                 '_total', '_squares', 'middle', 'upper', 'lower', 'std')
+
+    def __init__(self, period: int = 20, std_multiplier: float = 2):
+        self.period = int(period)
+        self.std_multiplier = std_multiplier
+        self._sma = SMAStream(self.period)
+        self._chunk = _std_chunk(self.period)
+        self._window = [0.0] * self.period
+        self._position = 0
+        self._count = 0
+        self._anchor = 0.0
+        self._total = 0.0
+        self._squares = 0.0
+        self.middle = self.upper = self.lower = self.std = NAN
+
+    def _reanchor(self):
+        """以当前窗口的第一个价格为基准，按时间顺序重新累加偏差和与偏差平方和"""
+        ordered = self._window[self._position:] + self._window[:self._position]
+        self._anchor = ordered[0]
+        self._total = self._squares = 0.0
+        for price in ordered:
+            deviation = price - self._anchor
+            self._total += deviation
+            self._squares += deviation * deviation
+
+    def update(self, price: float) -> tuple:
+        """
+        加入一根K线的收盘价
+        :return: (middle, upper, lower)，不足 period 根时为 NaN
+        """
+        price = float(price)
+        self.middle = self._sma.update(price)
+        oldest = self._window[self._position]
+        self._window[self._position] = price
+        self._position = (self._position + 1) % self.period
+        self._count += 1
+
+        p = self.period
+        if self._count < p or p < 2:
+            return self.middle, self.upper, self.lower
+        if (self._count - p) % self._chunk == 0:
+            self._reanchor()
+        else:
+            new, old = price - self._anchor, oldest - self._anchor
+            self._total += new - old
+            self._squares += new * new - old * old
+        self.std = math.sqrt(max((self._squares - self._total * self._total / p) / (p - 1), 0.0))
+        width = self.std * self.std_multiplier
+        self.upper, self.lower = self.middle + width, self.middle - width
+        return self.middle, self.upper, self.lower
+
+
+class MACDStream:
+    """流式 MACD，与 macd(close, fast, slow, signal, adjust) 逐位相同"""
+
+    __slots__ = ('_fast', '_slow', '_signal', 'macd', 'signal', 'hist')
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9, adjust: bool = True):
+        self._fast = EMAStream(fast, adjust)
+        self._slow = EMAStream(slow, adjust)
+        self._signal = EMAStream(signal, adjust)
+        self.macd = self.signal = self.hist = NAN
+
+    def update(self, price: float) -> tuple:
+        """
+        加入一根K线的收盘价
+        :return: (macd, signal, hist)
+        """
+        self.macd = self._fast.update(price) - self._slow.update(price)
+        self.signal = self._signal.update(self.macd)
+        self.hist = self.macd - self.signal
+        return self.macd, self.signal, self.hist
+
+
+class RSIStream:
+    """流式 RSI（Wilder 平滑），与 rsi(close, period) 逐位相同，第一根K线为 NaN"""
+
+    __slots__ = ('_gain', '_loss', '_previous', 'value')
+
+    def __init__(self, period: int = 14):
+        self._gain = EMAStream(alpha=1.0 / int(period))
+        self._loss = EMAStream(alpha=1.0 / int(period))
+        self._previous = NAN
+        self.value = NAN
+
+    def update(self, price: float) -> float:
+        """加入一根K线的收盘价，返回最新的 RSI"""
+        price = float(price)
+        previous, self._previous = self._previous, price
+        if previous != previous:
+            return self.value
+        delta = price - previous
+        gain = self._gain.update(max(delta, 0.0))
+        loss = self._loss.update(max(-delta, 0.0))
+        if loss > 0:
+            self.value = 100.0 - 100.0 / (1.0 + gain / loss)
+        else:
+            self.value = 100.0 if gain > 0 else NAN
+        return self.value
+
+
+class ATRStream:
+    """流式 ATR（Wilder 平滑），与 atr(high, low, close, period) 逐位相同"""
+
+    __slots__ = ('_average', '_previous_close', 'value')
+
+    def __init__(self, period: int = 14):
+        self._average = EMAStream(alpha=1.0 / int(period))
+        self._previous_close = NAN
+        self.value = NAN
+
+    def update(self, high: float, low: float, close: float) -> float:
+        """加入一根K线的最高价、最低价、收盘价，返回最新的 ATR"""
+        high, low = float(high), float(low)
+        true_range = high - low
+        if self._previous_close == self._previous_close:
+            true_range = max(true_range, max(abs(high - self._previous_close), abs(low - self._previous_close)))
+        self._previous_close = float(close)
+        self.value = self._average.update(true_range)
+        return self.value
@@ -0,0 +1,60 @@
+"""批量回测与逐笔交易明细（calculate_trade_details）的一致性"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.batch_backtest import batch_backtest, signals_to_matrix
+from utils.money_management import calculate_bar_returns, calculate_sharpe_ratio, calculate_trade_details
+
+PRINCIPAL = 100000.0
+FEE_RATE = 0.001
+
+
+@pytest.fixture(scope='module')
+def data_df():
+    rng = np.random.default_rng(11)
+    close = 3000 * np.cumprod(1 + rng.normal(0, 0.01, 800))
+    return pd.DataFrame({'交易时间': pd.date_range('2020-01-01', periods=len(close)), '收盘价': close})
+
+
+@pytest.fixture(scope='module')
+def signals(data_df):
+    """浮点信号：1=做多，0=空仓，NaN=沿用上一状态；含全部为 NaN、只有一个信号、最后一根仍持仓的组合"""
+    rng = np.random.default_rng(12)
+    bars = len(data_df)
+    columns = []
+    for density in (0.02, 0.1, 0.5, 1.0):
+        column = np.full(bars, np.nan)
+        marks = rng.random(bars) < density
+        column[marks] = rng.integers(0, 2, marks.sum())
+        columns.append(column)
+    columns.append(np.full(bars, np.nan))
+    only_buy = np.full(bars, np.nan)
+    only_buy[100] = 1.0
+    columns.append(only_buy)
+    always_long = np.ones(bars)
+    columns.append(always_long)
+    return [pd.Series(column, index=data_df.index) for column in columns]
+
+
+@pytest.mark.parametrize('matrix_from', ['float', 'int8'])
+def test_batch_backtest_matches_trade_details(data_df, signals, matrix_from):
+    if matrix_from == 'float':
+        matrix = np.column_stack([s.to_numpy() for s in signals])
+    else:
+        matrix = signals_to_matrix(signals)
+    # 每批 3 个组合，覆盖分批拼接
+    result = batch_backtest(data_df['收盘价'], matrix, PRINCIPAL, FEE_RATE, chunk_size=3)
+    bar_returns = calculate_bar_returns(data_df)
+    for k, series in enumerate(signals):
+        expected = calculate_trade_details(data_df, series, PRINCIPAL, FEE_RATE)
+        assert result['trade_count'][k] == expected['trade_count'], k
+        for key in ('total_return', 'total_return_rate', 'total_fee', 'win_rate', 'profit_loss_ratio'):
+            assert np.isclose(result[key][k], expected[key], rtol=1e-9, atol=1e-6), (k, key)
+        assert np.isclose(result['sharpe'][k], calculate_sharpe_ratio(bar_returns, series), rtol=1e-9), k
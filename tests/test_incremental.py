@@ -0,0 +1,58 @@
+"""增量参数优化与完整批量回测的一致性"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.batch_backtest import batch_backtest
+from utils.incremental import CrossoverSweepState
+from utils.indicator_bank import MovingAverageBank
+
+PAIRS = [(s, l) for s in (1, 2, 3, 5, 10, 20) for l in (5, 20, 50, 75, 120, 200) if s < l]
+METRICS = ('total_return', 'total_fee', 'trade_count', 'win_rate', 'profit_loss_ratio', 'sharpe')
+
+
+@pytest.fixture(scope='module')
+def close():
+    rng = np.random.default_rng(5)
+    close = np.round(3000 * np.cumprod(1 + rng.normal(0, 0.01, 12000)), 2)
+    # 长时间横盘：各条均线收敛到同一价格
+    close[4000:7000] = close[4000]
+    return close
+
+
+@pytest.fixture(scope='module')
+def full(close):
+    signals = MovingAverageBank(close).crossover_signals(PAIRS)
+    return batch_backtest(close, signals, 100000.0, 0.001)
+
+
+@pytest.mark.parametrize('splits', [
+    [12000],
+    [1000, 5000, 6500, 9000, 12000],
+    [3999, 4001, 4500, 7000, 7001, 12000],
+    list(range(300, 12000, 777)) + [12000],
+])
+def test_incremental_updates_match_full_backtest(close, full, splits):
+    state = CrossoverSweepState(PAIRS, 100000.0, 0.001)
+    previous = 0
+    for end in splits:
+        state.update(close[previous:end])
+        previous = end
+    metrics = state.metrics()
+    assert np.array_equal(metrics['trade_count'], full['trade_count'])
+    for name in METRICS:
+        np.testing.assert_allclose(metrics[name], full[name], rtol=1e-9, atol=1e-7, err_msg=name)
+
+
+def test_save_and_load_keep_state(close, full, tmp_path):
+    path = str(tmp_path / 'state.npz')
+    state = CrossoverSweepState(PAIRS, 100000.0, 0.001).update(close[:5000])
+    state.save(path)
+    state = CrossoverSweepState.load(path).update(close[5000:])
+    assert np.array_equal(state.metrics()['trade_count'], full['trade_count'])
+    np.testing.assert_allclose(state.metrics()['total_return'], full['total_return'], rtol=1e-9, atol=1e-7)
@@ -0,0 +1,52 @@
+"""均线库与原始 rolling 均线双均线策略的一致性"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.indicator_bank import MovingAverageBank
+
+PAIRS = [(s, l) for s in (1, 2, 3, 5, 10, 20, 60) for l in (5, 20, 50, 120, 250) if s < l]
+
+
+def reference_signals(close: pd.Series, short_n: int, long_n: int) -> pd.Series:
+    """原始的双均线择时写法：rolling 均线，金叉买入、死叉平仓，信号延续，首个信号之前默认开仓"""
+    ma_short = close.rolling(short_n, min_periods=1).mean()
+    ma_long = close.rolling(long_n, min_periods=1).mean()
+    signals = pd.Series(np.nan, index=close.index)
+    signals[(ma_short > ma_long) & (ma_short.shift(1) <= ma_long.shift(1))] = 1.0
+    signals[(ma_short < ma_long) & (ma_short.shift(1) >= ma_long.shift(1))] = 0.0
+    return signals.ffill().fillna(1)
+
+
+@pytest.fixture(scope='module')
+def close():
+    rng = np.random.default_rng(3)
+    close = np.round(30000 * np.cumprod(1 + rng.normal(0, 0.01, 6000)), 2)
+    # 长时间横盘：各条均线收敛到同一价格，舍入误差不能产生虚假的交叉
+    close[2000:3500] = close[2000]
+    return pd.Series(close)
+
+
+@pytest.mark.parametrize('block', [64, 1000, 4096])
+def test_moving_averages_match_rolling_mean(close, block):
+    windows = sorted({w for pair in PAIRS for w in pair})
+    bank = MovingAverageBank(close, windows, block=block)
+    for window in windows:
+        expected = close.rolling(window, min_periods=1).mean().to_numpy()
+        assert np.allclose(bank.ma(window), expected, rtol=1e-12, atol=0), window
+
+
+@pytest.mark.parametrize('block', [64, 4096])
+def test_crossover_signals_match_rolling_strategy(close, block):
+    bank = MovingAverageBank(close, block=block)
+    matrix = bank.crossover_signals(PAIRS)
+    for k, (short_n, long_n) in enumerate(PAIRS):
+        expected = reference_signals(close, short_n, long_n).to_numpy()
+        assert np.array_equal(matrix[:, k], expected), (short_n, long_n)
+        assert np.array_equal(bank.crossover_series(short_n, long_n).to_numpy(), expected), (short_n, long_n)
@@ -0,0 +1,117 @@
+"""止损/止盈的数组实现与逐K线循环的一致性"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.batch_backtest import signals_to_matrix, signals_to_positions
+from utils.money_management import calculate_trade_details
+from utils.stops import EXIT_REASONS, apply_stops, calculate_trade_details_with_stops
+
+# (止损, 止盈, 跟踪止损)
+SETTINGS = [
+    (None, None, None),
+    (0.02, None, None),
+    (None, 0.03, None),
+    (None, None, 0.02),
+    (0.03, 0.05, None),
+    (0.05, 0.08, 0.02),
+    (0.01, 0.01, 0.01),
+]
+
+
+@pytest.fixture(scope='module')
+def data_df():
+    rng = np.random.default_rng(21)
+    bars = 1500
+    close = 3000 * np.cumprod(1 + rng.normal(0, 0.01, bars))
+    # 开盘价带跳空，覆盖开盘即越过触发价的情况
+    open_ = np.r_[close[0], close[:-1]] * (1 + rng.normal(0, 0.004, bars))
+    high = np.maximum(open_, close) * (1 + rng.random(bars) * 0.01)
+    low = np.minimum(open_, close) * (1 - rng.random(bars) * 0.01)
+    return pd.DataFrame({'交易时间': pd.date_range('2020-01-01', periods=bars), '开盘价': open_,
+                         '最高价': high, '最低价': low, '收盘价': close})
+
+
+@pytest.fixture(scope='module')
+def signals(data_df):
+    rng = np.random.default_rng(22)
+    values = np.full(len(data_df), np.nan)
+    marks = rng.random(len(data_df)) < 0.05
+    values[marks] = rng.integers(0, 2, marks.sum())
+    return pd.Series(values, index=data_df.index)
+
+
+def reference_trades(data_df, signals, stop_loss, take_profit, trailing_stop, fill_policy):
+    """逐K线模拟：按信号开仓，开仓后的每根K线先检查止损/跟踪止损，再检查止盈，最后检查信号平仓"""
+    open_, high, low, close = (data_df[column].to_numpy() for column in ('开盘价', '最高价', '最低价', '收盘价'))
+    positions = signals_to_positions(signals_to_matrix([signals]))[:, 0]
+    trades = []
+    entry = None
+    for i in range(len(close)):
+        if entry is None:
+            if positions[i] == 1 and (i == 0 or positions[i - 1] == 0):
+                entry, entry_price, peak = i, close[i], close[i]
+            continue
+        stop_level = entry_price * (1 - stop_loss) if stop_loss is not None else -np.inf
+        trailing_level = peak * (1 - trailing_stop) if trailing_stop is not None else -np.inf
+        target_level = entry_price * (1 + take_profit) if take_profit is not None else np.inf
+        protective = max(stop_level, trailing_level)
+        exit_price = reason = None
+        if low[i] <= protective:
+            exit_price = close[i] if fill_policy == 'close' else min(open_[i], protective)
+            reason = 'stop_loss' if stop_level >= trailing_level else 'trailing_stop'
+        elif high[i] >= target_level:
+            exit_price = close[i] if fill_policy == 'close' else max(open_[i], target_level)
+            reason = 'take_profit'
+        elif positions[i] == 0:
+            exit_price, reason = close[i], 'signal'
+        if reason is not None:
+            trades.append((entry, i, entry_price, exit_price, reason))
+            entry = None
+        else:
+            # 跟踪止损只使用上一根K线及之前的最高价
+            peak = max(peak, high[i])
+    if entry is not None:
+        trades.append((entry, len(close) - 1, entry_price, close[-1], 'end'))
+    return trades
+
+
+@pytest.mark.parametrize('fill_policy', ['level', 'close'])
+@pytest.mark.parametrize('settings', SETTINGS)
+def test_apply_stops_matches_bar_loop(data_df, signals, settings, fill_policy):
+    expected = reference_trades(data_df, signals, *settings, fill_policy)
+    details = calculate_trade_details_with_stops(data_df, signals, 100000.0, 0.001, *settings, fill_policy)
+    dates = list(data_df['交易时间'])
+    result = [(dates.index(trade['buy_date']), dates.index(trade['sell_date']), trade['buy_price'],
+               trade['sell_price'], trade['exit_reason']) for trade in details['trades']]
+    assert len(result) == len(expected)
+    for got, want in zip(result, expected):
+        assert got[:2] == want[:2] and got[4] == want[4], (got, want)
+        assert np.isclose(got[2], want[2], rtol=1e-12) and np.isclose(got[3], want[3], rtol=1e-12), (got, want)
+
+
+def test_per_column_settings_match_single_runs(data_df, signals):
+    """一个信号矩阵的各列使用不同的止损参数，与逐列单独计算的结果相同"""
+    columns = len(SETTINGS)
+    matrix = np.repeat(signals_to_matrix([signals]), columns, axis=1)
+    per_column = [np.array([np.nan if s[k] is None else s[k] for s in SETTINGS]) for k in range(3)]
+    trades = apply_stops(data_df['开盘价'], data_df['最高价'], data_df['最低价'], data_df['收盘价'], matrix, *per_column)
+    for k, settings in enumerate(SETTINGS):
+        expected = reference_trades(data_df, signals, *settings, 'level')
+        mine = trades['column'] == k
+        assert [EXIT_REASONS[r] for r in trades['reason'][mine]] == [trade[4] for trade in expected], settings
+        assert np.allclose(trades['exit_price'][mine], [trade[3] for trade in expected], rtol=1e-12), settings
+
+
+def test_without_stops_matches_trade_details(data_df, signals):
+    expected = calculate_trade_details(data_df, signals, 100000.0, 0.001)
+    result = calculate_trade_details_with_stops(data_df, signals, 100000.0, 0.001)
+    assert result['trade_count'] == expected['trade_count']
+    for key in ('total_return', 'total_fee', 'win_rate', 'profit_loss_ratio'):
+        assert np.isclose(result[key], expected[key], rtol=1e-9), key
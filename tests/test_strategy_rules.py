@@ -0,0 +1,107 @@
+"""表达式规则：信号与手写的 pandas 写法一致，参数范围、周期和语法的检查"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.strategy_rules import RuleStrategy
+
+EMA_RULE = """
+# EMA 交叉
+param fast = 12 [5:30]
+param slow = 26 [20:60:2]
+require fast < slow
+buy: cross_above(ema(close, fast), ema(close, slow))
+sell: cross_below(ema(close, fast), ema(close, slow))
+"""
+
+
+@pytest.fixture(scope='module')
+def data_df():
+    rng = np.random.default_rng(31)
+    close = 3000 * np.cumprod(1 + rng.normal(0, 0.01, 2000))
+    spread = close * rng.random(len(close)) * 0.01
+    return pd.DataFrame({'最高价': close + spread, '最低价': close - spread, '收盘价': close})
+
+
+def reference_ema_signals(close: pd.Series, fast: int, slow: int) -> np.ndarray:
+    fast_line = close.ewm(span=fast, adjust=False).mean()
+    slow_line = close.ewm(span=slow, adjust=False).mean()
+    buy = (fast_line > slow_line) & (fast_line.shift(1) <= slow_line.shift(1))
+    sell = (fast_line < slow_line) & (fast_line.shift(1) >= slow_line.shift(1))
+    signals = pd.Series(np.nan, index=close.index)
+    signals[buy] = 1.0
+    signals[sell] = 0.0
+    return signals.to_numpy()
+
+
+@pytest.mark.parametrize('args', [(), (12, 26), (4, 26), (12, 100), (1, 2)])
+def test_ema_rule_matches_pandas(data_df, args):
+    """范围只是参数优化的搜索范围，回测时可以取范围外的周期"""
+    rule = RuleStrategy(EMA_RULE)
+    fast, slow = args or (12, 26)
+    expected = reference_ema_signals(data_df['收盘价'], fast, slow)
+    assert np.array_equal(rule(data_df, *args).to_numpy(), expected, equal_nan=True)
+
+
+def test_search_range_is_not_a_bound():
+    params = {param.name: param for param in RuleStrategy(EMA_RULE).STRATEGY_PARAMS.params}
+    assert (params['fast'].search_low, params['fast'].search_high) == (5, 30)
+    assert (params['slow'].search_low, params['slow'].search_high, params['slow'].step) == (20, 60, 2)
+    assert params['fast'].low == 1 and params['fast'].high is None
+
+
+@pytest.mark.parametrize('args', [(0, 26), (-3, 26), (12, 0), (30, 20)])
+def test_invalid_periods_and_constraints_are_rejected(data_df, args):
+    with pytest.raises(ValueError):
+        RuleStrategy(EMA_RULE)(data_df, *args)
+
+
+def test_batch_signals_match_single_runs(data_df):
+    rule = RuleStrategy(EMA_RULE)
+    grid = [(5, 20), (4, 26), (12, 100)]
+    matrix = rule.equity_signal_batch(data_df, grid)
+    for j, combination in enumerate(grid):
+        expected = reference_ema_signals(data_df['收盘价'], *combination)
+        assert np.array_equal(np.where(matrix[:, j] < 0, np.nan, matrix[:, j]), expected, equal_nan=True)
+
+
+@pytest.mark.parametrize('text', [
+    'close in high',
+    'close is high',
+    'close not in high',
+    'close.mean() > 0',
+    'close[1] > 0',
+    'foo > close',
+    'unknown(close, 5) > 0',
+    'sma(close) > 0',
+    'sma(close, n=5) > 0',
+    'sma(close, close) > 0',
+    '(lambda: close)() > 0',
+    'close + 1',
+    'close > 0 and 1',
+    'close >',
+    'param n = 5 [1:2:3:4]\nsma(close, n) > 0',
+    'param n = 2.5 [1:5:0.5]\nsma(close, n) > 0',
+    'param k = 1.5 [1:5]\nclose > k',
+    'param close = 5\nclose > 0',
+    'buy: close > 0\nbuy: close < 0',
+    'close > 0\nbuy: close < 0',
+])
+def test_invalid_rules_are_rejected(text):
+    with pytest.raises(ValueError):
+        RuleStrategy(text)
+
+
+def test_implicit_columns_are_part_of_the_data(data_df):
+    """atr/adx 只写周期，用到的最高价/最低价也要检查并参与指标缓存的键"""
+    rule = RuleStrategy('param n = 14 [5:30]\natr(n) > 0.012 * close')
+    with pytest.raises(ValueError):
+        rule(data_df[['收盘价']])
+    wider = data_df.assign(最高价=data_df['最高价'] * 1.01)
+    assert not np.array_equal(rule(data_df).to_numpy(), rule(wider).to_numpy())
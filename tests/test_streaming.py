@@ -0,0 +1,54 @@
+"""流式指标与批量指标、pandas 的逐位一致性"""
+
+import importlib
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+indicators = importlib.import_module('k线图.indicators')
+streaming = importlib.import_module('k线图.streaming')
+
+PERIODS = (2, 3, 5, 7, 9, 12, 14, 20, 26, 50, 100, 200)
+
+
+@pytest.fixture(scope='module')
+def bars():
+    rng = np.random.default_rng(7)
+    close = 30000 * np.cumprod(1 + rng.normal(0, 0.01, 3000))
+    spread = close * rng.random(len(close)) * 0.01
+    return close + spread, close - spread, close
+
+
+def _run(stream, *columns):
+    return np.array([stream.update(*values) for values in zip(*columns)])
+
+
+@pytest.mark.parametrize('adjust', [False, True])
+def test_ema_stream_matches_pandas_and_batch(bars, adjust):
+    close = bars[2]
+    for period in PERIODS:
+        expected = pd.Series(close).ewm(span=period, adjust=adjust).mean().to_numpy()
+        result = _run(streaming.EMAStream(period, adjust=adjust), close)
+        assert np.array_equal(result, expected), period
+        assert np.array_equal(result, indicators.ema(close, period, adjust=adjust)), period
+
+
+def test_wilder_stream_matches_pandas(bars):
+    close = bars[2]
+    for period in PERIODS:
+        expected = pd.Series(close).ewm(alpha=1.0 / period, adjust=False).mean().to_numpy()
+        assert np.array_equal(_run(streaming.EMAStream(alpha=1.0 / period), close), expected), period
+
+
+def test_rsi_atr_streams_match_batch(bars):
+    high, low, close = bars
+    for period in (6, 14, 30):
+        assert np.array_equal(_run(streaming.RSIStream(period), close), indicators.rsi(close, period),
+                              equal_nan=True), period
+        assert np.array_equal(_run(streaming.ATRStream(period), high, low, close),
+                              indicators.atr(high, low, close, period), equal_nan=True), period
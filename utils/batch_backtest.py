@@ -0,0 +1,271 @@
+"""
+批量回测模块
+对同一价格序列上的多组信号（bars × combos 信号矩阵）一次性完成回测，
+逐笔记账规则与 calculate_trade_details 保持一致
+"""
+
+import inspect
+
+import numpy as np
+import pandas as pd
+
+
+# 信号矩阵取值约定（int8）
+SIGNAL_LONG = 1  # 做多（空仓时买入）
+SIGNAL_FLAT = 0  # 空仓（持仓时卖出）
+SIGNAL_HOLD = -1  # 无信号，沿用上一根K线的状态
+
+# 默认每批处理的组合数，控制中间数组的内存占用
+DEFAULT_CHUNK_SIZE = 512
+
+# 策略模块中可选的批量信号函数名：equity_signal_batch(data_df, param_grid) -> (bars × combos) int8 信号矩阵
+BATCH_SIGNAL_FUNCTION = 'equity_signal_batch'
+
+
+def batch_signal_func(strategy_func):
+    """
+    获取策略模块提供的批量信号函数
+    :param strategy_func: 策略的 equity_signal 函数（或表达式规则等可调用的策略对象）
+    :return: 同一模块（或策略对象自身）的 equity_signal_batch，没有提供时为 None
+    """
+    func = getattr(strategy_func, BATCH_SIGNAL_FUNCTION, None)
+    if func is None:
+        module = inspect.getmodule(strategy_func)
+        func = getattr(module, BATCH_SIGNAL_FUNCTION, None) if module is not None else None
+    return func if callable(func) else None
+
+
+def as_signal_matrix(signal_matrix) -> np.ndarray:
+    """
+    转换为 int8 信号矩阵：整数矩阵直接转换，浮点矩阵按信号Series的约定转换（1=做多，0=空仓，NaN 等其他值为 SIGNAL_HOLD）
+    :param signal_matrix: 信号矩阵
+    :return: int8 信号矩阵（已是 int8 时原样返回）
+    """
+    signal_matrix = np.asarray(signal_matrix)
+    if signal_matrix.dtype == np.int8:
+        return signal_matrix
+    if signal_matrix.dtype.kind in 'biu':
+        return signal_matrix.astype(np.int8)
+    # NaN 直接转换为 int8 的结果不确定，与 signals_to_matrix 相同按值转换
+    matrix = np.full(signal_matrix.shape, SIGNAL_HOLD, dtype=np.int8)
+    matrix[signal_matrix == 1.0] = SIGNAL_LONG
+    matrix[signal_matrix == 0.0] = SIGNAL_FLAT
+    return matrix
+
+
+def check_signal_matrix(signal_matrix, bars: int, combos: int) -> np.ndarray:
+    """
+    检查批量信号函数返回的信号矩阵
+    :param signal_matrix: 信号矩阵
+    :param bars: K线数量
+    :param combos: 参数组合数量
+    :return: int8 信号矩阵（转换规则见 as_signal_matrix）
+    """
+    signal_matrix = np.asarray(signal_matrix)
+    if signal_matrix.shape != (bars, combos):
+        raise ValueError(f"信号矩阵形状 {signal_matrix.shape} 应为 {(bars, combos)}")
+    return as_signal_matrix(signal_matrix)
+
+
+def signals_to_matrix(signal_list: list) -> np.ndarray:
+    """
+    将多个信号Series合并为 int8 信号矩阵
+    :param signal_list: 信号Series（或数组）列表，长度均为 bars
+    :return: 形状为 (bars, combos) 的 int8 信号矩阵，NaN 记为 SIGNAL_HOLD
+    """
+    if not signal_list:
+        return np.empty((0, 0), dtype=np.int8)
+    columns = [np.asarray(s, dtype=np.float64) for s in signal_list]
+    stacked = np.column_stack(columns)
+    matrix = np.full(stacked.shape, SIGNAL_HOLD, dtype=np.int8)
+    matrix[stacked == 1.0] = SIGNAL_LONG
+    matrix[stacked == 0.0] = SIGNAL_FLAT
+    return matrix
+
+
+def signals_to_positions(signal_matrix: np.ndarray) -> np.ndarray:
+    """
+    将信号矩阵展开为持仓状态矩阵（前向填充，初始为空仓）
+    :param signal_matrix: 形状为 (bars, combos) 的 int8 信号矩阵
+    :return: 形状相同的 int8 持仓矩阵（1=持仓，0=空仓）
+    """
+    signal_matrix = np.asarray(signal_matrix)
+    bars = signal_matrix.shape[0]
+    valid = (signal_matrix == SIGNAL_LONG) | (signal_matrix == SIGNAL_FLAT)
+    # 每个位置记录最近一次有效信号的行号，-1 表示此前没有信号
+    last_valid = np.where(valid, np.arange(bars)[:, None], -1)
+    np.maximum.accumulate(last_valid, axis=0, out=last_valid)
+    cols = np.arange(signal_matrix.shape[1])[None, :]
+    positions = signal_matrix[np.maximum(last_valid, 0), cols] == SIGNAL_LONG
+    positions &= last_valid >= 0
+    return positions.astype(np.int8)
+
+
+def trade_bounds(positions: np.ndarray) -> tuple:
+    """
+    根据持仓矩阵计算每个平仓位置及其对应的开仓行号
+    最后一根K线仍持仓时视为在最后一根K线平仓，与 calculate_trade_details 一致
+    :param positions: 形状为 (bars, combos) 的持仓矩阵
+    :return: (exit_mask, entry_index)，exit_mask 为平仓位置布尔矩阵，
+             entry_index 为每个位置最近一次开仓的行号
+    """
+    bars = positions.shape[0]
+    held = positions.astype(bool)
+    prev_held = np.zeros_like(held)
+    prev_held[1:] = held[:-1]
+
+    entries = held & ~prev_held
+    exit_mask = ~held & prev_held
+    if bars > 0:
+        exit_mask[-1] |= held[-1]
+
+    entry_index = np.where(entries, np.arange(bars)[:, None], 0)
+    np.maximum.accumulate(entry_index, axis=0, out=entry_index)
+    return exit_mask, entry_index
+
+
+def _equity_from_trades(positions: np.ndarray, exit_mask: np.ndarray, price_ratio: np.ndarray,
+                        trade_returns: np.ndarray, principal: float, buy_fee: float) -> np.ndarray:
+    """
+    固定本金逐笔记账的逐K线权益：本金 + 已平仓盈亏 + 持仓浮动盈亏（已扣买入手续费）
+    """
+    open_pnl = np.where(positions.astype(bool) & ~exit_mask,
+                        principal * price_ratio - principal - buy_fee, 0.0)
+    return principal + np.cumsum(trade_returns, axis=0) + open_pnl
+
+
+def equity_curve(close, signal_matrix: np.ndarray, principal: float = 100000.0,
+                 fee_rate: float = 0.001) -> np.ndarray:
+    """
+    计算逐K线权益曲线（固定本金逐笔记账，与 batch_backtest 的最大回撤口径一致）
+    :param close: 收盘价数组或Series，长度为 bars
+    :param signal_matrix: int8 信号矩阵，形状为 (bars, combos) 或 (bars,)
+    :param principal: 本金
+    :param fee_rate: 手续费率
+    :return: 形状为 (bars, combos) 的权益数组，最后一根K线已扣除平仓手续费
+    """
+    close = np.asarray(close, dtype=np.float64)
+    signal_matrix = np.asarray(signal_matrix)
+    if signal_matrix.ndim == 1:
+        signal_matrix = signal_matrix[:, None]
+    positions = signals_to_positions(as_signal_matrix(signal_matrix))
+    exit_mask, entry_index = trade_bounds(positions)
+    price_ratio = close[:, None] / close[entry_index]
+    buy_fee = principal * fee_rate
+    trade_returns = np.where(exit_mask, principal * price_ratio - principal - buy_fee
+                             - principal * price_ratio * fee_rate, 0.0)
+    return _equity_from_trades(positions, exit_mask, price_ratio, trade_returns, principal, buy_fee)
+
+
+def _backtest_chunk(close: np.ndarray, bar_returns: np.ndarray, signal_matrix: np.ndarray,
+                    principal: float, fee_rate: float) -> dict:
+    """
+    对一批组合执行向量化回测
+    :param close: 收盘价数组
+    :param bar_returns: 逐K线收益率数组（首根为0）
+    :param signal_matrix: 形状为 (bars, combos) 的信号矩阵
+    :param principal: 本金
+    :param fee_rate: 手续费率
+    :return: 每个组合的指标数组字典
+    """
+    bars, combos = signal_matrix.shape
+    positions = signals_to_positions(signal_matrix)
+    exit_mask, entry_index = trade_bounds(positions)
+
+    # 每笔交易的卖出金额比例（卖出价/买入价），只在平仓位置有效
+    price_ratio = close[:, None] / close[entry_index]
+    buy_fee = principal * fee_rate
+    sell_fee = principal * price_ratio * fee_rate
+    trade_returns = np.where(exit_mask, principal * price_ratio - principal - buy_fee - sell_fee, 0.0)
+
+    trade_count = exit_mask.sum(axis=0)
+    total_return = trade_returns.sum(axis=0)
+    total_fee = np.where(exit_mask, buy_fee + sell_fee, 0.0).sum(axis=0)
+
+    # 胜率和盈亏比（总盈利/总亏损）
+    winning = exit_mask & (trade_returns > 0)
+    total_winning = np.where(winning, trade_returns, 0.0).sum(axis=0)
+    total_losing = np.where(exit_mask & ~winning, np.abs(trade_returns), 0.0).sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        win_rate = np.where(trade_count > 0, winning.sum(axis=0) / np.maximum(trade_count, 1), 0.0)
+        profit_loss_ratio = np.where(total_losing > 0, total_winning / total_losing, np.inf)
+
+    # 夏普比率（年化），与 calculate_returns 的计算方式一致
+    prev_positions = np.zeros((bars, combos), dtype=np.float64)
+    prev_positions[1:] = positions[:-1]
+    strategy_returns = bar_returns[:, None] * prev_positions
+    if bars > 1:
+        std = strategy_returns.std(axis=0, ddof=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sharpe = np.where(std > 0, strategy_returns.mean(axis=0) / std * np.sqrt(252), 0.0)
+    else:
+        sharpe = np.zeros(combos)
+
+    # 最大回撤：按固定本金逐笔记账的逐K线权益曲线
+    equity = _equity_from_trades(positions, exit_mask, price_ratio, trade_returns, principal, buy_fee)
+    peak = np.maximum(np.maximum.accumulate(equity, axis=0), principal)
+    max_drawdown = ((peak - equity) / peak).max(axis=0) if bars > 0 else np.zeros(combos)
+
+    return {
+        'total_return': total_return,
+        'total_return_rate': total_return / principal * 100 if principal > 0 else np.zeros(combos),
+        'total_fee': total_fee,
+        'trade_count': trade_count.astype(np.int64),
+        'win_rate': win_rate,
+        'profit_loss_ratio': profit_loss_ratio,
+        'sharpe': sharpe,
+        'max_drawdown': max_drawdown,
+    }
+
+
+def batch_backtest(close, signal_matrix: np.ndarray, principal: float = 100000.0,
+                   fee_rate: float = 0.001, chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+    """
+    批量回测：一个价格序列 + 一个 (bars × combos) 信号矩阵
+    :param close: 收盘价数组或Series，长度为 bars
+    :param signal_matrix: int8 信号矩阵（1=做多，0=空仓，-1=沿用上一状态），浮点矩阵中的 NaN 视为沿用上一状态
+    :param principal: 本金
+    :param fee_rate: 手续费率
+    :param chunk_size: 每批处理的组合数
+    :return: 字典，各键均为长度 combos 的数组：
+             total_return（盈亏金额）、total_return_rate（%）、total_fee、trade_count、
+             win_rate、profit_loss_ratio、sharpe、max_drawdown（比例）
+    """
+    close = np.asarray(close, dtype=np.float64)
+    signal_matrix = np.asarray(signal_matrix)
+    if signal_matrix.ndim == 1:
+        signal_matrix = signal_matrix[:, None]
+    if signal_matrix.shape[0] != len(close):
+        raise ValueError(f"信号矩阵行数 {signal_matrix.shape[0]} 与价格长度 {len(close)} 不一致")
+    signal_matrix = as_signal_matrix(signal_matrix)
+
+    # 逐K线收益率只需计算一次，所有组合共享
+    bar_returns = np.zeros(len(close))
+    if len(close) > 1:
+        bar_returns[1:] = close[1:] / close[:-1] - 1.0
+
+    combos = signal_matrix.shape[1]
+    chunk_size = max(1, int(chunk_size))
+    parts = [
+        _backtest_chunk(close, bar_returns, signal_matrix[:, start:start + chunk_size], principal, fee_rate)
+        for start in range(0, combos, chunk_size)
+    ]
+    if not parts:
+        return {key: np.empty(0) for key in (
+            'total_return', 'total_return_rate', 'total_fee', 'trade_count',
+            'win_rate', 'profit_loss_ratio', 'sharpe', 'max_drawdown')}
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def batch_backtest_df(data_df: pd.DataFrame, signal_matrix: np.ndarray, principal: float = 100000.0,
+                      fee_rate: float = 0.001, chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+    """
+    以 DataFrame 为输入的批量回测便捷函数
+    :param data_df: 包含 '收盘价' 列的 DataFrame
+    :param signal_matrix: int8 信号矩阵
+    :param principal: 本金
+    :param fee_rate: 手续费率
+    :param chunk_size: 每批处理的组合数
+    :return: 同 batch_backtest
+    """
+    return batch_backtest(data_df['收盘价'].to_numpy(), signal_matrix, principal, fee_rate, chunk_size)
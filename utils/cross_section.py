@@ -0,0 +1,171 @@
+"""
+截面因子回测模块
+每根K线对所有币种按因子值排序，持有排名靠前（做多）/靠后（做空）的分组。
+截面策略的信号函数接收 PricePanel（bars × assets 行情矩阵），返回同形状的目标权重矩阵，
+排序、分组、换手和手续费都按整个矩阵计算，记账与组合回测共用 backtest_weights。
+
+截面策略模块约定：
+- STRATEGY_TYPE = 'cross_sectional'
+- cross_sectional_signal(panel, *args) -> (bars × assets) 目标权重矩阵（正数做多，负数做空，NaN 视为 0）
+"""
+
+import numpy as np
+
+from utils.portfolio import PricePanel, backtest_weights, rolling_volatility
+
+STRATEGY_TYPE_CROSS_SECTIONAL = 'cross_sectional'
+
+
+def rank_panel(values: np.ndarray, pct: bool = False) -> np.ndarray:
+    """
+    逐行（同一根K线）对所有币种排序，NaN 不参与排序
+    :param values: (bars × assets) 因子矩阵
+    :param pct: 为 True 时返回 0~1 的百分位排名（最小为 0，最大为 1）
+    :return: 同形状的 float64 排名矩阵（从 0 开始，数值相同的按列顺序依次排名），NaN 处为 NaN
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    # NaN 排在最后，稳定排序保证并列值的排名确定
+    order = np.argsort(np.where(valid, values, np.inf), axis=1, kind='stable')
+    ranks = np.empty(values.shape, dtype=np.float64)
+    np.put_along_axis(ranks, order, np.broadcast_to(np.arange(values.shape[1], dtype=np.float64), values.shape),
+                      axis=1)
+    if pct:
+        count = valid.sum(axis=1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ranks = np.where(count > 1, ranks / (count - 1), 0.0)
+    return np.where(valid, ranks, np.nan)
+
+
+def quantile_buckets(values: np.ndarray, quantiles: int = 10) -> np.ndarray:
+    """
+    逐行按因子值分为 quantiles 组
+    :param values: (bars × assets) 因子矩阵
+    :param quantiles: 分组数（10 为十分位）
+    :return: 同形状的 int16 分组矩阵，0 为因子最小的一组，quantiles-1 为最大的一组，NaN 处为 -1
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=1, keepdims=True)
+    ranks = rank_panel(values)
+    with np.errstate(invalid='ignore'):
+        buckets = np.floor(np.where(valid, ranks, 0.0) * quantiles / np.maximum(count, 1))
+    return np.where(valid, buckets, -1).astype(np.int16)
+
+
+def quantile_weights(values: np.ndarray, quantiles: int = 10, long_bucket: int = -1, short_bucket=None,
+                     gross: float = 1.0, min_assets: int = None) -> np.ndarray:
+    """
+    按分组生成等权目标权重：做多 long_bucket 组，做空 short_bucket 组
+    :param values: (bars × assets) 因子矩阵
+    :param quantiles: 分组数
+    :param long_bucket: 做多的分组（负数从最大组倒数，-1 为因子最大的一组），None 表示不做多
+    :param short_bucket: 做空的分组（0 为因子最小的一组），None 表示不做空
+    :param gross: 多空总仓位（多空同时开启时各占一半）
+    :param min_assets: 有效币种少于该数量的K线不持仓，默认等于 quantiles
+    :return: (bars × assets) 目标权重矩阵
+    """
+    buckets = quantile_buckets(values, quantiles)
+    min_assets = quantiles if min_assets is None else min_assets
+    enough = ((buckets >= 0).sum(axis=1, keepdims=True) >= min_assets)
+    sides = [(bucket % quantiles, sign) for bucket, sign in ((long_bucket, 1.0), (short_bucket, -1.0))
+             if bucket is not None]
+    weights = np.zeros(buckets.shape, dtype=np.float64)
+    for bucket, sign in sides:
+        members = (buckets == bucket) & enough
+        count = members.sum(axis=1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weights += np.where(members, sign * gross / len(sides) / np.maximum(count, 1), 0.0)
+    return weights
+
+
+def momentum(close: np.ndarray, lookback: int) -> np.ndarray:
+    """
+    动量因子：过去 lookback 根K线的收益率
+    :param close: (bars × assets) 收盘价矩阵
+    :param lookback: 回看K线数
+    :return: 同形状的因子矩阵，历史不足时为 NaN
+    """
+    factor = np.full(close.shape, np.nan)
+    if 0 < lookback < close.shape[0]:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            factor[lookback:] = close[lookback:] / close[:-lookback] - 1.0
+    return factor
+
+
+def volatility(close: np.ndarray, window: int) -> np.ndarray:
+    """
+    波动率因子：过去 window 根K线收益率的标准差
+    """
+    return rolling_volatility(close, window)
+
+
+def average_volume(volume: np.ndarray, window: int) -> np.ndarray:
+    """
+    成交量因子：过去 window 根K线的平均成交量
+    :param volume: (bars × assets) 成交量矩阵
+    :param window: 窗口
+    :return: 同形状的因子矩阵，历史不足时为 NaN
+    """
+    volume = np.asarray(volume, dtype=np.float64)
+    factor = np.full(volume.shape, np.nan)
+    if not 0 < window <= volume.shape[0]:
+        return factor
+    # 与 rolling_volatility 相同，按窗口内的有效K线数判断：上市前的 NaN 不能当作 0 成交量参与平均
+    valid = ~np.isnan(volume)
+    zeros = np.zeros((1, volume.shape[1]))
+    count = np.vstack((zeros, np.cumsum(valid, axis=0)))
+    total = np.vstack((zeros, np.cumsum(np.where(valid, volume, 0.0), axis=0)))
+    n = count[window:] - count[:-window]
+    factor[window - 1:] = np.where(n >= window, (total[window:] - total[:-window]) / window, np.nan)
+    return factor
+
+
+def rebalance_schedule(bars: int, every: int = 1, offset: int = 0) -> np.ndarray:
+    """
+    定期调仓的K线
+    :param bars: K线数量
+    :param every: 每隔多少根K线调仓一次
+    :param offset: 第一次调仓的K线行号
+    :return: 长度 bars 的布尔数组
+    """
+    schedule = np.zeros(bars, dtype=bool)
+    schedule[offset::max(1, int(every))] = True
+    return schedule
+
+
+def cross_sectional_backtest(panel: PricePanel, weights: np.ndarray, principal: float = 100000.0,
+                             fee_rate: float = 0.001, rebalance: int = 1) -> dict:
+    """
+    截面策略回测：每隔 rebalance 根K线按目标权重调仓，手续费按实际换手金额计算
+    :param panel: 对齐后的行情矩阵
+    :param weights: (bars × assets) 目标权重矩阵（正数做多，负数做空）
+    :param principal: 本金
+    :param fee_rate: 手续费率
+    :param rebalance: 调仓间隔（K线数）
+    :return: 同 portfolio_backtest，另含 average_turnover（每次调仓的平均换手率）
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    if weights.shape != panel.shape:
+        raise ValueError(f"权重矩阵形状 {weights.shape} 与行情矩阵形状 {panel.shape} 不一致")
+    result = backtest_weights(panel, weights, rebalance_schedule(panel.shape[0], rebalance), principal, fee_rate)
+    mean_equity = float(np.mean(result['equity'])) if len(result['equity']) else principal
+    result['average_turnover'] = (result['turnover'] / max(result['rebalance_count'], 1) / mean_equity
+                                  if mean_equity > 0 else 0.0)
+    return result
+
+
+def run_cross_sectional_strategy(strategy_module, panel: PricePanel, *args, principal: float = 100000.0,
+                                 fee_rate: float = 0.001, rebalance: int = 1) -> dict:
+    """
+    运行截面策略模块并回测
+    :param strategy_module: 实现了 cross_sectional_signal 的策略模块
+    :param panel: 对齐后的行情矩阵
+    :param args: 策略参数
+    :param principal: 本金
+    :param fee_rate: 手续费率
+    :param rebalance: 调仓间隔（K线数）
+    :return: 同 cross_sectional_backtest
+    """
+    weights = strategy_module.cross_sectional_signal(panel, *args)
+    return cross_sectional_backtest(panel, weights, principal, fee_rate, rebalance)
@@ -0,0 +1,218 @@
+"""
+合约（多空/杠杆）回测模块
+目标仓位为有符号比例：1=满仓做多，-1=满仓做空，0=空仓，0.5=半仓做多，NaN=沿用上一根K线的仓位。
+与现货的固定本金记账不同，这里按复利记账：每次调仓时以当前权益 × 杠杆 × 目标仓位重新确定名义价值，
+调仓期间持有的合约数量不变，价格变动带来的盈亏计入权益，再在下一次调仓时滚入新的名义价值。
+
+每段持仓的权益只取决于段首权益和段内价格比例，段首权益是各次调仓增长系数的累乘，
+因此整条权益曲线和爆仓检查都可以用数组运算一次完成，并按组合分批，与 batch_backtest 同样适合参数扫描。
+
+规则：
+- 信号在K线收盘时按收盘价成交，最后一根K线仍有仓位时按收盘价平仓
+- 手续费 = |调仓前后的名义价值变化| × 手续费率，多空反手按平仓+开仓两部分计费
+- 持仓期间（含调仓当根K线）按不利方向的最高价/最低价检查维持保证金：
+  权益 <= 维持保证金率 × 持仓名义价值 时强制平仓，剩余保证金视为强平损失，之后权益为 0
+- 不计资金费率
+"""
+
+import numpy as np
+import pandas as pd
+
+from utils.batch_backtest import DEFAULT_CHUNK_SIZE
+
+# 默认维持保证金率（币安 U 本位合约最低档约为 0.4%）
+DEFAULT_MAINTENANCE_MARGIN = 0.004
+
+FUTURES_METRIC_KEYS = ('final_equity', 'total_return_rate', 'total_fee', 'trade_count', 'sharpe',
+                       'max_drawdown', 'liquidated', 'liquidation_bar')
+
+
+def targets_to_matrix(signal_list: list) -> np.ndarray:
+    """
+    将多个目标仓位Series合并为 float64 目标仓位矩阵
+    :param signal_list: 目标仓位Series（或数组）列表，长度均为 bars，取值 -1~1，NaN 表示沿用上一仓位
+    :return: 形状为 (bars, combos) 的 float64 矩阵
+    """
+    if not signal_list:
+        return np.empty((0, 0), dtype=np.float64)
+    return np.column_stack([np.asarray(s, dtype=np.float64) for s in signal_list])
+
+
+def targets_to_positions(target_matrix: np.ndarray) -> np.ndarray:
+    """
+    将目标仓位矩阵展开为逐K线仓位（前向填充，初始为空仓，超出 -1~1 的部分截断）
+    :param target_matrix: 形状为 (bars, combos) 的目标仓位矩阵
+    :return: 形状相同的 float64 仓位矩阵
+    """
+    target_matrix = np.asarray(target_matrix, dtype=np.float64)
+    bars = target_matrix.shape[0]
+    valid = ~np.isnan(target_matrix)
+    last_valid = np.where(valid, np.arange(bars)[:, None], -1)
+    np.maximum.accumulate(last_valid, axis=0, out=last_valid)
+    cols = np.arange(target_matrix.shape[1])[None, :]
+    positions = np.where(last_valid >= 0, target_matrix[np.maximum(last_valid, 0), cols], 0.0)
+    return np.clip(positions, -1.0, 1.0)
+
+
+def _per_column(value, combos: int) -> np.ndarray:
+    """将标量或逐组合的参数展开为长度 combos 的数组"""
+    return np.broadcast_to(np.asarray(value, dtype=np.float64), (combos,)).astype(np.float64)
+
+
+def _futures_chunk(close: np.ndarray, high: np.ndarray, low: np.ndarray, target_matrix: np.ndarray,
+                   principal: float, fee_rate: float, leverage: np.ndarray,
+                   maintenance_margin: float) -> tuple:
+    """
+    对一批组合计算逐K线权益和手续费
+    :return: (equity, fees, changes, liquidation_bar)，前三者形状为 (bars, combos)，
+             liquidation_bar 为每个组合的爆仓K线行号（未爆仓为 -1）
+    """
+    bars, combos = target_matrix.shape
+    # 敞口倍数 = 杠杆 × 仓位，最后一根K线强制平仓
+    exposure = targets_to_positions(target_matrix) * leverage[None, :]
+    if bars > 0:
+        exposure[-1] = 0.0
+    prev_exposure = np.zeros_like(exposure)
+    prev_exposure[1:] = exposure[:-1]
+    changes = exposure != prev_exposure
+
+    # 每根K线期间持有的仓位来自最近一次调仓（不含当根），记录其行号
+    change_index = np.where(changes, np.arange(bars)[:, None], 0)
+    np.maximum.accumulate(change_index, axis=0, out=change_index)
+    held_start = np.zeros_like(change_index)
+    held_start[1:] = change_index[:-1]
+
+    # 段内权益 / 段首权益 = 1 + 敞口 × (价格比例 - 1)
+    start_close = close[held_start]
+    ratio = close[:, None] / start_close
+    equity_ratio = 1.0 + prev_exposure * (ratio - 1.0)
+
+    # 调仓后权益 x（相对段首权益）满足 x = m - 费率 × |新敞口 × x - 原持仓价值|，分段线性方程直接求解
+    old_value = prev_exposure * ratio
+    with np.errstate(divide='ignore', invalid='ignore'):
+        increase = (equity_ratio + fee_rate * old_value) / (1.0 + fee_rate * exposure)
+        decrease = (equity_ratio - fee_rate * old_value) / (1.0 - fee_rate * exposure)
+    after_trade = np.where(exposure * increase >= old_value, increase, decrease)
+    growth = np.where(changes, after_trade, 1.0)
+
+    # 段首权益 = 本金 × 之前各次调仓增长系数的累乘
+    segment_equity = principal * np.cumprod(growth, axis=0)
+    held_equity = np.empty_like(segment_equity)
+    if bars > 0:
+        held_equity[0] = principal
+        held_equity[1:] = segment_equity[:-1]
+    equity = np.where(changes, segment_equity, held_equity * equity_ratio)
+    fees = np.where(changes, held_equity * (equity_ratio - after_trade), 0.0)
+
+    # 爆仓检查：多头看最低价、空头看最高价
+    worst = np.where(prev_exposure > 0, low[:, None], high[:, None]) / start_close
+    worst_equity_ratio = 1.0 + prev_exposure * (worst - 1.0)
+    liquidation = (prev_exposure != 0) & (worst_equity_ratio <= maintenance_margin * np.abs(prev_exposure) * worst)
+    liquidated = liquidation.any(axis=0)
+    liquidation_bar = np.where(liquidated, liquidation.argmax(axis=0), -1)
+    after_liquidation = np.arange(bars)[:, None] >= np.where(liquidated, liquidation_bar, bars)[None, :]
+    equity[after_liquidation] = 0.0
+    fees[after_liquidation] = 0.0
+    changes &= ~after_liquidation
+    return equity, fees, changes, liquidation_bar
+
+
+def _prepare_prices(data_df: pd.DataFrame) -> tuple:
+    """取出收盘价及最高价/最低价（缺少时用收盘价代替）"""
+    close = data_df['收盘价'].to_numpy(dtype=np.float64)
+    high = data_df['最高价'].to_numpy(dtype=np.float64) if '最高价' in data_df.columns else close
+    low = data_df['最低价'].to_numpy(dtype=np.float64) if '最低价' in data_df.columns else close
+    return close, high, low
+
+
+def _prepare_targets(target_matrix, bars: int) -> np.ndarray:
+    target_matrix = np.asarray(target_matrix, dtype=np.float64)
+    if target_matrix.ndim == 1:
+        target_matrix = target_matrix[:, None]
+    if target_matrix.shape[0] != bars:
+        raise ValueError(f"目标仓位矩阵行数 {target_matrix.shape[0]} 与价格长度 {bars} 不一致")
+    return target_matrix
+
+
+def futures_equity_curve(data_df: pd.DataFrame, target_matrix: np.ndarray, principal: float = 100000.0,
+                         fee_rate: float = 0.001, leverage=1.0,
+                         maintenance_margin: float = DEFAULT_MAINTENANCE_MARGIN) -> np.ndarray:
+    """
+    计算合约模式的逐K线权益曲线
+    :param data_df: 包含 '收盘价' 列的 DataFrame（有 '最高价'/'最低价' 时用于爆仓检查）
+    :param target_matrix: 目标仓位矩阵，形状为 (bars, combos) 或 (bars,)
+    :param principal: 初始保证金
+    :param fee_rate: 手续费率
+    :param leverage: 杠杆倍数，标量或长度 combos 的数组
+    :param maintenance_margin: 维持保证金率
+    :return: 形状为 (bars, combos) 的权益数组，爆仓后为 0
+    """
+    close, high, low = _prepare_prices(data_df)
+    target_matrix = _prepare_targets(target_matrix, len(close))
+    leverage = _per_column(leverage, target_matrix.shape[1])
+    equity, _, _, _ = _futures_chunk(close, high, low, target_matrix, principal, fee_rate,
+                                     leverage, maintenance_margin)
+    return equity
+
+
+def futures_backtest(data_df: pd.DataFrame, target_matrix: np.ndarray, principal: float = 100000.0,
+                     fee_rate: float = 0.001, leverage=1.0,
+                     maintenance_margin: float = DEFAULT_MAINTENANCE_MARGIN,
+                     chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+    """
+    合约模式批量回测：一个价格序列 + 一个 (bars × combos) 目标仓位矩阵
+    :param data_df: 包含 '收盘价' 列的 DataFrame（有 '最高价'/'最低价' 时用于爆仓检查）
+    :param target_matrix: 目标仓位矩阵（-1~1，NaN=沿用上一仓位）
+    :param principal: 初始保证金
+    :param fee_rate: 手续费率
+    :param leverage: 杠杆倍数，标量或长度 combos 的数组（可用于杠杆扫描）
+    :param maintenance_margin: 维持保证金率
+    :param chunk_size: 每批处理的组合数
+    :return: 字典，各键均为长度 combos 的数组：
+             final_equity、total_return_rate（%）、total_fee、trade_count（调仓次数）、
+             sharpe、max_drawdown（比例）、liquidated（是否爆仓）、liquidation_bar（爆仓K线行号，未爆仓为 -1）
+    """
+    close, high, low = _prepare_prices(data_df)
+    bars = len(close)
+    target_matrix = _prepare_targets(target_matrix, bars)
+    combos = target_matrix.shape[1]
+    leverage = _per_column(leverage, combos)
+    chunk_size = max(1, int(chunk_size))
+
+    parts = []
+    for start in range(0, combos, chunk_size):
+        columns = slice(start, start + chunk_size)
+        equity, fees, changes, liquidation_bar = _futures_chunk(
+            close, high, low, target_matrix[:, columns], principal, fee_rate,
+            leverage[columns], maintenance_margin)
+
+        # 夏普比率（年化）：逐K线权益收益率
+        prev_equity = np.empty_like(equity)
+        prev_equity[:1] = principal
+        prev_equity[1:] = equity[:-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            equity_returns = np.where(prev_equity > 0, equity / prev_equity - 1.0, 0.0)
+        if bars > 1:
+            std = equity_returns.std(axis=0, ddof=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                sharpe = np.where(std > 0, equity_returns.mean(axis=0) / std * np.sqrt(252), 0.0)
+        else:
+            sharpe = np.zeros(equity.shape[1])
+
+        final_equity = equity[-1] if bars > 0 else np.full(equity.shape[1], principal)
+        peak = np.maximum(np.maximum.accumulate(equity, axis=0), principal)
+        max_drawdown = ((peak - equity) / peak).max(axis=0) if bars > 0 else np.zeros(equity.shape[1])
+        parts.append({
+            'final_equity': final_equity,
+            'total_return_rate': (final_equity / principal - 1.0) * 100 if principal > 0 else np.zeros(equity.shape[1]),
+            'total_fee': fees.sum(axis=0),
+            'trade_count': changes.sum(axis=0).astype(np.int64),
+            'sharpe': sharpe,
+            'max_drawdown': max_drawdown,
+            'liquidated': liquidation_bar >= 0,
+            'liquidation_bar': liquidation_bar.astype(np.int64),
+        })
+
+    if not parts:
+        return {key: np.empty(0) for key in FUTURES_METRIC_KEYS}
+    return {key: np.concatenate([part[key] for part in parts]) for key in FUTURES_METRIC_KEYS}
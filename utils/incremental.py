@@ -0,0 +1,254 @@
+"""
+增量参数优化模块
+保存双均线参数网格中每个组合在数据末尾的状态（持仓、开仓价、上一根K线的均线差、
+已平仓交易的累计指标、夏普比率的累计量）以及计算均线所需的最近收盘价，
+数据追加新K线后只需处理新增部分，耗时与新增K线数量成正比
+"""
+
+import os
+
+import numpy as np
+
+from utils.batch_backtest import SIGNAL_LONG, signals_to_positions
+from utils.indicator_bank import MovingAverageBank, crossover_difference, crossover_raw_signals
+
+# 每次处理的 (K线数 × 组合数) 元素上限，控制中间数组的内存占用
+BLOCK_ELEMENTS = 4_000_000
+
+# 保存在状态文件中的逐组合数组
+_STATE_ARRAYS = ('position', 'entry_price', 'last_diff', 'closed_return', 'total_fee', 'trade_count',
+                 'winning_count', 'total_winning', 'total_losing', 'sample_count', 'sample_mean', 'sample_m2')
+
+
+class CrossoverSweepState:
+    """
+    双均线参数网格的增量回测状态，所有组合按列向量化处理
+    交易规则与 MA双均线择时.equity_signal + calculate_trade_details 一致
+    """
+
+    def __init__(self, pairs, principal: float, fee_rate: float):
+        """
+        :param pairs: [(短期周期, 长期周期), ...]
+        :param principal: 本金
+        :param fee_rate: 手续费率
+        """
+        self.pairs = np.asarray([(int(s), int(l)) for s, l in pairs], dtype=np.int64).reshape(-1, 2)
+        self.principal = float(principal)
+        self.fee_rate = float(fee_rate)
+        self.max_window = int(self.pairs.max()) if len(self.pairs) else 1
+        self.bars = 0  # 已处理的K线数量
+        self.last_time = ''  # 已处理的最后一根K线时间，用于校验追加的数据
+        self.tail = np.empty(0, dtype=np.float64)  # 最近 max_window 根收盘价
+
+        n = len(self.pairs)
+        self.position = np.zeros(n, dtype=np.int8)
+        self.entry_price = np.full(n, np.nan)
+        self.last_diff = np.full(n, np.nan)  # NaN 表示还没有处理过K线
+        self.closed_return = np.zeros(n)
+        self.total_fee = np.zeros(n)
+        self.trade_count = np.zeros(n, dtype=np.int64)
+        self.winning_count = np.zeros(n, dtype=np.int64)
+        self.total_winning = np.zeros(n)
+        self.total_losing = np.zeros(n)
+        # 逐K线策略收益率的样本数、均值和离差平方和（Welford 累计），用于夏普比率
+        self.sample_count = 0
+        self.sample_mean = np.zeros(n)
+        self.sample_m2 = np.zeros(n)
+
+    def update(self, close, last_time: str = ''):
+        """
+        处理新增的K线
+        :param close: 新增K线的收盘价数组
+        :param last_time: 新增部分最后一根K线的时间
+        :return: self
+        """
+        close = np.asarray(close, dtype=np.float64)
+        if len(close) == 0:
+            return self
+        n = len(self.pairs)
+        block = max(1, BLOCK_ELEMENTS // max(n, 1))
+        for start in range(0, len(close), block):
+            self._update_block(close[start:start + block])
+        if last_time:
+            self.last_time = str(last_time)
+        return self
+
+    def _update_block(self, close: np.ndarray):
+        bars = len(close)
+        history = len(self.tail)
+        extended = np.concatenate((self.tail, close))
+        # 历史不足 max_window 时 tail 就是全部历史，扩展均值与完整计算一致；
+        # 否则新增K线处的窗口都完整落在 tail + 新数据之内
+        bank = MovingAverageBank(extended, np.unique(self.pairs))
+        # 与 MovingAverageBank.crossover_signals 使用同一交叉规则（含舍入误差容差）
+        diff = crossover_difference(np.column_stack([bank.ma(s)[history:] for s, _ in self.pairs]),
+                                    np.column_stack([bank.ma(l)[history:] for _, l in self.pairs]))  # (bars, combos)
+
+        prev_diff = np.empty_like(diff)
+        prev_diff[0] = self.last_diff
+        prev_diff[1:] = diff[:-1]
+
+        # 金叉买入、死叉平仓，首根K线默认开仓
+        raw = np.empty((bars + 1, diff.shape[1]), dtype=np.int8)
+        raw[0] = self.position
+        raw[1:] = crossover_raw_signals(diff, prev_diff)
+        if self.bars == 0:
+            raw[1] = SIGNAL_LONG
+        positions = signals_to_positions(raw)
+        held = positions[1:].astype(bool)
+        prev_held = positions[:-1].astype(bool)
+        entries = held & ~prev_held
+        exits = ~held & prev_held
+
+        # 每根K线对应的开仓价：本块内开仓取开仓K线收盘价，否则沿用状态中的开仓价
+        entry_index = np.where(entries, np.arange(bars)[:, None], -1)
+        np.maximum.accumulate(entry_index, axis=0, out=entry_index)
+        entry_price = np.where(entry_index >= 0, close[np.maximum(entry_index, 0)], self.entry_price[None, :])
+        # 平仓K线上 entry_index 仍指向被平掉的那笔开仓
+        ratio = close[:, None] / entry_price
+        buy_fee = self.principal * self.fee_rate
+        sell_fee = self.principal * ratio * self.fee_rate
+        trade_returns = np.where(exits, self.principal * ratio - self.principal - buy_fee - sell_fee, 0.0)
+        winning = exits & (trade_returns > 0)
+
+        self.closed_return += trade_returns.sum(axis=0)
+        self.total_fee += entries.sum(axis=0) * buy_fee + np.where(exits, sell_fee, 0.0).sum(axis=0)
+        self.trade_count += exits.sum(axis=0)
+        self.winning_count += winning.sum(axis=0)
+        self.total_winning += np.where(winning, trade_returns, 0.0).sum(axis=0)
+        self.total_losing += np.where(exits & ~winning, np.abs(trade_returns), 0.0).sum(axis=0)
+
+        # 策略逐K线收益率（持仓滞后一根K线），首根K线收益率为0
+        previous_close = np.concatenate((self.tail[-1:], close[:-1])) if history else np.concatenate(([close[0]], close[:-1]))
+        bar_returns = close / previous_close - 1.0
+        samples = bar_returns[:, None] * prev_held
+        block_mean = samples.mean(axis=0)
+        block_m2 = ((samples - block_mean) ** 2).sum(axis=0)
+        total = self.sample_count + bars
+        delta = block_mean - self.sample_mean
+        self.sample_m2 = self.sample_m2 + block_m2 + delta ** 2 * self.sample_count * bars / total
+        self.sample_mean = self.sample_mean + delta * bars / total
+        self.sample_count = total
+
+        self.position = positions[-1].copy()
+        self.entry_price = np.where(held[-1], entry_price[-1], np.nan)
+        self.last_diff = diff[-1].copy()
+        self.tail = extended[-self.max_window:].copy()
+        self.bars += bars
+
+    def metrics(self) -> dict:
+        """
+        当前数据末尾的回测指标（仍持仓的组合按最后一根K线收盘价平仓计算）
+        :return: 指标数组字典，键与 batch_backtest 一致
+        """
+        n = len(self.pairs)
+        open_mask = self.position.astype(bool)
+        last_price = self.tail[-1] if len(self.tail) else np.nan
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.where(open_mask, last_price / self.entry_price, 1.0)
+        buy_fee = self.principal * self.fee_rate
+        sell_fee = np.where(open_mask, self.principal * ratio * self.fee_rate, 0.0)
+        open_return = np.where(open_mask, self.principal * ratio - self.principal - buy_fee - sell_fee, 0.0)
+        open_winning = open_mask & (open_return > 0)
+
+        total_return = self.closed_return + open_return
+        trade_count = self.trade_count + open_mask
+        total_winning = self.total_winning + np.where(open_winning, open_return, 0.0)
+        total_losing = self.total_losing + np.where(open_mask & ~open_winning, np.abs(open_return), 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            win_rate = np.where(trade_count > 0, (self.winning_count + open_winning) / np.maximum(trade_count, 1), 0.0)
+            profit_loss_ratio = np.where(total_losing > 0, total_winning / total_losing, np.inf)
+            if self.sample_count > 1:
+                std = np.sqrt(self.sample_m2 / (self.sample_count - 1))
+                sharpe = np.where(std > 0, self.sample_mean / std * np.sqrt(252), 0.0)
+            else:
+                sharpe = np.zeros(n)
+
+        return {
+            'total_return': total_return,
+            'total_return_rate': total_return / self.principal * 100 if self.principal > 0 else np.zeros(n),
+            'total_fee': self.total_fee + sell_fee,
+            'trade_count': trade_count.astype(np.int64),
+            'win_rate': win_rate,
+            'profit_loss_ratio': profit_loss_ratio,
+            'sharpe': sharpe,
+        }
+
+    def save(self, path: str):
+        """
+        保存状态到 .npz 文件
+        :param path: 文件路径
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        arrays = {name: getattr(self, name) for name in _STATE_ARRAYS}
+        # 先写临时文件再替换，避免中断时留下损坏的状态文件
+        temp_path = path + '.tmp.npz'
+        np.savez(temp_path, pairs=self.pairs, tail=self.tail,
+                 meta=np.array([self.principal, self.fee_rate, self.bars]),
+                 last_time=np.array(self.last_time), **arrays)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        从 .npz 文件加载状态
+        :param path: 文件路径
+        :return: CrossoverSweepState 对象
+        """
+        with np.load(path, allow_pickle=False) as data:
+            principal, fee_rate, bars = data['meta']
+            state = cls(data['pairs'], principal, fee_rate)
+            state.bars = int(bars)
+            state.last_time = str(data['last_time'])
+            state.tail = data['tail'].copy()
+            for name in _STATE_ARRAYS:
+                value = data[name]
+                setattr(state, name, value.copy() if value.ndim else value.item())
+        return state
+
+    def matches(self, data_df, pairs, principal: float, fee_rate: float) -> bool:
+        """
+        判断 data_df 是否为已处理数据的追加版本（参数网格、本金和手续费也须一致）
+        :param data_df: 新的行情数据
+        :return: 是否可以增量更新
+        """
+        pairs = np.asarray([(int(s), int(l)) for s, l in pairs], dtype=np.int64).reshape(-1, 2)
+        if not np.array_equal(pairs, self.pairs) or principal != self.principal or fee_rate != self.fee_rate:
+            return False
+        if len(data_df) < self.bars or self.bars == 0:
+            return False
+        close = data_df['收盘价'].to_numpy(dtype=np.float64)
+        if not np.array_equal(close[self.bars - len(self.tail):self.bars], self.tail):
+            return False
+        return str(data_df['交易时间'].iloc[self.bars - 1]) == self.last_time
+
+
+def refresh_crossover_sweep(data_df, pairs, principal: float, fee_rate: float, state_path: str = None) -> tuple:
+    """
+    计算双均线参数网格在 data_df 上的回测指标，已有状态文件且数据为追加时只处理新增K线
+    :param data_df: 行情数据，必须包含 '收盘价' 和 '交易时间' 列
+    :param pairs: [(短期周期, 长期周期), ...]
+    :param principal: 本金
+    :param fee_rate: 手续费率
+    :param state_path: 状态文件路径（.npz），为 None 时不保存
+    :return: (状态对象, 本次处理的K线数量)
+    """
+    state = None
+    if state_path and os.path.exists(state_path):
+        try:
+            state = CrossoverSweepState.load(state_path)
+        except (OSError, KeyError, ValueError):
+            state = None
+        if state is not None and not state.matches(data_df, pairs, principal, fee_rate):
+            state = None
+    if state is None:
+        state = CrossoverSweepState(pairs, principal, fee_rate)
+
+    start = state.bars
+    new_close = data_df['收盘价'].to_numpy(dtype=np.float64)[start:]
+    last_time = str(data_df['交易时间'].iloc[-1]) if len(data_df) else ''
+    state.update(new_close, last_time)
+    if state_path and len(new_close):
+        state.save(state_path)
+    return state, len(new_close)
@@ -0,0 +1,198 @@
+"""
+指标库预计算模块
+参数扫描时每个均线周期只计算一次，所有参数组合共享同一份 (windows × bars) 均线矩阵
+"""
+
+import inspect
+
+import numpy as np
+import pandas as pd
+
+from utils.batch_backtest import SIGNAL_FLAT, SIGNAL_HOLD, SIGNAL_LONG, signals_to_positions
+
+
+# 判断均线交叉时视为相等的相对误差：|短期均线 - 长期均线| <= CROSS_TOLERANCE × |长期均线|
+# 分块前缀和的舍入误差约为 块长 × eps × 价格，与K线总数无关，追加K线后容差不变
+CROSS_TOLERANCE = 1e-10
+
+# 分块前缀和的默认块长（不小于最长的均线周期）
+DEFAULT_BLOCK = 4096
+
+
+def crossover_difference(short_ma: np.ndarray, long_ma: np.ndarray) -> np.ndarray:
+    """
+    短期均线减长期均线，舍入误差范围内的差值记为 0
+    均线由前缀和相减得到，横盘时两条本应相等的均线可能相差最后几位，正负跳动会产生虚假的交叉
+    :param short_ma: 短期均线（数组形状任意）
+    :param long_ma: 长期均线（形状与 short_ma 相同）
+    :return: 差值数组
+    """
+    diff = short_ma - long_ma
+    diff[np.abs(diff) <= CROSS_TOLERANCE * np.abs(long_ma)] = 0.0
+    return diff
+
+
+def crossover_raw_signals(diff: np.ndarray, prev_diff: np.ndarray) -> np.ndarray:
+    """
+    由均线差得到原始交叉信号：金叉（差值由 <=0 变为 >0）买入，死叉（由 >=0 变为 <0）平仓，其余为无信号
+    :param diff: crossover_difference 的结果
+    :param prev_diff: 上一根K线的均线差（形状与 diff 相同，NaN 表示没有上一根K线）
+    :return: int8 原始信号矩阵（SIGNAL_LONG / SIGNAL_FLAT / SIGNAL_HOLD）
+    """
+    raw = np.full(diff.shape, SIGNAL_HOLD, dtype=np.int8)
+    raw[(diff > 0) & (prev_diff <= 0)] = SIGNAL_LONG
+    raw[(diff < 0) & (prev_diff >= 0)] = SIGNAL_FLAT
+    return raw
+
+
+class MovingAverageBank:
+    """
+    简单移动平均线库
+    由分块前缀和得到任意周期的均线，结果与 rolling(n, min_periods=1).mean() 一致
+    （前 n-1 根K线为扩展均值）
+
+    收盘价按块（块长不小于最长周期）减去块首价格后在块内累加，任一窗口至多跨两块，
+    窗口和只用块内前缀和与块合计相减，舍入误差与K线总数无关
+    """
+
+    def __init__(self, close, windows=(), block: int = DEFAULT_BLOCK):
+        """
+        :param close: 收盘价数组或Series
+        :param windows: 需要预先计算的均线周期
+        :param block: 分块前缀和的块长
+        """
+        self._close = np.array(close, dtype=np.float64)
+        self.bars = len(self._close)
+        self.windows = []
+        self._rows = {}
+        self.values = np.empty((0, self.bars), dtype=np.float64)
+        self._build_prefix(max([int(block)] + [int(w) for w in windows]))
+        self.ensure(windows)
+
+    def _build_prefix(self, block: int):
+        """
+        计算分块前缀和，按前缀位置 i（0..bars，第 i 根K线之前）展开为一维数组：
+        _local[i] 为所在块内位置 i 之前的价格（减去块首价格）之和，_total[i] 为所在块的合计，
+        _base[i] 为所在块的块首价格，_offset[i] 为 i 在块内的位置
+        """
+        self._block = block
+        blocks = self.bars // block + 1  # 多留一块，前缀位置 bars 总有对应的块
+        padded = np.zeros(blocks * block)
+        padded[:self.bars] = self._close
+        rows = padded.reshape(blocks, block)
+        base = rows[:, 0].copy()
+        prefix = np.zeros((blocks, block + 1))
+        np.cumsum(rows - base[:, None], axis=1, out=prefix[:, 1:])
+        position = np.arange(self.bars + 1)
+        block_id = position // block
+        self._local = prefix[:, :block].ravel()[:self.bars + 1].copy()
+        self._total = prefix[block_id, block]
+        self._base = base[block_id]
+        self._offset = position - block_id * block
+
+    def _window_mean(self, window: int) -> np.ndarray:
+        """按分块前缀和计算一个周期的均线"""
+        bars = self.bars
+        # 前 head 根K线的窗口从第 0 根开始（扩展均值），之后窗口起点为 终点 - window，用切片代替逐元素索引
+        head = min(window - 1, bars)
+        total = self._local[1:] - self._local[0]
+        total[head:] = self._local[1 + head:] - self._local[:bars - head]
+        total[:head] += np.arange(1, head + 1) * self._base[0]
+        total[head:] += window * self._base[:bars - head]
+        # 窗口跨块（终点在下一块）时：加上起点所在块的剩余部分，终点所在块的价格按各自的块首价格补回；
+        # 块长不小于周期，前 head 根K线都在第一块内
+        cross = np.flatnonzero(self._offset[1 + head:] < window) + head
+        if len(cross):
+            start = cross + 1 - window
+            total[cross] += self._total[start] + self._offset[cross + 1] * (self._base[cross + 1] - self._base[start])
+        total[:head] /= np.arange(1, head + 1)
+        total[head:] /= window
+        return total
+
+    def ensure(self, windows):
+        """
+        补算尚未计算的均线周期
+        :param windows: 均线周期列表
+        :return: self
+        """
+        missing = sorted({int(w) for w in windows} - set(self._rows))
+        if not missing:
+            return self
+        for w in missing:
+            if w < 1:
+                raise ValueError(f"均线周期必须为正整数: {w}")
+        if missing[-1] > self._block:
+            self._build_prefix(missing[-1])
+
+        new_values = np.empty((len(missing), self.bars), dtype=np.float64)
+        for k, w in enumerate(missing):
+            new_values[k] = self._window_mean(w)
+
+        base = len(self.windows)
+        self.values = np.vstack([self.values, new_values]) if base else new_values
+        self.values.flags.writeable = False
+        for k, w in enumerate(missing):
+            self._rows[w] = base + k
+        self.windows.extend(missing)
+        return self
+
+    @property
+    def nbytes(self) -> int:
+        """均线矩阵、收盘价和分块前缀和占用的内存（字节）"""
+        return self.values.nbytes + self._close.nbytes + sum(
+            array.nbytes for array in (self._local, self._total, self._base, self._offset))
+
+    def ma(self, window: int) -> np.ndarray:
+        """
+        获取指定周期的均线（只读视图）
+        :param window: 均线周期
+        :return: 长度为 bars 的均线数组
+        """
+        window = int(window)
+        if window not in self._rows:
+            self.ensure([window])
+        return self.values[self._rows[window]]
+
+    def crossover_signals(self, pairs) -> np.ndarray:
+        """
+        计算双均线交叉信号矩阵，规则与 MA双均线择时.equity_signal 相同：
+        金叉买入、死叉平仓、信号前向延续，首个信号之前默认开仓
+        :param pairs: [(短期周期, 长期周期), ...]
+        :return: 形状为 (bars, len(pairs)) 的 int8 信号矩阵（1=做多，0=空仓）
+        """
+        pairs = [(int(s), int(l)) for s, l in pairs]
+        self.ensure([w for pair in pairs for w in pair])
+        if not pairs or self.bars == 0:
+            return np.empty((self.bars, len(pairs)), dtype=np.int8)
+
+        short_rows = [self._rows[s] for s, _ in pairs]
+        long_rows = [self._rows[l] for _, l in pairs]
+        diff = crossover_difference(self.values[short_rows].T, self.values[long_rows].T)
+
+        raw = np.full(diff.shape, SIGNAL_HOLD, dtype=np.int8)
+        raw[1:] = crossover_raw_signals(diff[1:], diff[:-1])
+        raw[0] = SIGNAL_LONG  # 默认开仓
+        return signals_to_positions(raw)
+
+    def crossover_series(self, short_n: int, long_n: int, index=None) -> pd.Series:
+        """
+        计算单个均线组合的交叉信号Series
+        :param short_n: 短期均线周期
+        :param long_n: 长期均线周期
+        :param index: 信号Series的索引
+        :return: 信号Series（1.0=做多，0.0=空仓）
+        """
+        column = self.crossover_signals([(short_n, long_n)])[:, 0]
+        return pd.Series(column.astype(np.float64), index=index)
+
+
+def accepts_ma_bank(strategy_func) -> bool:
+    """
+    判断策略函数是否支持通过 ma_bank 关键字参数复用均线库
+    :param strategy_func: 策略函数
+    :return: 是否支持
+    """
+    try:
+        return 'ma_bank' in inspect.signature(strategy_func).parameters
+    except (TypeError, ValueError):
+        return False
@@ -0,0 +1,258 @@
+"""
+指标缓存模块
+策略回测、参数优化和K线图共用同一个进程内指标缓存：
+按 (数据指纹, 指标名, 参数) 记忆计算结果，超过内存预算时淘汰最久未使用的结果，
+返回的数组都是只读的，调用方不能（也不需要）修改，也不会再往调用方的 DataFrame 中写列。
+
+数据指纹是价格数组内容的哈希。对同一块内存上的数组（如反复取 df['收盘价'].to_numpy()），
+先用抽样校验确认内容未变再复用已算好的指纹，避免每次调用都对整列数据求哈希；
+如果原地修改了已加载的行情数据，需要调用 clear() 清空缓存。
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from utils.indicator_bank import MovingAverageBank
+
+# 默认内存预算（字节）
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+
+# 抽样校验的元素个数
+_SAMPLE_SIZE = 4096
+
+# 指纹记忆的最大条数
+_FINGERPRINT_MEMO_SIZE = 64
+
+
+def _as_array(values) -> np.ndarray:
+    if isinstance(values, (pd.Series, pd.Index)):
+        values = values.to_numpy()
+    return np.asarray(values)
+
+
+def _sample_digest(values: np.ndarray) -> bytes:
+    """对等间隔抽取的元素及首尾各一段求哈希，用于确认同一内存上的数据未变"""
+    if values.size <= _SAMPLE_SIZE * 2:
+        sample = values
+    else:
+        step = values.size // _SAMPLE_SIZE
+        sample = np.concatenate((values[:256], values[::step], values[-256:]))
+    return hashlib.sha1(np.ascontiguousarray(sample).view(np.uint8)).digest()
+
+
+def _nbytes(value) -> int:
+    """估算缓存值占用的内存"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(v) for v in value)
+    return int(getattr(value, 'nbytes', 0))
+
+
+def _freeze(value):
+    """将结果中的数组设为只读"""
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, tuple):
+        for v in value:
+            _freeze(v)
+    return value
+
+
+class IndicatorCache:
+    """按 (数据指纹, 指标名, 参数) 记忆指标结果的 LRU 缓存，线程安全"""
+
+    def __init__(self, max_bytes: int = DEFAULT_MEMORY_BUDGET):
+        """
+        :param max_bytes: 内存预算（字节），超过时淘汰最久未使用的结果
+        """
+        self.max_bytes = int(max_bytes)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._fingerprints = OrderedDict()
+        self._lock = threading.RLock()
+
+    def fingerprint(self, values) -> str:
+        """
+        计算数组内容的指纹
+        :param values: 数组或Series
+        :return: 十六进制字符串
+        """
+        values = _as_array(values)
+        memo_key = None
+        if values.size and values.dtype != object:
+            memo_key = (values.__array_interface__['data'][0], values.shape, values.strides, values.dtype.str)
+            sample = _sample_digest(values)
+            with self._lock:
+                memo = self._fingerprints.get(memo_key)
+                if memo is not None and memo[0] == sample:
+                    self._fingerprints.move_to_end(memo_key)
+                    return memo[1]
+        digest = hashlib.sha256(f"{values.dtype.str}{values.shape}".encode())
+        digest.update(np.ascontiguousarray(values).view(np.uint8) if values.dtype != object
+                      else pd.util.hash_array(values.ravel()).view(np.uint8))
+        fingerprint = digest.hexdigest()[:32]
+        if memo_key is not None:
+            with self._lock:
+                self._fingerprints[memo_key] = (sample, fingerprint)
+                while len(self._fingerprints) > _FINGERPRINT_MEMO_SIZE:
+                    self._fingerprints.popitem(last=False)
+        return fingerprint
+
+    def get(self, values, name: str, params: tuple, compute):
+        """
+        取出缓存结果，没有时调用 compute() 计算并缓存
+        :param values: 指标的输入数组（用于计算数据指纹）
+        :param name: 指标名
+        :param params: 指标参数（可哈希）
+        :param compute: 无参数的计算函数，返回数组、数组元组或带 nbytes 属性的对象
+        :return: 计算结果（数组为只读）
+        """
+        key = (self.fingerprint(values), name, params)
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                value = self._entries[key]
+                # 结果对象可能会增长（如均线库补算新周期），命中时重新计量
+                self._resize(key, _nbytes(value))
+                return value
+            self.misses += 1
+
+        value = _freeze(compute())
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = value
+                self._sizes[key] = 0
+                self._resize(key, _nbytes(value))
+            return self._entries.get(key, value)
+
+    def _resize(self, key, size: int):
+        """更新一项的内存占用，超出预算时淘汰最久未使用的其他结果"""
+        self.nbytes += size - self._sizes[key]
+        self._sizes[key] = size
+        self._evict(keep=key)
+
+    def _evict(self, keep=None):
+        for old_key in list(self._entries):
+            if self.nbytes <= self.max_bytes:
+                break
+            if old_key == keep:
+                continue
+            del self._entries[old_key]
+            self.nbytes -= self._sizes.pop(old_key)
+
+    def trim(self):
+        """重新计量所有结果（如均线库补算过新周期）并淘汰到预算以内"""
+        with self._lock:
+            for key, value in self._entries.items():
+                size = _nbytes(value)
+                self.nbytes += size - self._sizes[key]
+                self._sizes[key] = size
+            self._evict()
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._fingerprints.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# 进程内共享的指标缓存
+_DEFAULT_CACHE = IndicatorCache()
+
+
+def get_indicator_cache() -> IndicatorCache:
+    """获取进程内共享的指标缓存"""
+    return _DEFAULT_CACHE
+
+
+def _float_values(values) -> np.ndarray:
+    return _as_array(values).astype(np.float64, copy=False)
+
+
+def sma(values, window: int, min_periods: int = None, cache: IndicatorCache = None) -> np.ndarray:
+    """
+    简单移动平均，与 rolling(window, min_periods).mean() 一致
+    :param values: 价格数组或Series
+    :param window: 周期
+    :param min_periods: 最少K线数，默认等于 window
+    :param cache: 指标缓存，默认使用共享缓存
+    :return: 只读数组
+    """
+    cache = _DEFAULT_CACHE if cache is None else cache
+    return cache.get(values, 'sma', (int(window), min_periods), lambda: pd.Series(_float_values(values)).rolling(
+        int(window), min_periods=min_periods).mean().to_numpy())
+
+
+def rolling_std(values, window: int, cache: IndicatorCache = None) -> np.ndarray:
+    """
+    滚动标准差，与 rolling(window).std() 一致
+    :return: 只读数组
+    """
+    cache = _DEFAULT_CACHE if cache is None else cache
+    return cache.get(values, 'rolling_std', (int(window),),
+                     lambda: pd.Series(_float_values(values)).rolling(int(window)).std().to_numpy())
+
+
+def ema(values, span: int, adjust: bool = True, cache: IndicatorCache = None) -> np.ndarray:
+    """
+    指数移动平均，与 ewm(span, adjust).mean() 一致
+    :return: 只读数组
+    """
+    cache = _DEFAULT_CACHE if cache is None else cache
+    return cache.get(values, 'ema', (int(span), bool(adjust)),
+                     lambda: pd.Series(_float_values(values)).ewm(span=int(span), adjust=adjust).mean().to_numpy())
+
+
+def macd(values, fast: int = 12, slow: int = 26, signal: int = 9, cache: IndicatorCache = None) -> tuple:
+    """
+    MACD 指标
+    :return: (macd, signal, hist) 只读数组
+    """
+    cache = _DEFAULT_CACHE if cache is None else cache
+
+    def compute():
+        line = ema(values, fast, cache=cache) - ema(values, slow, cache=cache)
+        signal_line = pd.Series(line).ewm(span=int(signal)).mean().to_numpy()
+        return line, signal_line, line - signal_line
+
+    return cache.get(values, 'macd', (int(fast), int(slow), int(signal)), compute)
+
+
+def bollinger_bands(values, period: int = 20, std_multiplier: float = 2, cache: IndicatorCache = None) -> tuple:
+    """
+    布林带
+    :return: (middle, upper, lower) 只读数组
+    """
+    cache = _DEFAULT_CACHE if cache is None else cache
+
+    def compute():
+        middle = sma(values, period, cache=cache)
+        width = rolling_std(values, period, cache=cache) * std_multiplier
+        return middle, middle + width, middle - width
+
+    return cache.get(values, 'bollinger', (int(period), float(std_multiplier)), compute)
+
+
+def shared_ma_bank(close, cache: IndicatorCache = None) -> MovingAverageBank:
+    """
+    获取同一价格序列共享的均线库（普通回测和参数优化共用，缺少的周期按需补算）
+    :param close: 收盘价数组或Series
+    :param cache: 指标缓存，默认使用共享缓存
+    :return: MovingAverageBank
+    """
+    cache = _DEFAULT_CACHE if cache is None else cache
+    return cache.get(close, 'ma_bank', (), lambda: MovingAverageBank(close))
@@ -3,6 +3,7 @@
 包含本金设置、手续费计算、交易记录等功能
 """
 
+import numpy as np
 import pandas as pd
 
 
@@ -158,10 +159,15 @@ def calculate_trade_details(btc_df: pd.DataFrame, signals: pd.Series, principal:
     buy_date = None
     buy_index = 0  # 记录买入时的索引位置
     
-    for i in range(len(signals)):
-        signal = signals.iloc[i]
-        date = btc_df.iloc[i]['交易时间']
-        price = btc_df.iloc[i]['收盘价']
+    # 先按位置取出整列，避免在循环中逐行 iloc
+    signal_values = signals.tolist()
+    dates = btc_df['交易时间'].tolist()
+    prices = btc_df['收盘价'].tolist()
+    
+    for i in range(len(signal_values)):
+        signal = signal_values[i]
+        date = dates[i]
+        price = prices[i]
         
         # 买入信号且当前空仓
         if signal == 1.0 and position == 0:
@@ -208,8 +214,8 @@ def calculate_trade_details(btc_df: pd.DataFrame, signals: pd.Series, principal:
     
     # 如果最后还有持仓，计算到最后一日的收益
     if position == 1 and len(btc_df) > 0:
-        last_price = btc_df.iloc[-1]['收盘价']
-        last_date = btc_df.iloc[-1]['交易时间']
+        last_price = prices[-1]
+        last_date = dates[-1]
         sell_amount = principal * (last_price / buy_price)
         sell_fee = calculate_fee(sell_amount, fee_rate)
         total_fee += sell_fee
@@ -267,4 +273,108 @@ def calculate_trade_details(btc_df: pd.DataFrame, signals: pd.Series, principal:
         'trade_count': len(trades),
         'win_rate': win_rate,  # 胜率
         'profit_loss_ratio': profit_loss_ratio  # 盈亏比
-    }
\ No newline at end of file
+    }
+
+
+def calculate_bar_returns(btc_df: pd.DataFrame) -> np.ndarray:
+    """
+    计算逐K线收益率（首根K线为0），同一数据集只需计算一次
+    :param btc_df: BTC数据DataFrame
+    :return: 收益率数组
+    """
+    return btc_df['收盘价'].pct_change().fillna(0).to_numpy(dtype=np.float64)
+
+
+def calculate_sharpe_ratio(bar_returns: np.ndarray, signals: pd.Series) -> float:
+    """
+    计算年化夏普比率（持仓信号滞后一根K线）
+    :param bar_returns: 逐K线收益率数组
+    :param signals: 交易信号Series（NaN 表示保持上一状态）
+    :return: 夏普比率
+    """
+    # 与交易明细一致：NaN 延续上一状态，首个信号之前为空仓
+    positions = signals.ffill().shift(1).fillna(0)
+    strategy_returns = bar_returns * positions.to_numpy(dtype=np.float64)
+    if len(strategy_returns) < 2:
+        return 0
+    std = strategy_returns.std(ddof=1)
+    if std > 0:
+        return strategy_returns.mean() / std * np.sqrt(252)
+    return 0
+
+
+def extract_trade_indices(signals: pd.Series) -> tuple:
+    """
+    提取每笔交易的开仓和平仓K线位置（与 calculate_trade_details 的交易一一对应），
+    只依赖信号，与本金和手续费无关，同一组信号只需计算一次
+    :param signals: 交易信号Series
+    :return: (开仓位置数组, 平仓位置数组)
+    """
+    from utils.batch_backtest import signals_to_matrix, signals_to_positions, trade_bounds
+
+    positions = signals_to_positions(signals_to_matrix([signals]))
+    exit_mask, entry_index = trade_bounds(positions)
+    exit_index = np.flatnonzero(exit_mask[:, 0])
+    return entry_index[exit_index, 0], exit_index
+
+
+def calculate_cost_sensitivity(btc_df: pd.DataFrame, signals: pd.Series, principals, fee_rates,
+                               slippages=(0.0,), trade_indices: tuple = None, trade_prices: tuple = None) -> dict:
+    """
+    手续费、滑点和本金的敏感性分析：开平仓位置只计算一次，所有成本组合一次广播计算
+    滑点按比例计入成交价：买入价 × (1 + 滑点)，卖出价 × (1 - 滑点)
+    :param btc_df: BTC数据DataFrame
+    :param signals: 交易信号Series
+    :param principals: 本金列表
+    :param fee_rates: 手续费率列表
+    :param slippages: 滑点比例列表
+    :param trade_indices: extract_trade_indices 的返回值（可选）
+    :param trade_prices: 每笔交易的 (开仓价数组, 平仓价数组)（可选），设置了止损/止盈时传入
+                         stops.extract_trade_prices_with_stops 的返回值，此时不再按信号取收盘价
+    :return: 字典，'principals'/'fee_rates'/'slippages' 为各维取值，
+             其余键为形状 (本金数, 手续费率数, 滑点数) 的数组：
+             total_return、total_return_rate（%）、total_fee、win_rate、profit_loss_ratio，
+             另含 trade_count
+    """
+    principals = np.atleast_1d(np.asarray(principals, dtype=np.float64))
+    fee_rates = np.atleast_1d(np.asarray(fee_rates, dtype=np.float64))
+    slippages = np.atleast_1d(np.asarray(slippages, dtype=np.float64))
+    if trade_prices is None:
+        if trade_indices is None:
+            trade_indices = extract_trade_indices(signals)
+        entry_index, exit_index = trade_indices
+        prices = btc_df['收盘价'].to_numpy(dtype=np.float64)
+        trade_prices = (prices[entry_index], prices[exit_index])
+    entry_price, exit_price = (np.asarray(price, dtype=np.float64) for price in trade_prices)
+
+    # 每笔交易的卖出金额比例：(滑点, 交易)
+    buy_price = entry_price[None, :] * (1 + slippages[:, None])
+    sell_price = exit_price[None, :] * (1 - slippages[:, None])
+    ratio = sell_price / buy_price
+    # 单位本金的每笔盈亏：(手续费率, 滑点, 交易)，金额与本金成正比
+    fee = fee_rates[:, None, None]
+    unit_returns = ratio[None, :, :] * (1 - fee) - 1 - fee
+    unit_fee = (fee * (1 + ratio[None, :, :])).sum(axis=2)
+
+    winning = unit_returns > 0
+    unit_winning = np.where(winning, unit_returns, 0.0).sum(axis=2)
+    unit_losing = np.where(winning, 0.0, np.abs(unit_returns)).sum(axis=2)
+    unit_total = unit_returns.sum(axis=2)
+    trade_count = len(entry_price)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        win_rate = winning.sum(axis=2) / trade_count if trade_count else np.zeros_like(unit_total)
+        profit_loss_ratio = np.where(unit_losing > 0, unit_winning / unit_losing, np.inf)
+
+    scale = principals[:, None, None]
+    total_return = scale * unit_total[None, :, :]
+    return {
+        'principals': principals,
+        'fee_rates': fee_rates,
+        'slippages': slippages,
+        'trade_count': trade_count,
+        'total_return': total_return,
+        'total_return_rate': np.broadcast_to(unit_total * 100, total_return.shape).copy(),
+        'total_fee': scale * unit_fee[None, :, :],
+        'win_rate': np.broadcast_to(win_rate, total_return.shape).copy(),
+        'profit_loss_ratio': np.broadcast_to(profit_loss_ratio, total_return.shape).copy(),
+    }
@@ -0,0 +1,194 @@
+"""
+参数搜索模块
+在离散参数空间上按评估预算搜索，用于参数维度较多、无法穷举的场景：
+- RandomSearch: 随机搜索
+- TPESearch: 基于树结构Parzen估计（TPE）的贝叶斯优化
+两者均可设置随机种子以保证结果可复现
+"""
+
+import numpy as np
+
+# 随机抽样命中率过低时改为枚举剩余组合的参数空间大小上限
+ENUMERATION_LIMIT = 1_000_000
+
+
+class RandomSearch:
+    """在离散参数空间中不重复地随机抽样"""
+
+    def __init__(self, axes: list, constraint=None, seed: int = None):
+        """
+        :param axes: 每个参数的取值列表
+        :param constraint: 约束函数，接收参数元组，返回是否为合法组合
+        :param seed: 随机种子
+        """
+        self.axes = [list(values) for values in axes]
+        self.sizes = np.array([len(values) for values in self.axes], dtype=np.int64)
+        self.constraint = constraint
+        self.rng = np.random.default_rng(seed)
+        self._seen = set()
+        self.observations = []  # [(各维取值下标元组, 目标值), ...]
+
+    @property
+    def space_size(self) -> int:
+        """参数空间大小（未扣除约束）"""
+        return int(np.prod(self.sizes)) if len(self.sizes) else 0
+
+    def _to_combination(self, cell) -> tuple:
+        return tuple(self.axes[d][int(i)] for d, i in enumerate(cell))
+
+    def _accept(self, cell) -> bool:
+        """下标元组未评估过且满足约束"""
+        if cell in self._seen:
+            return False
+        if self.constraint is not None and not self.constraint(self._to_combination(cell)):
+            return False
+        return True
+
+    def _random_cells(self, n: int) -> list:
+        """随机抽取 n 个合法且未评估过的下标元组"""
+        cells = []
+        attempts = 0
+        max_attempts = max(1000, n * 200)
+        while len(cells) < n and attempts < max_attempts:
+            batch = self.rng.integers(0, self.sizes, size=(max(n * 4, 16), len(self.sizes)))
+            for row in batch:
+                cell = tuple(int(i) for i in row)
+                attempts += 1
+                if self._accept(cell) and cell not in cells:
+                    cells.append(cell)
+                    if len(cells) == n:
+                        break
+        if len(cells) < n and self.space_size <= ENUMERATION_LIMIT:
+            # 剩余合法组合较少时随机抽样很难命中，改为枚举剩余组合后打乱
+            remaining = [cell for cell in np.ndindex(*(int(size) for size in self.sizes))
+                         if cell not in cells and self._accept(cell)]
+            self.rng.shuffle(remaining)
+            cells.extend(remaining[:n - len(cells)])
+        return cells
+
+    def _propose(self, n: int) -> list:
+        return self._random_cells(n)
+
+    def ask(self, n: int) -> list:
+        """
+        获取下一批待评估的参数组合
+        :param n: 批大小
+        :return: 参数元组列表（空间耗尽时可能少于 n 个）
+        """
+        cells = self._propose(n)
+        self._seen.update(cells)
+        return [self._to_combination(cell) for cell in cells]
+
+    def tell(self, combination: tuple, value: float):
+        """
+        反馈一个参数组合的目标值（越大越好）
+        :param combination: 参数元组
+        :param value: 目标值
+        """
+        try:
+            cell = tuple(self.axes[d].index(v) for d, v in enumerate(combination))
+        except ValueError:
+            return
+        value = float(value) if value is not None and np.isfinite(value) else -np.inf
+        self.observations.append((cell, value))
+
+
+class TPESearch(RandomSearch):
+    """
+    TPE 贝叶斯优化
+    把已评估的组合按目标值分为较优（前 gamma 比例）和较差两组，各维分别做核密度估计，
+    从较优组的分布中采样候选，按 l(x)/g(x) 选出最有希望的组合
+    """
+
+    def __init__(self, axes: list, constraint=None, seed: int = None, n_startup: int = 20,
+                 gamma: float = 0.25, n_candidates: int = 64):
+        """
+        :param axes: 每个参数的取值列表
+        :param constraint: 约束函数
+        :param seed: 随机种子
+        :param n_startup: 开始建模前的随机评估次数
+        :param gamma: 较优组所占比例
+        :param n_candidates: 每个待选组合对应的候选采样数
+        """
+        super().__init__(axes, constraint, seed)
+        self.n_startup = max(2, int(n_startup))
+        self.gamma = gamma
+        self.n_candidates = max(1, int(n_candidates))
+
+    def _densities(self, cells: np.ndarray, size: int) -> np.ndarray:
+        """
+        单一维度上的离散核密度（带均匀先验）
+        :param cells: 该维的已观测下标
+        :param size: 该维取值个数
+        :return: 长度为 size 的概率向量
+        """
+        grid = np.arange(size)
+        prior = np.full(size, 1.0 / size)
+        if len(cells) == 0:
+            return prior
+        spread = cells.std() if len(cells) > 1 else size / 4.0
+        bandwidth = max(1.0, spread * len(cells) ** (-0.2), size / (4.0 * len(cells)))
+        kernels = np.exp(-0.5 * ((grid[None, :] - cells[:, None]) / bandwidth) ** 2)
+        kernels /= kernels.sum(axis=1, keepdims=True)
+        density = (kernels.sum(axis=0) + prior) / (len(cells) + 1)
+        return density / density.sum()
+
+    def _propose(self, n: int) -> list:
+        if len(self.observations) < self.n_startup:
+            return self._random_cells(n)
+
+        ordered = sorted(self.observations, key=lambda item: item[1], reverse=True)
+        n_good = max(1, int(np.ceil(self.gamma * len(ordered))))
+        good = np.array([cell for cell, _ in ordered[:n_good]])
+        bad = np.array([cell for cell, _ in ordered[n_good:]]).reshape(-1, len(self.sizes))
+
+        good_density = [self._densities(good[:, d], int(size)) for d, size in enumerate(self.sizes)]
+        bad_density = [self._densities(bad[:, d], int(size)) for d, size in enumerate(self.sizes)]
+
+        # 按较优组的分布采样候选，各维独立
+        count = n * self.n_candidates
+        candidates = np.column_stack([
+            self.rng.choice(int(size), size=count, p=good_density[d]) for d, size in enumerate(self.sizes)
+        ])
+        scores = np.zeros(count)
+        for d in range(len(self.sizes)):
+            scores += np.log(good_density[d][candidates[:, d]]) - np.log(bad_density[d][candidates[:, d]])
+
+        cells = []
+        for row in candidates[np.argsort(-scores, kind='stable')]:
+            cell = tuple(int(i) for i in row)
+            if cell not in cells and self._accept(cell):
+                cells.append(cell)
+                if len(cells) == n:
+                    break
+        # 候选不足时用随机组合补齐
+        if len(cells) < n:
+            for cell in self._random_cells(n - len(cells)):
+                if cell not in cells:
+                    cells.append(cell)
+        return cells
+
+
+# 支持的搜索方式
+SEARCH_METHODS = {
+    'random': RandomSearch,
+    'tpe': TPESearch,
+}
+
+
+def make_searcher(method: str, axes: list, constraint=None, seed: int = None, budget: int = None):
+    """
+    创建参数搜索器
+    :param method: 'random' 或 'tpe'
+    :param axes: 每个参数的取值列表
+    :param constraint: 约束函数
+    :param seed: 随机种子
+    :param budget: 评估预算（用于确定TPE的随机启动次数）
+    :return: 搜索器对象
+    """
+    if method not in SEARCH_METHODS:
+        raise ValueError(f"不支持的搜索方式: {method}，可选: {', '.join(SEARCH_METHODS)}")
+    if method == 'tpe':
+        n_startup = max(10, (budget or 100) // 10)
+        return TPESearch(axes, constraint, seed, n_startup=n_startup)
+    return RandomSearch(axes, constraint, seed)
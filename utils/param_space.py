@@ -0,0 +1,357 @@
+"""
+参数空间声明模块
+策略模块通过 STRATEGY_PARAMS 声明带类型的参数、取值范围、约束和每个参数所属的计算阶段：
+
+    STRATEGY_PARAMS = ParamSpace([
+        Param('short_ma', int, 5, low=1, search_high=360, stage=STAGE_INDICATOR, label='短期均线周期'),
+        Param('long_ma', int, 20, low=1, search_high=360, stage=STAGE_INDICATOR, label='长期均线周期'),
+        Param('principal', float, 100000.0, low=0, stage=STAGE_BACKTEST, label='本金金额'),
+    ], constraints=['short_ma < long_ma'])
+
+计算阶段：
+- indicator: 指标阶段，参数决定要计算的指标（如均线周期、RSI 周期）
+- signal: 信号阶段，参数只影响由指标生成信号的规则（如阈值）
+- backtest: 回测阶段，参数只影响记账（如本金、手续费、止损），不参与参数优化
+
+策略按阶段实现 compute_indicators(data_df, **指标参数) 和 generate_signals(data_df, indicators, **信号参数) 时，
+run_stages 会把指标阶段的结果按 (数据, 指标参数) 放入共享指标缓存：参数优化中只改变信号阶段参数的组合直接复用已算好的指标，
+普通回测只改变本金、手续费等回测阶段参数时直接复用上一次的信号。
+"""
+
+import inspect
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.indicator_cache import get_indicator_cache
+
+STAGE_INDICATOR = 'indicator'
+STAGE_SIGNAL = 'signal'
+STAGE_BACKTEST = 'backtest'
+STAGES = (STAGE_INDICATOR, STAGE_SIGNAL, STAGE_BACKTEST)
+
+# 参与参数优化的阶段
+SEARCH_STAGES = (STAGE_INDICATOR, STAGE_SIGNAL)
+
+# 最近的信号结果缓存数量（普通回测只改变回测阶段参数时复用）
+SIGNAL_CACHE_SIZE = 8
+
+_SIGNALS = OrderedDict()
+_SIGNALS_LOCK = threading.Lock()
+
+_CONSTRAINT_PATTERN = re.compile(r'^\s*([\w.]+)\s*(<=|>=|==|!=|<|>)\s*([\w.]+)\s*$')
+_OPERATORS = {
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+}
+
+
+class Param:
+    """单个策略参数的声明"""
+
+    def __init__(self, name: str, kind=int, default=None, low=None, high=None, step=None, choices=None,
+                 stage: str = STAGE_SIGNAL, label: str = None, example=None, search_low=None, search_high=None):
+        """
+        :param name: 参数名（优化结果、热力图中显示的名称）
+        :param kind: 类型，int、float 或 str
+        :param default: 默认值（输入框留空时使用）
+        :param low: 最小值（含），也是参数优化的默认范围起点
+        :param high: 最大值（含），也是参数优化的默认范围终点
+        :param step: 参数优化的默认步长，int 默认为 1
+        :param choices: 可选值列表，设置后参数只能取其中的值，参数优化遍历全部可选值
+        :param stage: 参数所属的计算阶段：STAGE_INDICATOR / STAGE_SIGNAL / STAGE_BACKTEST
+        :param label: 界面中显示的说明，默认为参数名
+        :param example: 输入框提示中的示例值，默认为默认值
+        :param search_low: 参数优化的默认范围起点，默认为 low（不参与取值检查）
+        :param search_high: 参数优化的默认范围终点，默认为 high（不参与取值检查）
+        """
+        if stage not in STAGES:
+            raise ValueError(f"参数 {name} 的阶段 {stage} 无效，可选: {', '.join(STAGES)}")
+        self.name = name
+        self.kind = kind
+        self.default = default
+        self.low = low
+        self.high = high
+        self.step = step if step is not None else (1 if kind is int else None)
+        self.choices = list(choices) if choices is not None else None
+        self.stage = stage
+        self.label = label or name
+        self.example = example
+        self.search_low = low if search_low is None else search_low
+        self.search_high = high if search_high is None else search_high
+
+    def __repr__(self):
+        return f"Param({self.name!r}, {self.kind.__name__}, default={self.default!r}, stage={self.stage!r})"
+
+    @property
+    def description(self) -> str:
+        """界面输入框的提示文本"""
+        example = self.default if self.example is None else self.example
+        if self.default not in (None, ''):
+            return f"{self.label}(如: {example})"
+        return f"{self.label}(如: {example}，可留空)" if example not in (None, '') else f"{self.label}(可留空)"
+
+    def convert(self, value):
+        """
+        转换并检查参数值
+        :param value: 原始值（字符串或数字），None 或空字符串使用默认值
+        :return: 转换后的值
+        """
+        if value is None or (isinstance(value, str) and not value.strip()):
+            return self.default
+        try:
+            if self.kind is int:
+                number = float(value)
+                if number != int(number):
+                    raise ValueError
+                value = int(number)
+            else:
+                value = self.kind(value.strip() if isinstance(value, str) else value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{self.label} 应为{_KIND_NAMES.get(self.kind, self.kind.__name__)}，输入为 {value!r}")
+        if self.choices is not None and value not in self.choices:
+            raise ValueError(f"{self.label} 只能取 {self.choices}，输入为 {value!r}")
+        if self.low is not None and value < self.low:
+            raise ValueError(f"{self.label} 不能小于 {self.low}，输入为 {value!r}")
+        if self.high is not None and value > self.high:
+            raise ValueError(f"{self.label} 不能大于 {self.high}，输入为 {value!r}")
+        return value
+
+    def values(self, low=None, high=None, step=None) -> list:
+        """
+        参数优化的取值列表
+        :param low: 起点，默认为声明的 search_low
+        :param high: 终点（含），默认为声明的 search_high
+        :param step: 步长，默认为声明的 step
+        :return: 取值列表
+        """
+        if self.choices is not None and low is None and high is None:
+            return list(self.choices)
+        low = self.search_low if low is None else self.convert(low)
+        high = self.search_high if high is None else self.convert(high)
+        step = self.step if step is None else self.kind(step)
+        if low is None or high is None or not step:
+            return [self.default]
+        if self.kind is int:
+            return list(range(int(low), int(high) + 1, int(step)))
+        # 浮点数按步数生成，避免累加误差导致遗漏终点
+        count = int(np.floor((high - low) / step + 1e-9)) + 1
+        return [round(low + i * step, 12) for i in range(max(count, 0))]
+
+    def within(self, values) -> list:
+        """
+        保留取值列表中 low/high、choices 允许的值（用于多个参数共用的优化范围）
+        :param values: 取值列表
+        :return: 过滤后的取值列表
+        """
+        kept = []
+        for value in values:
+            try:
+                kept.append(self.convert(value))
+            except ValueError:
+                pass
+        return kept
+
+
+_KIND_NAMES = {int: '整数', float: '数字', str: '文本'}
+
+
+def _constraint_func(constraint):
+    """把 'a < b' 形式的约束或函数统一为 func(参数字典) -> bool"""
+    if callable(constraint):
+        return constraint
+    match = _CONSTRAINT_PATTERN.match(constraint)
+    if not match:
+        raise ValueError(f"无法解析约束: {constraint!r}，应为 '参数名 比较符 参数名或数字' 的形式")
+    left, operator, right = match.groups()
+
+    def operand(token, values):
+        if token in values:
+            return values[token]
+        return float(token)
+
+    compare = _OPERATORS[operator]
+    return lambda values: compare(operand(left, values), operand(right, values))
+
+
+class ParamSpace:
+    """策略参数空间：有序的参数声明 + 约束"""
+
+    def __init__(self, params: list, constraints=()):
+        """
+        :param params: Param 列表，顺序即 equity_signal 的位置参数顺序
+        :param constraints: 约束列表，元素为 'short_ma < long_ma' 形式的字符串或接收参数字典、返回布尔值的函数
+        """
+        self.params = list(params)
+        self.names = [param.name for param in self.params]
+        if len(set(self.names)) != len(self.names):
+            raise ValueError(f"参数名重复: {self.names}")
+        self._by_name = {param.name: param for param in self.params}
+        self.constraints = [_constraint_func(constraint) for constraint in constraints]
+
+    def __iter__(self):
+        return iter(self.params)
+
+    def __len__(self):
+        return len(self.params)
+
+    def __getitem__(self, name: str) -> Param:
+        return self._by_name[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+
+    def descriptions(self) -> list:
+        """界面输入框的提示文本列表，可直接作为 STRATEGY_PARAM_DESCRIPTIONS"""
+        return [param.description for param in self.params]
+
+    def defaults(self) -> dict:
+        """默认参数字典"""
+        return {param.name: param.default for param in self.params}
+
+    def stage_names(self, stage: str) -> list:
+        """某一阶段的参数名（按声明顺序）"""
+        return [param.name for param in self.params if param.stage == stage]
+
+    def bind(self, args) -> dict:
+        """
+        把位置参数（equity_signal 的 args 或界面输入框文本）转换为参数字典，缺少或留空的使用默认值
+        :param args: 位置参数序列
+        :return: 参数字典
+        """
+        if len(args) > len(self.params):
+            raise ValueError(f"参数过多: 最多 {len(self.params)} 个，传入 {len(args)} 个")
+        return {param.name: param.convert(args[i] if i < len(args) else None) for i, param in enumerate(self.params)}
+
+    def args(self, values: dict) -> tuple:
+        """参数字典转换为 equity_signal 的位置参数"""
+        return tuple(values.get(name, self._by_name[name].default) for name in self.names)
+
+    def check(self, values: dict) -> bool:
+        """参数字典是否满足全部约束"""
+        return all(constraint(values) for constraint in self.constraints)
+
+    def validate(self, values: dict) -> dict:
+        """检查约束，不满足时抛出 ValueError"""
+        if not self.check(values):
+            raise ValueError(f"参数 {values} 不满足约束")
+        return values
+
+    def search_names(self) -> list:
+        """
+        参与参数优化的参数名（指标、信号阶段，按声明顺序）
+        参数优化按位置把参数组合传给 equity_signal，这些参数必须排在回测阶段参数之前；
+        指标阶段参数声明在前时，网格中相邻的组合共用同一组指标
+        """
+        names = [param.name for param in self.params if param.stage in SEARCH_STAGES]
+        if names != self.names[:len(names)]:
+            raise ValueError(f"参与优化的参数 {names} 必须排在回测阶段参数之前: {self.names}")
+        return names
+
+    def search_ranges(self, overrides: dict = None) -> dict:
+        """
+        参数优化的取值范围
+        :param overrides: 参数名 -> 取值列表，覆盖声明中的默认范围，取值超出声明的 low/high 时抛出 ValueError
+        :return: 有序字典：参数名 -> 取值列表
+        """
+        overrides = overrides or {}
+        unknown = set(overrides) - set(self.names)
+        if unknown:
+            raise ValueError(f"未声明的参数: {sorted(unknown)}，可选: {self.names}")
+        ranges = {}
+        for name in self.search_names():
+            if name not in overrides:
+                ranges[name] = self._by_name[name].values()
+                continue
+            # 覆盖的取值也要满足声明的 low/high，否则每个组合都会在回测时出错
+            try:
+                ranges[name] = [self._by_name[name].convert(value) for value in overrides[name]]
+            except ValueError as e:
+                raise ValueError(f"参数 {name} 的优化范围有误: {e}")
+        return ranges
+
+    def constraint_for(self, names: list):
+        """
+        参数元组的约束函数，供 optimize_parameters 和参数搜索器使用（未参与优化的参数取默认值）
+        :param names: 参数元组中各位置的参数名
+        :return: func(参数元组) -> bool，没有约束时为 None
+        """
+        if not self.constraints:
+            return None
+        defaults = self.defaults()
+        return lambda combination: self.check({**defaults, **dict(zip(names, combination))})
+
+    def parse_ranges(self, text: str) -> dict:
+        """
+        解析界面中输入的参数范围，如 'rsi_period=6:30:2; lower=10:40:5; mode=a,b'
+        :param text: 以 ; 分隔的 '参数名=起点:终点[:步长]' 或 '参数名=值1,值2,...'
+        :return: 参数名 -> 取值列表
+        """
+        ranges = {}
+        for item in filter(None, (part.strip() for part in text.split(';'))):
+            name, _, spec = item.partition('=')
+            name = name.strip()
+            if name not in self._by_name:
+                raise ValueError(f"未声明的参数: {name}，可选: {self.names}")
+            param = self._by_name[name]
+            if ':' in spec:
+                bounds = [part.strip() for part in spec.split(':')]
+                ranges[name] = param.values(bounds[0], bounds[1], bounds[2] if len(bounds) > 2 and bounds[2] else None)
+            else:
+                ranges[name] = [param.convert(value) for value in spec.split(',') if value.strip()]
+            if not ranges[name]:
+                raise ValueError(f"参数 {name} 的范围为空: {spec!r}")
+        return ranges
+
+
+def strategy_param_space(strategy) -> ParamSpace:
+    """
+    读取策略模块声明的参数空间
+    :param strategy: 策略模块、策略模块中的函数（如 equity_signal）或带有 STRATEGY_PARAMS 的策略对象
+    :return: ParamSpace，没有声明时为 None
+    """
+    # 表达式规则等策略对象直接带有参数空间
+    space = getattr(strategy, 'STRATEGY_PARAMS', None)
+    if space is None and not inspect.ismodule(strategy):
+        module = inspect.getmodule(strategy)
+        space = getattr(module, 'STRATEGY_PARAMS', None) if module is not None else None
+    return space if isinstance(space, ParamSpace) else None
+
+
+def run_stages(strategy_module, data_df, values: dict):
+    """
+    按阶段运行策略：指标阶段的结果按 (数据, 指标参数) 缓存，信号按 (数据, 指标参数, 信号参数) 缓存最近几次
+    :param strategy_module: 声明了 STRATEGY_PARAMS 并实现 compute_indicators、generate_signals 的策略模块
+    :param data_df: 行情数据
+    :param values: 参数字典（ParamSpace.bind 的结果）
+    :return: generate_signals 的返回值（信号Series）
+    """
+    space = strategy_param_space(strategy_module)
+    indicator_params = {name: values[name] for name in space.stage_names(STAGE_INDICATOR)}
+    signal_params = {name: values[name] for name in space.stage_names(STAGE_SIGNAL)}
+    cache = get_indicator_cache()
+    # 策略模块重新加载后函数对象会变化，键中保留函数对象本身（按身份比较），区分新旧代码的结果
+    version = (strategy_module.compute_indicators, strategy_module.generate_signals)
+    # 指标可能用到收盘价以外的列，列名也作为缓存键的一部分
+    indicator_key = (tuple(data_df.columns), tuple(sorted(indicator_params.items())), version[0])
+    signal_key = (cache.fingerprint(data_df['收盘价']), strategy_module.__name__, indicator_key,
+                  tuple(sorted(signal_params.items())), version[1])
+    with _SIGNALS_LOCK:
+        if signal_key in _SIGNALS:
+            _SIGNALS.move_to_end(signal_key)
+            return _SIGNALS[signal_key]
+
+    indicators = cache.get(data_df['收盘价'], f"{strategy_module.__name__}.compute_indicators", indicator_key,
+                           lambda: strategy_module.compute_indicators(data_df, **indicator_params))
+    signals = strategy_module.generate_signals(data_df, indicators, **signal_params)
+    with _SIGNALS_LOCK:
+        _SIGNALS[signal_key] = signals
+        while len(_SIGNALS) > SIGNAL_CACHE_SIZE:
+            _SIGNALS.popitem(last=False)
+    return signals
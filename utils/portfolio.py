@@ -0,0 +1,386 @@
+"""
+多币种组合回测模块
+把多个行情文件对齐到同一时间轴上，得到 (bars × assets) 的价格矩阵，
+再按每个币种的信号列、权重规则和调仓规则计算组合权益、总敞口和各币种的盈亏归因。
+
+记账方式与合约模块相同：两次调仓之间每个币种持有的数量不变，
+段内组合权益 = 段首权益 × (现金比例 + Σ 权重 × 价格比例)，段首权益是各次调仓增长系数的累乘，
+全部计算都是对整个价格矩阵的数组运算，不按币种循环。
+
+规则：
+- 信号含义与单币种一致：1=持有，0=空仓，NaN=沿用上一状态，0~1 之间的小数按比例缩放该币种的权重
+- 尚未上市（价格为空）的K线不能持有；下架后的价格沿用最后一个收盘价
+- 调仓时手续费 = 按调仓前权益计算的换手金额 × 手续费率，扣费后按目标权重持有
+- 最后一根K线按收盘价全部卖出
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.futures_backtest import targets_to_positions
+from utils.money_management import calculate_fee
+
+# 支持的权重规则
+WEIGHTINGS = ('equal', 'slot', 'inverse_vol')
+
+# 反波动率权重默认使用的收益率窗口
+DEFAULT_VOL_WINDOW = 20
+
+DEFAULT_PANEL_FIELDS = ('开盘价', '最高价', '最低价', '收盘价', '成交量')
+
+
+def _forward_fill(values: np.ndarray) -> np.ndarray:
+    """按列前向填充二维数组中的 NaN（开头的 NaN 保留）"""
+    bars = values.shape[0]
+    last_valid = np.where(~np.isnan(values), np.arange(bars)[:, None], 0)
+    np.maximum.accumulate(last_valid, axis=0, out=last_valid)
+    return values[last_valid, np.arange(values.shape[1])[None, :]]
+
+
+def symbol_from_path(path: str) -> str:
+    """
+    从数据文件名得到币种名称，如 btc_data_1d.csv -> BTC，btcusdt_futures_data_1h.csv -> BTCUSDT
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    for marker in ('_futures_data_', '_data_'):
+        if marker in name:
+            return name.split(marker)[0].upper()
+    return name.upper()
+
+
+def same_interval_files(path: str) -> list:
+    """
+    找出与指定数据文件位于同一目录、周期和市场类型（现货/合约）都相同的全部数据文件
+    :param path: 数据文件路径，如 数据/btc_data_1h.csv
+    :return: 文件路径列表（按文件名排序，包含 path 本身）
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    futures = '_futures_data_' in name
+    marker = '_futures_data_' if futures else '_data_'
+    if marker not in name:
+        return [path]
+    suffix = marker + name.split(marker)[-1]
+    return [os.path.join(directory, file) for file in sorted(os.listdir(directory))
+            if file.endswith(suffix) and ('_futures_data_' in file) == futures]
+
+
+class PricePanel:
+    """
+    对齐后的多币种行情矩阵
+    times 为统一时间轴，fields 中每个字段都是 (bars × assets) 的 float64 矩阵
+    """
+
+    def __init__(self, times, symbols, fields: dict, listed: np.ndarray = None):
+        """
+        :param times: 统一时间轴（DatetimeIndex）
+        :param symbols: 币种名称列表
+        :param fields: 字段名 -> (bars × assets) 矩阵
+        :param listed: (bars × assets) 布尔矩阵，该币种在此K线是否已有行情，默认由收盘价是否为空得到
+        """
+        self.times = pd.DatetimeIndex(times)
+        self.symbols = list(symbols)
+        self.fields = fields
+        self.listed = listed if listed is not None else ~np.isnan(fields['收盘价'])
+
+    @property
+    def close(self) -> np.ndarray:
+        return self.fields['收盘价']
+
+    @property
+    def shape(self) -> tuple:
+        return self.close.shape
+
+    @classmethod
+    def from_frames(cls, frames: dict, fields=DEFAULT_PANEL_FIELDS, how: str = 'outer') -> 'PricePanel':
+        """
+        由多个行情 DataFrame 构建对齐后的行情矩阵
+        :param frames: 币种名称 -> 包含 '交易时间' 及各字段列的 DataFrame
+        :param fields: 需要对齐的字段，缺少的字段跳过
+        :param how: 'outer' 取所有时间的并集，'inner' 只保留所有币种都有行情的时间
+        :return: PricePanel
+        """
+        if how not in ('outer', 'inner'):
+            raise ValueError(f"不支持的对齐方式: {how}")
+        symbols = list(frames)
+        stamps = [pd.to_datetime(frames[s]['交易时间'], format='ISO8601').to_numpy(dtype='datetime64[ns]')
+                  for s in symbols]
+        if not stamps:
+            return cls(pd.DatetimeIndex([]), [], {'收盘价': np.empty((0, 0))})
+
+        times = np.unique(np.concatenate(stamps))
+        if how == 'inner':
+            for stamp in stamps:
+                times = times[np.isin(times, stamp)]
+
+        # 每个币种的行在统一时间轴上的行号，只做一次，各字段共用
+        rows = []
+        for stamp in stamps:
+            position = np.searchsorted(times, stamp)
+            inside = (position < len(times)) & (times[np.minimum(position, len(times) - 1)] == stamp)
+            rows.append((position[inside], inside))
+
+        columns = [f for f in fields if all(f in frames[s].columns for s in symbols)]
+        if '收盘价' not in columns:
+            raise ValueError("所有行情数据都必须包含 '收盘价' 列")
+        matrices = {}
+        listed = None
+        for field in columns:
+            matrix = np.full((len(times), len(symbols)), np.nan)
+            for j, symbol in enumerate(symbols):
+                position, inside = rows[j]
+                matrix[position, j] = frames[symbol][field].to_numpy(dtype=np.float64)[inside]
+            if field == '收盘价':
+                # 上市之前保持为空，之后缺失的K线沿用上一收盘价
+                listed = np.maximum.accumulate(~np.isnan(matrix), axis=0)
+            matrices[field] = matrix
+        for field, matrix in matrices.items():
+            if field == '收盘价':
+                matrices[field] = _forward_fill(matrix)
+            elif field == '成交量':
+                # 停牌的K线成交量为 0
+                matrices[field] = np.where(np.isnan(matrix) & listed, 0.0, matrix)
+            else:
+                # 缺失K线的开高低价取上一收盘价
+                matrices[field] = np.where(np.isnan(matrix), _forward_fill(matrices['收盘价']), matrix)
+        return cls(pd.DatetimeIndex(times), symbols, matrices, listed)
+
+    @classmethod
+    def from_csv(cls, paths, fields=DEFAULT_PANEL_FIELDS, how: str = 'outer') -> 'PricePanel':
+        """
+        读取多个行情CSV并对齐
+        :param paths: 文件路径列表，或 币种名称 -> 文件路径 的字典
+        :param fields: 需要对齐的字段
+        :param how: 'outer' 或 'inner'
+        :return: PricePanel
+        """
+        if not isinstance(paths, dict):
+            paths = {symbol_from_path(path): path for path in paths}
+        frames = {}
+        for symbol, path in paths.items():
+            frames[symbol] = pd.read_csv(path)
+            print(f"已加载 {symbol}: {len(frames[symbol])} 条数据")
+        return cls.from_frames(frames, fields, how)
+
+    def between(self, start=None, end=None) -> 'PricePanel':
+        """
+        截取时间范围内的K线
+        :param start: 开始时间（含），None 表示不限制
+        :param end: 结束时间（含），None 表示不限制
+        :return: 新的 PricePanel（各矩阵为切片视图）
+        """
+        first = self.times.searchsorted(pd.Timestamp(start)) if start is not None else 0
+        last = self.times.searchsorted(pd.Timestamp(end), side='right') if end is not None else len(self.times)
+        rows = slice(first, last)
+        return PricePanel(self.times[rows], self.symbols, {field: matrix[rows] for field, matrix in self.fields.items()},
+                          self.listed[rows])
+
+    def frame(self, symbol: str) -> pd.DataFrame:
+        """
+        取出单个币种的行情（只包含已上市的K线），可直接传给单币种策略的 equity_signal
+        :param symbol: 币种名称
+        :return: DataFrame，列为 '交易时间' 及各字段
+        """
+        j = self.symbols.index(symbol)
+        rows = self.listed[:, j]
+        data = {'交易时间': self.times[rows]}
+        for field, matrix in self.fields.items():
+            data[field] = matrix[rows, j]
+        return pd.DataFrame(data)
+
+    def strategy_signals(self, strategy_func, *args) -> np.ndarray:
+        """
+        对每个币种运行单币种策略，拼成 (bars × assets) 信号矩阵（上市前为 NaN）
+        :param strategy_func: 单币种策略的 equity_signal 函数
+        :param args: 策略参数
+        :return: float64 信号矩阵
+        """
+        signals = np.full(self.shape, np.nan)
+        for j, symbol in enumerate(self.symbols):
+            signals[self.listed[:, j], j] = np.asarray(strategy_func(self.frame(symbol), *args), dtype=np.float64)
+        return signals
+
+
+def rolling_volatility(close: np.ndarray, window: int) -> np.ndarray:
+    """
+    逐币种收益率的滚动标准差（只用当前及之前的K线）
+    :param close: (bars × assets) 收盘价矩阵
+    :param window: 收益率窗口
+    :return: 同形状的标准差矩阵，历史不足 window 根时为 NaN
+    """
+    bars = close.shape[0]
+    returns = np.zeros_like(close)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns[1:] = close[1:] / close[:-1] - 1.0
+    valid = ~np.isnan(returns)
+    returns = np.where(valid, returns, 0.0)
+    count = np.cumsum(valid, axis=0)
+    total = np.cumsum(returns, axis=0)
+    squares = np.cumsum(returns * returns, axis=0)
+    lag = lambda values: np.vstack((np.zeros((window, values.shape[1])), values[:-window]))[:bars]
+    n = count - lag(count)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = (total - lag(total)) / n
+        variance = ((squares - lag(squares)) - n * mean * mean) / (n - 1)
+    return np.where(n >= window, np.sqrt(np.maximum(variance, 0.0)), np.nan)
+
+
+def target_weights(close: np.ndarray, positions: np.ndarray, weighting='equal',
+                   vol_window: int = DEFAULT_VOL_WINDOW) -> np.ndarray:
+    """
+    计算每根K线的目标权重
+    :param close: (bars × assets) 收盘价矩阵（上市前为 NaN）
+    :param positions: (bars × assets) 持仓比例矩阵（0~1）
+    :param weighting: 'equal' 持仓币种等分全部资金；'slot' 每个币种固定 1/assets 的份额，未持仓部分留作现金；
+                      'inverse_vol' 按滚动波动率倒数分配（历史不足的币种不持有）；
+                      也可以传入长度 assets 的数组或 (bars × assets) 矩阵作为基础权重
+    :param vol_window: 反波动率权重的窗口
+    :return: (bars × assets) 目标权重矩阵，每行之和不超过 1
+    """
+    bars, assets = positions.shape
+    if isinstance(weighting, str):
+        if weighting == 'equal' or weighting == 'slot':
+            base = np.ones((bars, assets))
+        elif weighting == 'inverse_vol':
+            with np.errstate(divide='ignore'):
+                base = 1.0 / rolling_volatility(close, vol_window)
+            base = np.where(np.isfinite(base), base, 0.0)
+        else:
+            raise ValueError(f"不支持的权重规则: {weighting}，可选: {WEIGHTINGS}")
+    else:
+        base = np.broadcast_to(np.asarray(weighting, dtype=np.float64), (bars, assets))
+
+    if isinstance(weighting, str) and weighting == 'slot':
+        return positions / max(assets, 1)
+    # 按持仓币种的基础权重归一化，再乘以各自的持仓比例
+    held = base * (positions > 0)
+    total = held.sum(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = np.where(total > 0, held / total, 0.0)
+    return weights * positions
+
+
+def portfolio_backtest(panel: PricePanel, signals: np.ndarray, principal: float = 100000.0,
+                       fee_rate: float = 0.001, weighting='equal', rebalance=None,
+                       vol_window: int = DEFAULT_VOL_WINDOW) -> dict:
+    """
+    组合回测
+    :param panel: 对齐后的行情矩阵
+    :param signals: (bars × assets) 信号矩阵（1=持有，0=空仓，NaN=沿用，小数为持仓比例）
+    :param principal: 本金
+    :param fee_rate: 手续费率
+    :param weighting: 权重规则，见 target_weights
+    :param rebalance: 调仓规则：None 只在目标持仓变化（有币种进出或比例变化）时调仓，其余时间权重随价格漂移；
+                      整数 N 表示另外每 N 根K线按目标权重再平衡一次
+    :param vol_window: 反波动率权重的窗口
+    :return: 字典：
+             equity（逐K线权益）、exposure（逐K线多空持仓市值绝对值之和占权益的比例）、
+             weights（逐K线各币种市值占比）、asset_pnl / asset_fee（各币种累计盈亏和手续费）、
+             final_equity、total_return_rate（%）、total_fee、rebalance_count、turnover（累计换手金额）、
+             sharpe、max_drawdown
+    """
+    close = panel.close
+    signals = np.asarray(signals, dtype=np.float64)
+    if signals.shape != close.shape:
+        raise ValueError(f"信号矩阵形状 {signals.shape} 与行情矩阵形状 {close.shape} 不一致")
+    bars, assets = close.shape
+    if bars == 0:
+        raise ValueError("行情数据为空")
+
+    # ===== 目标权重：未上市的币种不能持有
+    positions = np.clip(targets_to_positions(signals), 0.0, 1.0) * panel.listed
+    weights = target_weights(close, positions, weighting, vol_window)
+
+    # ===== 调仓K线：持仓币种或比例变化，或到达定期再平衡的K线
+    active = positions > 0
+    prev_active = np.zeros_like(active)
+    prev_active[1:] = active[:-1]
+    prev_positions = np.zeros_like(positions)
+    prev_positions[1:] = positions[:-1]
+    rebalance_bars = (active != prev_active).any(axis=1) | (positions != prev_positions).any(axis=1)
+    if rebalance:
+        rebalance_bars[::int(rebalance)] |= active[::int(rebalance)].any(axis=1)
+    return backtest_weights(panel, weights, rebalance_bars, principal, fee_rate)
+
+
+def backtest_weights(panel: PricePanel, weights: np.ndarray, rebalance_bars: np.ndarray,
+                     principal: float = 100000.0, fee_rate: float = 0.001) -> dict:
+    """
+    按给定的目标权重和调仓K线回测（组合回测与截面因子回测共用的记账部分）
+    :param panel: 对齐后的行情矩阵
+    :param weights: (bars × assets) 目标权重矩阵，负数表示做空，只在调仓K线生效
+    :param rebalance_bars: 长度 bars 的布尔数组，是否在该K线收盘时调仓
+    :param principal: 本金
+    :param fee_rate: 手续费率
+    :return: 同 portfolio_backtest
+    """
+    close = panel.close
+    bars = close.shape[0]
+    weights = np.where(panel.listed, np.nan_to_num(np.asarray(weights, dtype=np.float64)), 0.0)
+    weights[-1] = 0.0
+    rebalance_bars = np.array(rebalance_bars, dtype=bool)
+    rebalance_bars[-1] = True
+    segment_index = np.where(rebalance_bars, np.arange(bars), 0)
+    np.maximum.accumulate(segment_index, out=segment_index)
+    held_start = np.zeros(bars, dtype=np.int64)
+    held_start[1:] = segment_index[:-1]
+    held_weights = weights[held_start]
+    held_weights[0] = 0.0
+
+    # ===== 段内价格比例与权益比例（相对段首权益）
+    safe_close = np.where(np.isnan(close), 1.0, close)
+    ratio = safe_close / safe_close[held_start]
+    values = held_weights * ratio
+    equity_ratio = (1.0 - held_weights.sum(axis=1)) + values.sum(axis=1)
+
+    # ===== 调仓：按调仓前权益计算换手金额和手续费，扣费后按目标权重持有
+    trade_values = np.abs(weights * equity_ratio[:, None] - values)
+    trade_fee = np.where(rebalance_bars[:, None], calculate_fee(trade_values, fee_rate), 0.0)
+    after_trade = equity_ratio - trade_fee.sum(axis=1)
+    growth = np.where(rebalance_bars, after_trade, 1.0)
+    segment_equity = principal * np.cumprod(growth)
+    held_equity = np.empty(bars)
+    held_equity[0] = principal
+    held_equity[1:] = segment_equity[:-1]
+    equity = np.where(rebalance_bars, segment_equity, held_equity * equity_ratio)
+
+    # ===== 各币种盈亏归因：每根K线的价格变动贡献（调仓K线的价格比例从 1 重新开始）
+    prev_ratio = np.ones_like(ratio)
+    prev_ratio[1:] = np.where(rebalance_bars[:-1, None], 1.0, ratio[:-1])
+    asset_pnl_bars = held_equity[:, None] * held_weights * (ratio - prev_ratio)
+    asset_fee_bars = held_equity[:, None] * trade_fee
+    asset_fee = asset_fee_bars.sum(axis=0)
+    asset_pnl = asset_pnl_bars.sum(axis=0) - asset_fee
+
+    # ===== 敞口与逐K线市值占比（调仓K线按调仓后的目标权重）
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drift_weights = np.where(equity_ratio[:, None] > 0, values / equity_ratio[:, None], 0.0)
+    bar_weights = np.where(rebalance_bars[:, None], weights, drift_weights)
+    exposure = np.abs(bar_weights).sum(axis=1)
+
+    # ===== 汇总指标
+    equity_returns = np.zeros(bars)
+    equity_returns[1:] = equity[1:] / equity[:-1] - 1.0
+    std = equity_returns.std(ddof=1) if bars > 1 else 0.0
+    sharpe = equity_returns.mean() / std * np.sqrt(252) if std > 0 else 0.0
+    peak = np.maximum(np.maximum.accumulate(equity), principal)
+    # 只统计实际发生换手的调仓（如从空仓到空仓的K线不计）
+    traded = rebalance_bars & (trade_values.sum(axis=1) > 1e-12)
+    turnover = (held_equity * np.where(rebalance_bars, trade_values.sum(axis=1), 0.0)).sum()
+    return {
+        'times': panel.times,
+        'symbols': panel.symbols,
+        'equity': equity,
+        'exposure': exposure,
+        'weights': bar_weights,
+        'asset_pnl': asset_pnl,
+        'asset_fee': asset_fee,
+        'final_equity': float(equity[-1]),
+        'total_return_rate': float((equity[-1] / principal - 1.0) * 100),
+        'total_fee': float(asset_fee.sum()),
+        'rebalance_count': int(traded.sum()),
+        'turnover': float(turnover),
+        'sharpe': float(sharpe),
+        'max_drawdown': float(((peak - equity) / peak).max()),
+    }
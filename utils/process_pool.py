@@ -0,0 +1,244 @@
+"""
+多进程参数评估模块
+行情数据通过共享内存一次性发布，常驻的进程池在多次优化之间复用，
+进程间只传递参数元组和精简的评估结果
+"""
+
+import atexit
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from utils.indicator_bank import MovingAverageBank, accepts_ma_bank
+from utils.money_management import calculate_bar_returns, calculate_sharpe_ratio, calculate_trade_details
+
+
+# 共享内存中各列的起始偏移按该字节数对齐
+_ALIGNMENT = 64
+
+# 主进程中的常驻进程池
+_POOL = None
+_POOL_WORKERS = 0
+
+# 子进程中已挂载的数据集缓存（只保留最近一个）
+_WORKER_DATASET = {}
+
+
+class SharedMarketData:
+    """将行情DataFrame的数值列和时间列一次性写入共享内存"""
+
+    def __init__(self, data_df: pd.DataFrame):
+        """
+        :param data_df: 包含金融数据的 DataFrame
+        """
+        arrays = {}
+        for column in data_df.columns:
+            series = data_df[column]
+            if pd.api.types.is_datetime64_any_dtype(series):
+                if getattr(series.dt, 'tz', None) is not None:
+                    series = series.dt.tz_convert(None)
+                arrays[column] = series.to_numpy()
+            elif pd.api.types.is_numeric_dtype(series):
+                arrays[column] = series.to_numpy()
+            elif column == '交易时间':
+                # 字符串格式的交易时间统一转换为时间类型后再共享
+                arrays[column] = pd.to_datetime(series, errors='coerce').to_numpy()
+
+        layout = []
+        offset = 0
+        for column, values in arrays.items():
+            offset = (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+            layout.append((column, values.dtype.str, offset, len(values)))
+            offset += values.nbytes
+
+        self._shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for (column, dtype, start, length) in layout:
+            target = np.ndarray((length,), dtype=np.dtype(dtype), buffer=self._shm.buf, offset=start)
+            target[:] = arrays[column]
+
+        self.descriptor = {
+            'name': self._shm.name,
+            'layout': layout,
+            'rows': len(data_df),
+        }
+
+    def close(self):
+        """释放并删除共享内存"""
+        if self._shm is not None:
+            self._shm.close()
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """
+    子进程挂载共享内存，内存块的生命周期由主进程负责
+    :param name: 共享内存名称
+    :return: SharedMemory 对象
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # spawn 子进程与主进程共用同一个资源跟踪器，重复登记不会导致提前删除
+    return shared_memory.SharedMemory(name=name)
+
+
+def attach_market_data(descriptor: dict) -> dict:
+    """
+    在子进程中按描述挂载共享行情数据（同一数据集只挂载一次）
+    :param descriptor: SharedMarketData.descriptor
+    :return: 包含 'data_df' 和 'bar_returns' 的数据集字典
+    """
+    if _WORKER_DATASET.get('name') == descriptor['name']:
+        return _WORKER_DATASET
+
+    old_shm = _WORKER_DATASET.get('shm')
+    _WORKER_DATASET.clear()
+    if old_shm is not None:
+        try:
+            old_shm.close()
+        except BufferError:
+            pass
+
+    shm = _attach_shared_memory(descriptor['name'])
+    columns = {}
+    for (column, dtype, start, length) in descriptor['layout']:
+        values = np.ndarray((length,), dtype=np.dtype(dtype), buffer=shm.buf, offset=start)
+        values.flags.writeable = False
+        columns[column] = values
+    data_df = pd.DataFrame(columns, copy=False)
+
+    bar_returns = calculate_bar_returns(data_df)
+
+    _WORKER_DATASET.update({
+        'name': descriptor['name'],
+        'shm': shm,
+        'data_df': data_df,
+        'bar_returns': bar_returns,
+    })
+    return _WORKER_DATASET
+
+
+def _evaluate_chunk(descriptor: dict, strategy_func, chunk: list, principal: float, fee_rate: float) -> list:
+    """
+    子进程中评估一批参数组合
+    :param descriptor: 共享行情数据描述
+    :param strategy_func: 策略函数（需可按模块路径序列化）
+    :param chunk: [(组合序号, 参数元组), ...]
+    :param principal: 本金
+    :param fee_rate: 手续费率
+    :return: [(组合序号, 收益, 夏普, 交易次数, 胜率, 盈亏比, 错误信息), ...]
+    """
+    dataset = attach_market_data(descriptor)
+    data_df = dataset['data_df']
+    bar_returns = dataset['bar_returns']
+
+    # 支持均线库的策略在子进程内复用同一份均线矩阵，按需补算新周期
+    if accepts_ma_bank(strategy_func):
+        ma_bank = dataset.get('ma_bank')
+        if ma_bank is None:
+            ma_bank = dataset['ma_bank'] = MovingAverageBank(data_df['收盘价'])
+        ma_bank.ensure({int(w) for _, combination in chunk for w in combination[:2]})
+        strategy_func = partial(strategy_func, ma_bank=ma_bank)
+
+    results = []
+    for index, combination in chunk:
+        try:
+            signals = strategy_func(data_df, *combination)
+            trade_details = calculate_trade_details(data_df, signals, principal, fee_rate)
+            sharpe = calculate_sharpe_ratio(bar_returns, signals)
+            results.append((index, trade_details['total_return_rate'] / 100.0, sharpe,
+                            trade_details['trade_count'], trade_details['win_rate'],
+                            trade_details['profit_loss_ratio'], None))
+        except Exception as e:
+            results.append((index, -float('inf'), -float('inf'), 0, 0.0, 0.0, str(e)))
+    return results
+
+
+def get_worker_pool(max_workers: int = None) -> ProcessPoolExecutor:
+    """
+    获取常驻进程池，进程数不变时在多次优化之间复用
+    :param max_workers: 进程数，默认为CPU核心数
+    :return: ProcessPoolExecutor
+    """
+    global _POOL, _POOL_WORKERS
+    if max_workers is None:
+        max_workers = multiprocessing.cpu_count()
+    if _POOL is not None and _POOL_WORKERS != max_workers:
+        shutdown_worker_pool()
+    if _POOL is None:
+        # 统一使用spawn，避免在GUI进程中fork带来的线程状态问题
+        _POOL = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+        _POOL_WORKERS = max_workers
+    return _POOL
+
+
+def shutdown_worker_pool():
+    """关闭常驻进程池"""
+    global _POOL, _POOL_WORKERS
+    if _POOL is not None:
+        _POOL.shutdown(wait=True, cancel_futures=True)
+        _POOL = None
+        _POOL_WORKERS = 0
+
+
+atexit.register(shutdown_worker_pool)
+
+
+def iter_process_results(data_df: pd.DataFrame, strategy_func, combinations: list, principal: float,
+                         fee_rate: float, max_workers: int = None, chunk_size: int = None,
+                         market_data: SharedMarketData = None):
+    """
+    使用常驻进程池评估参数组合，按完成顺序逐个产出精简结果
+    :param data_df: 包含金融数据的 DataFrame
+    :param strategy_func: 策略函数
+    :param combinations: 参数元组列表
+    :param principal: 本金
+    :param fee_rate: 手续费率
+    :param max_workers: 进程数，默认为CPU核心数
+    :param chunk_size: 每个任务包含的组合数，默认按进程数自动划分
+    :param market_data: 已发布的共享行情数据（可选），分多批评估时复用，由调用方负责释放
+    :return: 生成器，产出 (组合序号, 收益, 夏普, 交易次数, 胜率, 盈亏比, 错误信息)
+    """
+    if not combinations:
+        return
+    pool = get_worker_pool(max_workers)
+    if chunk_size is None:
+        # 每个进程约分到16个任务，兼顾负载均衡和进程间通信开销
+        chunk_size = max(1, len(combinations) // (_POOL_WORKERS * 16))
+
+    indexed = list(enumerate(combinations))
+    chunks = [indexed[i:i + chunk_size] for i in range(0, len(indexed), chunk_size)]
+
+    owns_market_data = market_data is None
+    if owns_market_data:
+        market_data = SharedMarketData(data_df)
+    futures = [pool.submit(_evaluate_chunk, market_data.descriptor, strategy_func, chunk, principal, fee_rate)
+               for chunk in chunks]
+    try:
+        for future in as_completed(futures):
+            for item in future.result():
+                yield item
+    except BrokenProcessPool:
+        shutdown_worker_pool()
+        raise
+    finally:
+        # 提前退出（出错或调用方中止）时取消尚未开始的任务
+        for future in futures:
+            future.cancel()
+        if owns_market_data:
+            market_data.close()
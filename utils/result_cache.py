@@ -0,0 +1,204 @@
+"""
+参数优化结果缓存模块
+将每个参数组合的精简指标保存到 SQLite 数据库，键为
+数据集指纹 + 策略模块哈希 + 回测引擎模块哈希 + 本金/手续费 + 参数，
+重新运行相同的优化时跳过已完成的组合，中断的优化可以继续
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import time
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+
+# 缓存的指标列，顺序与进程池返回的精简结果一致
+CACHE_COLUMNS = ('return', 'sharpe', 'trade_count', 'win_rate', 'profit_loss_ratio')
+
+# 缓冲的结果达到该数量或距上次写入超过该秒数时提交到数据库
+FLUSH_ROWS = 200
+FLUSH_SECONDS = 5.0
+
+# 项目根目录
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 计算信号和回测指标的引擎模块（相对项目根目录），修改后缓存的结果同样失效
+ENGINE_FILES = (
+    'utils/batch_backtest.py',
+    'utils/indicator_bank.py',
+    'utils/indicator_cache.py',
+    'utils/money_management.py',
+    'utils/param_space.py',
+    'utils/process_pool.py',
+    'utils/stops.py',
+    'utils/strategy_rules.py',
+    'utils/timeframes.py',
+    'k线图/indicators.py',
+    '策略/参数优化策略.py',
+)
+
+
+def dataset_fingerprint(data_df: pd.DataFrame) -> str:
+    """
+    计算数据集指纹，数据内容（含列名和行数）任何变化都会得到不同的指纹
+    :param data_df: 行情数据
+    :return: 十六进制哈希字符串
+    """
+    digest = hashlib.sha1()
+    digest.update(json.dumps([str(c) for c in data_df.columns], ensure_ascii=False).encode('utf-8'))
+    digest.update(str(len(data_df)).encode('ascii'))
+    if len(data_df):
+        digest.update(pd.util.hash_pandas_object(data_df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def engine_fingerprint() -> str:
+    """
+    计算回测引擎指纹：ENGINE_FILES 中各源文件的哈希，策略逻辑所用的均线库、批量回测、记账等代码修改后缓存自动失效
+    :return: 十六进制哈希字符串
+    """
+    digest = hashlib.sha1()
+    for relative_path in ENGINE_FILES:
+        digest.update(relative_path.encode('utf-8'))
+        try:
+            with open(os.path.join(_ROOT, relative_path), 'rb') as f:
+                digest.update(f.read())
+        except OSError:
+            pass
+    return digest.hexdigest()
+
+
+def strategy_fingerprint(strategy_func) -> str:
+    """
+    计算策略指纹：策略所在模块源文件的哈希 + 函数名，修改策略代码后缓存自动失效
+    （策略调用的引擎模块由 engine_fingerprint 单独计入）
+    :param strategy_func: 策略函数（可以是 functools.partial）
+    :return: 十六进制哈希字符串
+    """
+    while isinstance(strategy_func, partial):
+        strategy_func = strategy_func.func
+    digest = hashlib.sha1()
+    # 表达式规则等策略对象：规则文本 + 实现它的类所在的源文件
+    source_text = getattr(strategy_func, 'source_text', None)
+    if source_text is not None:
+        digest.update(source_text.encode('utf-8'))
+        strategy_func = type(strategy_func)
+    digest.update(f"{getattr(strategy_func, '__module__', '')}.{getattr(strategy_func, '__qualname__', '')}".encode('utf-8'))
+    try:
+        source_file = inspect.getsourcefile(strategy_func)
+        with open(source_file, 'rb') as f:
+            digest.update(f.read())
+    except (TypeError, OSError):
+        # 无法定位源文件（如内置函数）时退化为函数字节码
+        code = getattr(strategy_func, '__code__', None)
+        if code is not None:
+            digest.update(code.co_code)
+    return digest.hexdigest()
+
+
+def _to_builtin(value):
+    """将 numpy 标量转换为 Python 内置类型，保证参数序列化结果稳定"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class ResultCache:
+    """单次优化运行（固定数据集、策略、本金和手续费）的结果缓存"""
+
+    def __init__(self, path: str, data_df: pd.DataFrame, strategy_func, principal: float, fee_rate: float):
+        """
+        :param path: SQLite 数据库文件路径，不存在时自动创建
+        :param data_df: 行情数据
+        :param strategy_func: 策略函数
+        :param principal: 本金
+        :param fee_rate: 手续费率
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.run_key = hashlib.sha1('|'.join([
+            dataset_fingerprint(data_df),
+            strategy_fingerprint(strategy_func),
+            engine_fingerprint(),
+            repr(float(principal)),
+            repr(float(fee_rate)),
+        ]).encode('utf-8')).hexdigest()
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'run_key TEXT NOT NULL, params TEXT NOT NULL, '
+            '"return" REAL, sharpe REAL, trade_count REAL, win_rate REAL, profit_loss_ratio REAL, '
+            'PRIMARY KEY (run_key, params))'
+        )
+        self._conn.commit()
+        self._pending = []
+        self._last_flush = time.time()
+
+    @staticmethod
+    def params_key(params: dict) -> str:
+        """参数字典的规范化键"""
+        return json.dumps({str(k): _to_builtin(v) for k, v in params.items()}, sort_keys=True, ensure_ascii=False)
+
+    def get_many(self, params_list: list) -> dict:
+        """
+        批量查询已缓存的结果
+        :param params_list: 参数字典列表
+        :return: {序号: (收益, 夏普, 交易次数, 胜率, 盈亏比)}，未命中的序号不在其中
+        """
+        keys = {}
+        for i, params in enumerate(params_list):
+            keys.setdefault(self.params_key(params), []).append(i)
+        found = {}
+        key_list = list(keys)
+        # SQLite 单条语句的参数个数有限制，分批查询
+        for start in range(0, len(key_list), 500):
+            batch = key_list[start:start + 500]
+            placeholders = ','.join('?' * len(batch))
+            rows = self._conn.execute(
+                f'SELECT params, "return", sharpe, trade_count, win_rate, profit_loss_ratio FROM results '
+                f'WHERE run_key = ? AND params IN ({placeholders})',
+                [self.run_key] + batch
+            ).fetchall()
+            for row in rows:
+                values = tuple(float('nan') if v is None else v for v in row[1:])
+                for i in keys[row[0]]:
+                    found[i] = values
+        return found
+
+    def put(self, params: dict, values: tuple):
+        """
+        写入一个组合的结果（先缓冲，按数量或时间批量提交）
+        :param params: 参数字典
+        :param values: (收益, 夏普, 交易次数, 胜率, 盈亏比)
+        """
+        # SQLite 的 REAL 可以保存 ±inf（盈亏比在没有亏损交易时为 inf），NaN 保存为 NULL，读回时为 NaN
+        row = [self.run_key, self.params_key(params)]
+        row.extend(None if np.isnan(v) else float(v) for v in values)
+        self._pending.append(row)
+        if len(self._pending) >= FLUSH_ROWS or time.time() - self._last_flush >= FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        """提交缓冲的结果"""
+        if self._pending:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO results (run_key, params, "return", sharpe, trade_count, win_rate, profit_loss_ratio) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                self._pending
+            )
+            self._conn.commit()
+            self._pending = []
+        self._last_flush = time.time()
+
+    def close(self):
+        """提交剩余结果并关闭数据库"""
+        if self._conn is not None:
+            self.flush()
+            self._conn.close()
+            self._conn = None
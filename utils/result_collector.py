@@ -0,0 +1,138 @@
+"""
+参数优化结果收集模块
+用固定大小的堆保留目标指标最优的前K个完整结果（含交易明细），
+其余组合只保留精简的标量指标
+"""
+
+import heapq
+from array import array
+
+import numpy as np
+
+
+# 每个组合保留的标量指标
+METRIC_NAMES = ('return', 'sharpe', 'trade_count', 'win_rate', 'profit_loss_ratio')
+
+# 参数网格格子数上限，超过时不构建网格（每个指标一个 float32 网格，约 16MB）
+GRID_CELL_LIMIT = 4_000_000
+
+
+class TopKCollector:
+    """流式收集参数优化结果，内存占用与参数网格大小基本无关"""
+
+    def __init__(self, k: int = 50, objective: str = 'return', keep_metrics: bool = True):
+        """
+        :param k: 保留完整结果的数量
+        :param objective: 排序所用的指标名（越大越好）
+        :param keep_metrics: 是否为每个组合保留精简的标量指标
+        """
+        self.k = max(1, int(k))
+        self.objective = objective
+        self.keep_metrics = keep_metrics
+        self.count = 0
+        self._heap = []  # 小顶堆：(目标值, -加入顺序, 结果)
+        self._indices = array('l')
+        self._metrics = {name: array('f') for name in METRIC_NAMES}
+
+    @staticmethod
+    def _metric(result: dict, name: str) -> float:
+        """读取结果中的标量指标，缺失时视为负无穷"""
+        if name in ('return', 'sharpe'):
+            value = result.get(name, -float('inf'))
+        else:
+            value = (result.get('trade_details') or {}).get(name, 0)
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return -float('inf')
+
+    def add(self, result: dict, index: int = None) -> bool:
+        """
+        加入一个组合的评估结果
+        :param result: 评估结果字典（含 params、return、sharpe、trade_details）
+        :param index: 组合序号，默认为加入顺序
+        :return: 该结果是否进入当前前K名
+        """
+        seq = self.count
+        self.count += 1
+        if self.keep_metrics:
+            self._indices.append(seq if index is None else int(index))
+            for name in METRIC_NAMES:
+                self._metrics[name].append(self._metric(result, name))
+
+        key = self._metric(result, self.objective)
+        if key != key:  # NaN 排在最后
+            key = -float('inf')
+        # 目标值相同时先加入的结果优先
+        entry = (key, -seq, result)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+            return True
+        if entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+            return True
+        return False
+
+    def top(self) -> list:
+        """
+        :return: 按目标指标从高到低排序的前K个结果
+        """
+        return [entry[2] for entry in sorted(self._heap, key=lambda e: e[:2], reverse=True)]
+
+    def best(self) -> dict:
+        """
+        :return: 目标指标最优的结果，没有结果时返回 None
+        """
+        if not self._heap:
+            return None
+        return max(self._heap, key=lambda e: e[:2])[2]
+
+    def metrics(self) -> dict:
+        """
+        :return: 所有组合的精简指标数组，键为 'index' 和 METRIC_NAMES
+        """
+        data = {'index': np.frombuffer(self._indices, dtype=np.dtype(self._indices.typecode)).copy()}
+        for name in METRIC_NAMES:
+            data[name] = np.frombuffer(self._metrics[name], dtype=np.float32).copy()
+        return data
+
+
+def build_metric_grid(metrics: dict, combinations: list, param_names: list, axis_values: list) -> dict:
+    """
+    将所有组合的精简指标整理为参数网格矩阵，便于观察最优参数附近是否平稳
+    :param metrics: TopKCollector.metrics() 的返回值
+    :param combinations: 参数元组列表（metrics['index'] 指向其中的位置）
+    :param param_names: 参数名列表
+    :param axis_values: 每个参数的取值列表，决定网格各维的坐标
+    :return: {'param_names': 参数名, 'axes': 各维坐标, 'metrics': {指标名: float32 网格}}，
+             未评估的格子为 NaN；网格格子数超过 GRID_CELL_LIMIT 时返回 None
+    """
+    axes = [list(values) for values in axis_values]
+    shape = tuple(len(values) for values in axes)
+    if int(np.prod(shape, dtype=np.float64)) > GRID_CELL_LIMIT:
+        return None
+    lookups = [{value: i for i, value in enumerate(values)} for values in axes]
+
+    grids = {name: np.full(shape, np.nan, dtype=np.float32) for name in METRIC_NAMES}
+    positions = [[] for _ in shape]
+    rows = []
+    for row, index in enumerate(metrics['index']):
+        combination = combinations[int(index)]
+        try:
+            cell = [lookups[d][combination[d]] for d in range(len(shape))]
+        except (KeyError, IndexError):
+            continue
+        for d, position in enumerate(cell):
+            positions[d].append(position)
+        rows.append(row)
+
+    if rows:
+        cell_index = tuple(np.asarray(p, dtype=np.intp) for p in positions)
+        for name in METRIC_NAMES:
+            grids[name][cell_index] = metrics[name][rows]
+
+    return {
+        'param_names': list(param_names),
+        'axes': axes,
+        'metrics': grids,
+    }
@@ -0,0 +1,256 @@
+"""
+稳健性分析模块
+用批量的 NumPy 随机抽样代替逐次回测，一次生成成千上万条重采样路径，
+统计收益率和最大回撤的分布：
+- 交易顺序打乱：总收益不变，考察最大回撤对交易顺序的敏感度
+- 交易有放回重抽：考察总收益的分布
+- 逐K线盈亏的分块自助法（block bootstrap）：保留短期相关性的权益路径
+- 随机起始日期：从随机的K线开始回测到数据末尾
+所有权益口径与 calculate_trade_details / batch_backtest 一致（固定本金逐笔记账）
+"""
+
+import numpy as np
+import pandas as pd
+
+from utils.batch_backtest import (SIGNAL_HOLD, SIGNAL_LONG, equity_curve, signals_to_matrix,
+                                  signals_to_positions, trade_bounds)
+
+# 报告中展示的分位数
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+# 每批处理的 (样本数 × 路径长度) 元素上限，控制中间数组的内存占用
+BLOCK_ELEMENTS = 4_000_000
+
+
+def _max_drawdown(pnl_paths: np.ndarray, principal: float) -> np.ndarray:
+    """
+    由累计盈亏路径计算最大回撤（比例）
+    :param pnl_paths: 形状为 (samples, steps) 的累计盈亏
+    :param principal: 本金
+    :return: 每条路径的最大回撤
+    """
+    if pnl_paths.shape[1] == 0:
+        return np.zeros(pnl_paths.shape[0])
+    equity = principal + pnl_paths
+    peak = np.maximum(np.maximum.accumulate(equity, axis=1), principal)
+    return ((peak - equity) / peak).max(axis=1)
+
+
+def trade_shuffle(trade_returns, principal: float, n_samples: int = 1000, seed: int = None) -> dict:
+    """
+    交易顺序打乱 + 交易有放回重抽
+    :param trade_returns: 每笔交易的盈亏金额
+    :param principal: 本金
+    :param n_samples: 重采样次数
+    :param seed: 随机种子
+    :return: {'shuffle_max_drawdown': 打乱顺序后的最大回撤数组,
+              'bootstrap_return_rate': 重抽后的总收益率数组（%）,
+              'bootstrap_max_drawdown': 重抽后的最大回撤数组}
+    """
+    trade_returns = np.asarray(trade_returns, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    n_trades = len(trade_returns)
+    if n_trades == 0:
+        zeros = np.zeros(n_samples)
+        return {'shuffle_max_drawdown': zeros, 'bootstrap_return_rate': zeros.copy(), 'bootstrap_max_drawdown': zeros.copy()}
+
+    batch = max(1, BLOCK_ELEMENTS // n_trades)
+    shuffle_dd, boot_rate, boot_dd = [], [], []
+    for start in range(0, n_samples, batch):
+        size = min(batch, n_samples - start)
+        shuffled = rng.permuted(np.broadcast_to(trade_returns, (size, n_trades)), axis=1)
+        shuffle_dd.append(_max_drawdown(np.cumsum(shuffled, axis=1), principal))
+        drawn = trade_returns[rng.integers(0, n_trades, size=(size, n_trades))]
+        paths = np.cumsum(drawn, axis=1)
+        boot_rate.append(paths[:, -1] / principal * 100)
+        boot_dd.append(_max_drawdown(paths, principal))
+    return {
+        'shuffle_max_drawdown': np.concatenate(shuffle_dd),
+        'bootstrap_return_rate': np.concatenate(boot_rate),
+        'bootstrap_max_drawdown': np.concatenate(boot_dd),
+    }
+
+
+def block_bootstrap(pnl_increments, principal: float, n_samples: int = 1000, block_size: int = None,
+                    seed: int = None) -> dict:
+    """
+    逐K线盈亏的移动分块自助法
+    :param pnl_increments: 逐K线权益变化（长度 bars）
+    :param principal: 本金
+    :param n_samples: 重采样次数
+    :param block_size: 分块长度，默认为 bars 的立方根
+    :param seed: 随机种子
+    :return: {'return_rate': 总收益率数组（%）, 'max_drawdown': 最大回撤数组}
+    """
+    increments = np.asarray(pnl_increments, dtype=np.float64)
+    bars = len(increments)
+    if bars == 0:
+        zeros = np.zeros(n_samples)
+        return {'return_rate': zeros, 'max_drawdown': zeros.copy()}
+    if block_size is None:
+        block_size = int(round(bars ** (1 / 3)))
+    block_size = max(1, min(int(block_size), bars))
+    rng = np.random.default_rng(seed)
+    n_blocks = -(-bars // block_size)
+    offsets = np.arange(block_size)
+
+    batch = max(1, BLOCK_ELEMENTS // (n_blocks * block_size))
+    rates, drawdowns = [], []
+    for start in range(0, n_samples, batch):
+        size = min(batch, n_samples - start)
+        # 每条路径由 n_blocks 个随机起点的连续分块拼接，截断到原长度
+        starts = rng.integers(0, bars - block_size + 1, size=(size, n_blocks))
+        index = (starts[:, :, None] + offsets).reshape(size, -1)[:, :bars]
+        paths = np.cumsum(increments[index], axis=1)
+        rates.append(paths[:, -1] / principal * 100)
+        drawdowns.append(_max_drawdown(paths, principal))
+    return {'return_rate': np.concatenate(rates), 'max_drawdown': np.concatenate(drawdowns)}
+
+
+def random_starts(close, signal_column: np.ndarray, principal: float, fee_rate: float,
+                  n_samples: int = 1000, min_bars: int = None, seed: int = None) -> dict:
+    """
+    从随机K线开始回测到数据末尾（起点之前视为空仓），结果与对 data_df.iloc[s:] 单独回测一致
+    起点之后第一个有效信号 v 处：若为空仓，此后与完整回测的持仓完全相同；
+    若为做多，则在 v 开仓、在完整回测中该笔交易的平仓K线 x 平仓，之后同样与完整回测相同。
+    因此每条路径 = 起点到 x 的一段单独计算 + 完整回测权益曲线平移，无需逐个重新回测
+    :param close: 收盘价数组
+    :param signal_column: int8 信号列（signals_to_matrix 的一列）
+    :param principal: 本金
+    :param fee_rate: 手续费率
+    :param n_samples: 随机起点数量
+    :param min_bars: 起点到数据末尾的最少K线数，默认为总长度的一半
+    :param seed: 随机种子
+    :return: {'start_index': 起点, 'return_rate': 总收益率数组（%）, 'max_drawdown': 最大回撤数组}
+    """
+    close = np.asarray(close, dtype=np.float64)
+    signal_column = np.asarray(signal_column, dtype=np.int8)
+    bars = len(close)
+    if min_bars is None:
+        min_bars = bars // 2
+    latest = max(0, bars - max(1, int(min_bars)))
+    rng = np.random.default_rng(seed)
+    starts = np.sort(rng.integers(0, latest + 1, size=n_samples))
+    if bars == 0:
+        zeros = np.zeros(n_samples)
+        return {'start_index': starts, 'return_rate': zeros, 'max_drawdown': zeros.copy()}
+
+    full_equity = equity_curve(close, signal_column, principal, fee_rate)[:, 0]
+    positions = signals_to_positions(signal_column[:, None])
+    exit_mask, _ = trade_bounds(positions)
+    exits = np.flatnonzero(exit_mask[:, 0])
+    valid = np.flatnonzero(signal_column != SIGNAL_HOLD)
+    buy_fee = principal * fee_rate
+
+    # 起点之后的第一个有效信号；没有有效信号的起点全程空仓
+    k = np.searchsorted(valid, starts)
+    has_signal = k < len(valid)
+    v = np.where(has_signal, valid[np.minimum(k, len(valid) - 1)], bars)
+    is_long = has_signal & (signal_column[np.minimum(v, bars - 1)] == SIGNAL_LONG)
+
+    # 做多起点：开仓价、平仓K线、单独计算的这笔交易盈亏
+    entry_price = close[np.minimum(v, bars - 1)]
+    x = exits[np.minimum(np.searchsorted(exits, np.minimum(v, bars - 1)), len(exits) - 1)] if len(exits) else v
+    ratio = close[np.minimum(x, bars - 1)] / entry_price
+    partial_return = principal * ratio - principal - buy_fee - principal * ratio * fee_rate
+    # 与完整权益曲线重合的起始K线和平移量
+    join = np.where(is_long, x, v)
+    offset = np.where(is_long, principal + partial_return, principal) - full_equity[np.minimum(join, bars - 1)]
+
+    rates = np.zeros(n_samples)
+    drawdowns = np.zeros(n_samples)
+    active = np.flatnonzero(has_signal)
+    batch = max(1, BLOCK_ELEMENTS // max(bars, 1))
+    for first in range(0, len(active), batch):
+        chunk = active[first:first + batch]
+        base = int(starts[chunk[0]])
+        rows = np.arange(base, bars)[:, None]
+        paths = full_equity[base:, None] + offset[chunk][None, :]
+        # 第一笔单独计算的持仓段：固定本金的浮动盈亏
+        holding = is_long[chunk][None, :] & (rows >= v[chunk][None, :]) & (rows < join[chunk][None, :])
+        open_equity = principal * close[base:, None] / entry_price[chunk][None, :] - buy_fee
+        paths = np.where(holding, open_equity, paths)
+        paths[rows < np.where(is_long[chunk], v[chunk], join[chunk])[None, :]] = principal
+        peak = np.maximum(np.maximum.accumulate(paths, axis=0), principal)
+        drawdowns[chunk] = ((peak - paths) / peak).max(axis=0)
+        rates[chunk] = (paths[-1] - principal) / principal * 100
+    return {'start_index': starts, 'return_rate': rates, 'max_drawdown': drawdowns}
+
+
+def robustness_analysis(data_df: pd.DataFrame, signals: pd.Series, trade_details: dict, principal: float,
+                        fee_rate: float, n_samples: int = 1000, block_size: int = None, seed: int = None,
+                        percentiles=DEFAULT_PERCENTILES, stop_settings: tuple = None) -> dict:
+    """
+    对一次回测结果做完整的稳健性分析
+    :param data_df: 行情数据
+    :param signals: 策略信号Series
+    :param trade_details: calculate_trade_details 的返回值
+    :param principal: 本金
+    :param fee_rate: 手续费率
+    :param n_samples: 每种方法的重采样次数
+    :param block_size: 分块自助法的分块长度
+    :param seed: 随机种子
+    :param percentiles: 需要统计的分位数
+    :param stop_settings: (止损, 止盈, 跟踪止损) 比例，设置时 trade_details 应为 calculate_trade_details_with_stops 的结果，
+                          分块自助法使用止损/止盈后的权益；随机起始日期需要对每个起点重新模拟止损，不计算
+    :return: {方法名: {指标名: {分位数: 值}}}，另含 'n_samples' 和 'notes'（说明文字列表）
+    """
+    rng = np.random.default_rng(seed)
+    seeds = rng.integers(0, 2 ** 32, size=3)
+    close = data_df['收盘价'].to_numpy(dtype=np.float64)
+    column = signals_to_matrix([signals])[:, 0]
+
+    trade_returns = [trade['return'] for trade in trade_details.get('trades', [])]
+    shuffled = trade_shuffle(trade_returns, principal, n_samples, seeds[0])
+    use_stops = stop_settings is not None and any(value is not None for value in stop_settings)
+    if use_stops:
+        # 逐K线权益与交易明细使用同一组止损/止盈后的交易
+        from utils.stops import equity_curve_with_stops
+        equity = equity_curve_with_stops(data_df, signals, principal, fee_rate, *stop_settings)
+    else:
+        equity = equity_curve(close, column, principal, fee_rate)[:, 0]
+    increments = np.diff(equity, prepend=principal)
+    blocks = block_bootstrap(increments, principal, n_samples, block_size, seeds[1])
+
+    def summarize(values):
+        return dict(zip(percentiles, np.percentile(values, percentiles)))
+
+    analysis = {
+        'n_samples': n_samples,
+        'notes': [],
+        'trade_shuffle': {'max_drawdown': summarize(shuffled['shuffle_max_drawdown'])},
+        'trade_bootstrap': {'return_rate': summarize(shuffled['bootstrap_return_rate']),
+                            'max_drawdown': summarize(shuffled['bootstrap_max_drawdown'])},
+        'block_bootstrap': {'return_rate': summarize(blocks['return_rate']),
+                            'max_drawdown': summarize(blocks['max_drawdown'])},
+    }
+    if use_stops:
+        analysis['notes'].append('设置了止损/止盈，未计算随机起始日期（每个起点都需要重新模拟止损）')
+    else:
+        starts = random_starts(close, column, principal, fee_rate, n_samples, seed=seeds[2])
+        analysis['random_start'] = {'return_rate': summarize(starts['return_rate']),
+                                    'max_drawdown': summarize(starts['max_drawdown'])}
+    return analysis
+
+
+def format_robustness_report(analysis: dict) -> str:
+    """
+    将稳健性分析结果格式化为回测报告文本
+    :param analysis: robustness_analysis 的返回值
+    :return: 多行文本
+    """
+    names = {
+        'trade_shuffle': '交易顺序打乱',
+        'trade_bootstrap': '交易重抽',
+        'block_bootstrap': '分块自助法',
+        'random_start': '随机起始日期',
+    }
+    metric_names = {'return_rate': ('收益率', 1.0), 'max_drawdown': ('最大回撤', 100.0)}
+    lines = [f"稳健性分析（每种方法 {analysis['n_samples']} 次重采样，分位数）:"]
+    for key, display_name in names.items():
+        for metric, values in analysis.get(key, {}).items():
+            label, scale = metric_names[metric]
+            text = ", ".join(f"P{int(p)}={v * scale:.2f}%" for p, v in values.items())
+            lines.append(f"- {display_name} {label}: {text}")
+    lines.extend(f"- 注: {note}" for note in analysis.get('notes', []))
+    return "\n".join(lines)
@@ -0,0 +1,289 @@
+"""
+止损/止盈模块
+用每根K线的最高价、最低价检查止损、止盈和跟踪止损，全部以数组运算完成：
+先按信号得到每笔交易的开仓K线和信号平仓K线，再把所有交易持仓期间的K线展开成一维数组，
+一次性计算触发价位并找出每笔交易第一次触发的K线，不做逐K线循环，可直接用于参数扫描
+
+规则：
+- 开仓K线按收盘价开仓，从下一根K线开始检查
+- 止损价 = 开仓价 × (1 - 止损比例)，止盈价 = 开仓价 × (1 + 止盈比例)
+- 跟踪止损价 = max(开仓价, 开仓后至上一根K线的最高价) × (1 - 跟踪比例)，不使用当根K线的最高价
+- 同一根K线同时触及止损和止盈时，保守地按止损处理
+- 止损离场后，直到信号出现新的开仓才再次入场
+"""
+
+import numpy as np
+import pandas as pd
+
+from utils.batch_backtest import as_signal_matrix, signals_to_matrix, signals_to_positions, trade_bounds
+
+# 成交价规则：'level' 按触发价成交（开盘即跳空越过触发价时按开盘价成交），'close' 按触发K线收盘价成交
+FILL_POLICIES = ('level', 'close')
+
+# 平仓原因
+EXIT_SIGNAL = 'signal'
+EXIT_END = 'end'
+EXIT_STOP_LOSS = 'stop_loss'
+EXIT_TAKE_PROFIT = 'take_profit'
+EXIT_TRAILING_STOP = 'trailing_stop'
+EXIT_REASONS = (EXIT_SIGNAL, EXIT_END, EXIT_STOP_LOSS, EXIT_TAKE_PROFIT, EXIT_TRAILING_STOP)
+
+
+def _per_column(value, combos: int) -> np.ndarray:
+    """将标量或逐组合的比例参数展开为长度 combos 的数组，None 表示不启用（NaN）"""
+    if value is None:
+        return np.full(combos, np.nan)
+    values = np.asarray(value, dtype=np.float64)
+    return np.broadcast_to(values, (combos,)).astype(np.float64)
+
+
+def _segment_cummax(values: np.ndarray, segment: np.ndarray) -> np.ndarray:
+    """
+    分段累计最大值（每段重新开始），用整数秩代替浮点偏移，结果精确
+    :param values: 一维数组
+    :param segment: 每个元素所属的段号（非递减）
+    :return: 分段累计最大值
+    """
+    unique, ranks = np.unique(values, return_inverse=True)
+    keys = segment.astype(np.int64) * len(unique) + ranks
+    np.maximum.accumulate(keys, out=keys)
+    return unique[keys - segment.astype(np.int64) * len(unique)]
+
+
+def apply_stops(open_, high, low, close, signal_matrix: np.ndarray, stop_loss=None, take_profit=None,
+                trailing_stop=None, fill_policy: str = 'level') -> dict:
+    """
+    计算加入止损/止盈后的所有交易
+    :param open_: 开盘价数组（为 None 时不考虑跳空）
+    :param high: 最高价数组
+    :param low: 最低价数组
+    :param close: 收盘价数组
+    :param signal_matrix: int8 信号矩阵 (bars × combos)
+    :param stop_loss: 止损比例（如 0.05），标量或每个组合一个值，None 为不启用
+    :param take_profit: 止盈比例
+    :param trailing_stop: 跟踪止损比例
+    :param fill_policy: 成交价规则，见 FILL_POLICIES
+    :return: 每笔交易一个元素的数组字典：column（组合序号）、entry_index、exit_index、
+             entry_price、exit_price、reason（EXIT_REASONS 中的序号）
+    """
+    if fill_policy not in FILL_POLICIES:
+        raise ValueError(f"不支持的成交价规则: {fill_policy}，可选: {', '.join(FILL_POLICIES)}")
+    close = np.asarray(close, dtype=np.float64)
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    open_ = close if open_ is None else np.asarray(open_, dtype=np.float64)
+    signal_matrix = np.asarray(signal_matrix)
+    if signal_matrix.ndim == 1:
+        signal_matrix = signal_matrix[:, None]
+    bars, combos = signal_matrix.shape
+
+    positions = signals_to_positions(as_signal_matrix(signal_matrix))
+    exit_mask, entry_index = trade_bounds(positions)
+    # 按组合、时间顺序排列的所有交易
+    column, exit_index = np.nonzero(exit_mask.T)
+    entry_index = entry_index[exit_index, column]
+    entry_price = close[entry_index]
+    exit_price = close[exit_index].copy()
+    held_at_end = positions[-1].astype(bool) if bars else np.zeros(combos, dtype=bool)
+    reason = np.where((exit_index == bars - 1) & held_at_end[column], 1, 0).astype(np.int8)
+
+    sl = _per_column(stop_loss, combos)[column]
+    tp = _per_column(take_profit, combos)[column]
+    trail = _per_column(trailing_stop, combos)[column]
+    if np.isnan(sl).all() and np.isnan(tp).all() and np.isnan(trail).all():
+        return {'column': column, 'entry_index': entry_index, 'exit_index': exit_index,
+                'entry_price': entry_price, 'exit_price': exit_price, 'reason': reason}
+
+    # 展开每笔交易开仓后到信号平仓（含）之间的K线
+    lengths = exit_index - entry_index
+    trade_id = np.repeat(np.arange(len(column)), lengths)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(lengths) else np.empty(0, dtype=np.int64)
+    bar = entry_index[trade_id] + 1 + (np.arange(len(trade_id)) - starts[trade_id])
+
+    ep = entry_price[trade_id]
+    with np.errstate(invalid='ignore'):
+        stop_level = np.where(np.isnan(sl[trade_id]), -np.inf, ep * (1 - sl[trade_id]))
+        target_level = np.where(np.isnan(tp[trade_id]), np.inf, ep * (1 + tp[trade_id]))
+        trailing_level = np.full(len(bar), -np.inf)
+        if not np.isnan(trail).all():
+            running_high = _segment_cummax(high[bar], trade_id)
+            # 只使用上一根K线及之前的最高价
+            previous_high = np.empty_like(running_high)
+            previous_high[1:] = running_high[:-1]
+            previous_high[starts[lengths > 0]] = -np.inf
+            peak = np.maximum(previous_high, ep)
+            trailing_level = np.where(np.isnan(trail[trade_id]), -np.inf, peak * (1 - trail[trade_id]))
+
+    protective = np.maximum(stop_level, trailing_level)
+    stop_hit = low[bar] <= protective
+    target_hit = high[bar] >= target_level
+    triggered = np.flatnonzero(stop_hit | target_hit)
+    if len(triggered):
+        # 每笔交易第一次触发的位置
+        trades_hit, first = np.unique(trade_id[triggered], return_index=True)
+        position = triggered[first]
+        hit_bar = bar[position]
+        is_stop = stop_hit[position]
+        if fill_policy == 'close':
+            fill = close[hit_bar]
+        else:
+            fill = np.where(is_stop, np.minimum(open_[hit_bar], protective[position]),
+                            np.maximum(open_[hit_bar], target_level[position]))
+        exit_index = exit_index.copy()
+        exit_index[trades_hit] = hit_bar
+        exit_price[trades_hit] = fill
+        stop_reason = np.where(stop_level[position] >= trailing_level[position], 2, 4)
+        reason[trades_hit] = np.where(is_stop, stop_reason, 3)
+
+    return {'column': column, 'entry_index': entry_index, 'exit_index': exit_index,
+            'entry_price': entry_price, 'exit_price': exit_price, 'reason': reason}
+
+
+def batch_backtest_stops(data_df: pd.DataFrame, signal_matrix: np.ndarray, principal: float = 100000.0,
+                         fee_rate: float = 0.001, stop_loss=None, take_profit=None, trailing_stop=None,
+                         fill_policy: str = 'level') -> dict:
+    """
+    带止损/止盈的批量回测，止损参数可以逐组合不同，便于扫描止损比例
+    :param data_df: 包含 '收盘价'、'最高价'、'最低价'（可选 '开盘价'）列的 DataFrame
+    :param signal_matrix: int8 信号矩阵 (bars × combos)
+    :param principal: 本金
+    :param fee_rate: 手续费率
+    :param stop_loss: 止损比例，标量或每个组合一个值
+    :param take_profit: 止盈比例
+    :param trailing_stop: 跟踪止损比例
+    :param fill_policy: 成交价规则
+    :return: 字典，各键均为长度 combos 的数组：total_return、total_return_rate（%）、total_fee、
+             trade_count、win_rate、profit_loss_ratio、stop_count（止损/止盈触发次数）
+    """
+    signal_matrix = np.asarray(signal_matrix)
+    if signal_matrix.ndim == 1:
+        signal_matrix = signal_matrix[:, None]
+    combos = signal_matrix.shape[1]
+    trades = apply_stops(data_df['开盘价'].to_numpy() if '开盘价' in data_df.columns else None,
+                         data_df['最高价'].to_numpy(), data_df['最低价'].to_numpy(), data_df['收盘价'].to_numpy(),
+                         signal_matrix, stop_loss, take_profit, trailing_stop, fill_policy)
+
+    ratio = trades['exit_price'] / trades['entry_price']
+    buy_fee = principal * fee_rate
+    sell_fee = principal * ratio * fee_rate
+    returns = principal * ratio - principal - buy_fee - sell_fee
+    column = trades['column']
+    winning = returns > 0
+
+    trade_count = np.bincount(column, minlength=combos)
+    total_return = np.bincount(column, weights=returns, minlength=combos)
+    total_winning = np.bincount(column, weights=np.where(winning, returns, 0.0), minlength=combos)
+    total_losing = np.bincount(column, weights=np.where(winning, 0.0, np.abs(returns)), minlength=combos)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        win_rate = np.where(trade_count > 0, np.bincount(column, weights=winning, minlength=combos) / np.maximum(trade_count, 1), 0.0)
+        profit_loss_ratio = np.where(total_losing > 0, total_winning / total_losing, np.inf)
+    return {
+        'total_return': total_return,
+        'total_return_rate': total_return / principal * 100 if principal > 0 else np.zeros(combos),
+        'total_fee': np.bincount(column, weights=buy_fee + sell_fee, minlength=combos),
+        'trade_count': trade_count.astype(np.int64),
+        'win_rate': win_rate,
+        'profit_loss_ratio': profit_loss_ratio,
+        'stop_count': np.bincount(column, weights=trades['reason'] >= 2, minlength=combos).astype(np.int64),
+    }
+
+
+def _signal_trades_with_stops(btc_df: pd.DataFrame, signals: pd.Series, stop_loss=None, take_profit=None,
+                              trailing_stop=None, fill_policy: str = 'level') -> dict:
+    """单组信号加入止损/止盈后的所有交易（apply_stops 的结果）"""
+    return apply_stops(btc_df['开盘价'].to_numpy() if '开盘价' in btc_df.columns else None,
+                       btc_df['最高价'].to_numpy(), btc_df['最低价'].to_numpy(), btc_df['收盘价'].to_numpy(),
+                       signals_to_matrix([signals]), stop_loss, take_profit, trailing_stop, fill_policy)
+
+
+def extract_trade_prices_with_stops(btc_df: pd.DataFrame, signals: pd.Series, stop_loss: float = None,
+                                    take_profit: float = None, trailing_stop: float = None,
+                                    fill_policy: str = 'level') -> tuple:
+    """
+    加入止损/止盈后每笔交易的开仓价和平仓价，与 calculate_trade_details_with_stops 的交易一一对应，
+    传给 calculate_cost_sensitivity 的 trade_prices 参数
+    :return: (开仓价数组, 平仓价数组)
+    """
+    trades = _signal_trades_with_stops(btc_df, signals, stop_loss, take_profit, trailing_stop, fill_policy)
+    return trades['entry_price'], trades['exit_price']
+
+
+def equity_curve_with_stops(btc_df: pd.DataFrame, signals: pd.Series, principal: float, fee_rate: float,
+                            stop_loss: float = None, take_profit: float = None, trailing_stop: float = None,
+                            fill_policy: str = 'level') -> np.ndarray:
+    """
+    加入止损/止盈后的逐K线权益曲线，记账口径与 batch_backtest.equity_curve 相同：
+    本金 + 已平仓盈亏 + 持仓浮动盈亏（已扣买入手续费），交易与 calculate_trade_details_with_stops 一一对应
+    :return: 长度为 K线数 的权益数组
+    """
+    trades = _signal_trades_with_stops(btc_df, signals, stop_loss, take_profit, trailing_stop, fill_policy)
+    close = btc_df['收盘价'].to_numpy(dtype=np.float64)
+    bars = len(close)
+    entry_index, exit_index = trades['entry_index'], trades['exit_index']
+    entry_price = trades['entry_price']
+    buy_fee = principal * fee_rate
+    ratio = trades['exit_price'] / entry_price
+    realized = np.bincount(exit_index, weights=principal * ratio - principal - buy_fee - principal * ratio * fee_rate,
+                           minlength=bars)
+    # 开仓K线到平仓K线之前为持仓中，同一时间最多一笔交易
+    marks = np.bincount(entry_index, minlength=bars) - np.bincount(exit_index, minlength=bars)
+    holding = np.cumsum(marks[:bars]) > 0
+    trade_id = np.cumsum(np.bincount(entry_index, minlength=bars)[:bars]) - 1
+    with np.errstate(invalid='ignore'):
+        open_pnl = np.where(holding, principal * close / entry_price[np.maximum(trade_id, 0)] - principal - buy_fee, 0.0) \
+            if len(entry_price) else np.zeros(bars)
+    return principal + np.cumsum(realized[:bars]) + open_pnl
+
+
+def calculate_trade_details_with_stops(btc_df: pd.DataFrame, signals: pd.Series, principal: float, fee_rate: float,
+                                       stop_loss: float = None, take_profit: float = None,
+                                       trailing_stop: float = None, fill_policy: str = 'level') -> dict:
+    """
+    带止损/止盈的逐笔交易详情，返回格式与 calculate_trade_details 相同，
+    每笔交易另有 'exit_reason'（平仓原因）
+    :param btc_df: BTC数据DataFrame
+    :param signals: 交易信号Series
+    :param principal: 本金
+    :param fee_rate: 手续费率
+    :param stop_loss: 止损比例
+    :param take_profit: 止盈比例
+    :param trailing_stop: 跟踪止损比例
+    :param fill_policy: 成交价规则
+    :return: 包含交易详情和总体盈亏的字典
+    """
+    trades = _signal_trades_with_stops(btc_df, signals, stop_loss, take_profit, trailing_stop, fill_policy)
+    dates = btc_df['交易时间'].tolist()
+    buy_fee = principal * fee_rate
+    trade_list = []
+    for entry, exit_, buy_price, sell_price, reason in zip(trades['entry_index'].tolist(), trades['exit_index'].tolist(),
+                                                           trades['entry_price'].tolist(), trades['exit_price'].tolist(),
+                                                           trades['reason'].tolist()):
+        sell_fee = principal * (sell_price / buy_price) * fee_rate
+        trade_return = principal * (sell_price / buy_price) - principal - buy_fee - sell_fee
+        trade_list.append({
+            'buy_date': dates[entry],
+            'buy_price': buy_price,
+            'sell_date': dates[exit_],
+            'sell_price': sell_price,
+            'principal': principal,
+            'return': trade_return,
+            'return_rate': trade_return / principal * 100,  # 转换为百分比
+            'fee': buy_fee + sell_fee,
+            'buy_fee': buy_fee,
+            'sell_fee': sell_fee,
+            'hold_days': exit_ - entry,  # 持仓天数
+            'exit_reason': EXIT_REASONS[reason]
+        })
+
+    total_return = sum(trade['return'] for trade in trade_list)
+    winning = [trade['return'] for trade in trade_list if trade['return'] > 0]
+    total_losing = sum(abs(trade['return']) for trade in trade_list if trade['return'] <= 0)
+    return {
+        'trades': trade_list,
+        'total_return': total_return,
+        'total_return_rate': total_return / principal * 100 if principal > 0 else 0,  # 转换为百分比
+        'total_fee': sum(trade['fee'] for trade in trade_list),
+        'trade_count': len(trade_list),
+        'win_rate': len(winning) / len(trade_list) if trade_list else 0,  # 胜率
+        'profit_loss_ratio': sum(winning) / total_losing if total_losing > 0 else float('inf')  # 盈亏比
+    }
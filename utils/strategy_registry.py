@@ -0,0 +1,239 @@
+"""
+策略注册表模块
+启动时扫描一次策略目录，按文件名索引全部策略；策略模块在第一次使用时导入，之后直接复用，
+描述、参数说明等元数据随模块一起缓存，在界面中切换策略不需要重新导入。
+
+每次取用策略时检查文件修改时间，文件被修改过的策略会重新加载，编辑策略后不需要重启程序。
+导入失败（语法错误、缺少依赖等）只影响该策略本身：错误信息记录在注册表中，其他策略照常使用，
+修复文件后下次取用时自动重新导入。
+
+策略目录中的 .rule 文件是表达式规则（见 utils/strategy_rules.py），与策略模块一样注册和使用，
+取用时得到编译好的 RuleStrategy 对象；界面中输入的规则通过 save_rule 保存为 .rule 文件。
+
+常驻进程池的子进程中按模块名导入的仍是旧代码，策略模块重新加载时同时关闭进程池，下次参数优化时重新创建。
+
+注意：重新加载只针对策略文件本身，策略引用的 utils 等模块修改后仍需重启程序。
+"""
+
+import importlib
+import importlib.util
+import os
+import sys
+import threading
+import traceback
+
+from utils.process_pool import shutdown_worker_pool
+from utils.strategy_rules import compile_rule
+
+# 策略目录和对应的包名
+STRATEGY_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '策略')
+STRATEGY_PACKAGE = '策略'
+
+# 表达式规则文件的扩展名
+RULE_EXTENSION = '.rule'
+
+# 默认的策略描述
+DEFAULT_DESCRIPTION = "用于寻找最优参数的量化策略"
+
+
+class StrategyLoadError(ImportError):
+    """策略导入失败"""
+
+
+class StrategyEntry:
+    """注册表中的一个策略：文件路径、已加载的模块和元数据"""
+
+    __slots__ = ('name', 'path', 'mtime', 'module', 'error', 'description', 'param_descriptions', 'rule_text')
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self.mtime = None  # 已加载模块对应的文件修改时间
+        self.module = None
+        self.error = None  # 最近一次导入失败的错误信息
+        self.description = DEFAULT_DESCRIPTION
+        self.param_descriptions = None
+        self.rule_text = None  # 表达式规则的文本，策略模块为 None
+
+    @property
+    def is_rule(self) -> bool:
+        return self.path.endswith(RULE_EXTENSION)
+
+    def _read_metadata(self):
+        """从已加载的模块读取描述和参数说明"""
+        self.description = getattr(self.module, 'STRATEGY_DESCRIPTION', DEFAULT_DESCRIPTION)
+        descriptions = getattr(self.module, 'STRATEGY_PARAM_DESCRIPTIONS', None)
+        self.param_descriptions = list(descriptions) if descriptions is not None else None
+        self.rule_text = getattr(self.module, 'source_text', None)
+
+
+class StrategyRegistry:
+    """策略注册表"""
+
+    def __init__(self, directory: str = STRATEGY_DIR, package: str = STRATEGY_PACKAGE):
+        """
+        :param directory: 策略目录
+        :param package: 策略目录对应的包名，策略以 '包名.文件名' 导入
+        """
+        self.directory = directory
+        self.package = package
+        self._entries = {}
+        self._lock = threading.RLock()
+        self.refresh()
+
+    def refresh(self) -> list:
+        """
+        重新扫描策略目录：加入新文件，移除已删除的文件，已加载的策略保留
+        :return: 策略名称列表（按文件名排序），.py 与 .rule 同名时使用 .py
+        """
+        with self._lock:
+            found = {}
+            if os.path.isdir(self.directory):
+                for item in sorted(os.scandir(self.directory), key=lambda item: item.name.endswith('.py')):
+                    stem, ext = os.path.splitext(item.name)
+                    if item.is_file() and ext in ('.py', RULE_EXTENSION) and not item.name.startswith('_'):
+                        found[stem] = item.path
+            for name in list(self._entries):
+                if name not in found:
+                    del self._entries[name]
+            for name, path in found.items():
+                if name not in self._entries or self._entries[name].path != path:
+                    self._entries[name] = StrategyEntry(name, path)
+            return self.names()
+
+    def names(self) -> list:
+        """策略名称列表（按文件名排序）"""
+        return sorted(self._entries)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def _entry(self, name: str) -> StrategyEntry:
+        """
+        取得策略并确保已加载最新版本：未加载或文件修改时间变化时（重新）导入
+        :return: StrategyEntry，导入失败时 module 为 None、error 为错误信息
+        """
+        entry = self._entries.get(name)
+        if entry is None:
+            # 可能是启动后新增的文件
+            self.refresh()
+            entry = self._entries.get(name)
+            if entry is None:
+                raise KeyError(f"未找到策略: {name}")
+        try:
+            mtime = os.stat(entry.path).st_mtime_ns
+        except OSError:
+            self.refresh()
+            raise KeyError(f"策略文件已删除: {name}")
+        if mtime != entry.mtime:
+            self._load(entry, mtime)
+        return entry
+
+    def _load(self, entry: StrategyEntry, mtime: int):
+        """导入或重新导入策略模块"""
+        module_name = f"{self.package}.{entry.name}"
+        reloading = entry.module is not None
+        try:
+            if entry.is_rule:
+                with open(entry.path, encoding='utf-8') as f:
+                    entry.module = compile_rule(f.read(), entry.name)
+                entry.error = None
+                entry._read_metadata()
+                print(f"{'重新加载' if reloading else '加载'}规则: {entry.name}")
+                entry.mtime = mtime
+                return
+            importlib.invalidate_caches()
+            if reloading:
+                # 字节码缓存只按秒级修改时间和文件大小校验，同一秒内的修改可能读到旧的缓存
+                try:
+                    os.remove(importlib.util.cache_from_source(entry.path))
+                except OSError:
+                    pass
+            if module_name in sys.modules and sys.modules[module_name] is entry.module and reloading:
+                entry.module = importlib.reload(entry.module)
+                # 子进程中已导入的旧模块不会随之更新
+                shutdown_worker_pool()
+            else:
+                # 上次导入失败时 sys.modules 中可能残留不完整的模块
+                sys.modules.pop(module_name, None)
+                entry.module = importlib.import_module(module_name)
+            entry.error = None
+            entry._read_metadata()
+            print(f"{'重新加载' if reloading else '加载'}策略: {entry.name}")
+        except Exception as e:
+            if not entry.is_rule:
+                sys.modules.pop(module_name, None)
+            entry.module = None
+            entry.error = f"{type(e).__name__}: {e}"
+            entry.description = DEFAULT_DESCRIPTION
+            entry.param_descriptions = None
+            entry.rule_text = None
+            if entry.is_rule:
+                print(f"加载规则 {entry.name} 失败: {e}")
+            else:
+                print(f"加载策略 {entry.name} 失败:\n{traceback.format_exc()}")
+        # 失败时也记录修改时间，文件未再修改前不重复导入
+        entry.mtime = mtime
+
+    def get(self, name: str):
+        """
+        获取策略模块（文件修改过时自动重新加载）
+        :param name: 策略名称（不含 .py）
+        :return: 策略模块
+        """
+        with self._lock:
+            entry = self._entry(name)
+            if entry.module is None:
+                raise StrategyLoadError(f"策略 {name} 加载失败: {entry.error}")
+            return entry.module
+
+    def info(self, name: str) -> dict:
+        """
+        策略元数据，导入失败时不抛出异常
+        :param name: 策略名称
+        :return: {'description': 策略描述, 'param_descriptions': 参数说明列表或 None, 'error': 错误信息或 None,
+                  'rule_text': 表达式规则的文本（策略模块为 None）}
+        """
+        with self._lock:
+            entry = self._entry(name)
+            return {'description': entry.description, 'param_descriptions': entry.param_descriptions,
+                    'error': entry.error, 'rule_text': entry.rule_text}
+
+    def save_rule(self, name: str, text: str) -> str:
+        """
+        把表达式规则保存为策略目录中的 .rule 文件并注册
+        :param name: 策略名称
+        :param text: 规则文本
+        :return: 策略名称
+        """
+        name = name.strip()
+        if not name or name.startswith('_') or os.path.basename(name) != name or name.endswith(('.py', RULE_EXTENSION)):
+            raise ValueError(f"策略名称无效: {name!r}")
+        # 先编译一次，规则有误时不写文件
+        compile_rule(text, name)
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and not entry.is_rule:
+                raise ValueError(f"已有同名的策略文件: {name}.py")
+            with open(os.path.join(self.directory, name + RULE_EXTENSION), 'w', encoding='utf-8') as f:
+                f.write(text.rstrip() + '\n')
+            self.refresh()
+        return name
+
+    def errors(self) -> dict:
+        """已尝试加载但失败的策略：名称 -> 错误信息"""
+        return {name: entry.error for name, entry in self._entries.items() if entry.error}
+
+
+# 进程内共享的策略注册表
+_DEFAULT_REGISTRY = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def get_strategy_registry() -> StrategyRegistry:
+    """获取进程内共享的策略注册表（第一次调用时扫描策略目录）"""
+    global _DEFAULT_REGISTRY
+    with _DEFAULT_LOCK:
+        if _DEFAULT_REGISTRY is None:
+            _DEFAULT_REGISTRY = StrategyRegistry()
+        return _DEFAULT_REGISTRY
@@ -0,0 +1,480 @@
+"""
+表达式规则策略模块
+用几行表达式描述简单的择时规则，不必为每条规则单独编写策略文件：
+
+    # EMA 金叉买入、死叉卖出
+    param fast = 12 [5:30]
+    param slow = 26 [10:60:2]
+    require fast < slow
+    buy: cross_above(ema(close, fast), ema(close, slow))
+    sell: cross_below(ema(close, fast), ema(close, slow))
+
+语句以换行或 ; 分隔：
+- param 名称 = 默认值 [起点:终点[:步长]]：声明参数，方括号中的范围用于参数优化
+- require 条件：参数约束（如 fast < slow），参数优化时跳过不满足的组合
+- 名称 = 表达式：定义中间变量
+- buy: 条件 / sell: 条件：买入、卖出事件（同一根K线同时满足时卖出优先），其余K线沿用上一状态
+- 只写一个条件时：条件成立持仓，否则空仓
+- # 之后为注释，第一行注释作为策略描述
+
+表达式使用 Python 语法的子集：数字、+ - * /、比较、and/or/not（或 & | ~）和 FUNCTIONS 中的函数，
+行情列为 open/high/low/close/volume（或 开盘价/最高价/最低价/收盘价/成交量）。
+
+规则解析为表达式 DAG：相同的子表达式（包括交换律、a > b 与 b < a 等写法）只保留一个节点，
+每个节点对整列数据做一次向量化计算；指标节点按 (数据, 代入参数值后的表达式) 放入共享指标缓存，
+参数优化中不同组合共用相同周期的指标。规则对象可以像策略模块一样使用（STRATEGY_PARAMS、equity_signal、
+equity_signal_batch），也可以在进程间传递（子进程按规则文本重新编译）。
+"""
+
+import ast
+import functools
+import re
+
+import numpy as np
+import pandas as pd
+
+from k线图 import indicators
+from utils.batch_backtest import SIGNAL_FLAT, SIGNAL_HOLD, SIGNAL_LONG
+from utils.indicator_cache import get_indicator_cache
+from utils.param_space import Param, ParamSpace, STAGE_BACKTEST, STAGE_INDICATOR, STAGE_SIGNAL
+
+# 行情列别名
+COLUMNS = {
+    'open': '开盘价', 'high': '最高价', 'low': '最低价', 'close': '收盘价', 'volume': '成交量',
+    '开盘价': '开盘价', '最高价': '最高价', '最低价': '最低价', '收盘价': '收盘价', '成交量': '成交量',
+}
+
+# 编译结果缓存的规则条数
+RULE_CACHE_SIZE = 64
+
+
+def _shift(values, n: int) -> np.ndarray:
+    """向后平移 n 根K线，前 n 根为 NaN"""
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(values.shape, np.nan)
+    if n < len(values):
+        out[n:] = values[:len(values) - n]
+    return out
+
+
+def _cross(a, b, above: bool) -> np.ndarray:
+    """a 上穿（above=True）或下穿 b"""
+    a = np.asarray(a, dtype=np.float64)
+    b = np.broadcast_to(np.asarray(b, dtype=np.float64), a.shape)
+    prev_a, prev_b = _shift(a, 1), _shift(b, 1)
+    if above:
+        return (a > b) & (prev_a <= prev_b)
+    return (a < b) & (prev_a >= prev_b)
+
+
+# 函数表：名称 -> (参数类型, 是否为缓存的指标, 实现)
+# 参数类型：'s' 为序列（也可以是数字），'n' 为周期（整数），'k' 为数字；实现的第一个参数为行情列字典
+FUNCTIONS = {
+    'sma': ('sn', True, lambda data, x, n: indicators.sma(x, [n])[0]),
+    'ema': ('sn', True, lambda data, x, n: indicators.ema(x, n)),
+    'std': ('sn', True, lambda data, x, n: indicators.rolling_std(x, n)),
+    'highest': ('sn', True, lambda data, x, n: indicators.rolling_max(x, [n])[0]),
+    'lowest': ('sn', True, lambda data, x, n: indicators.rolling_min(x, [n])[0]),
+    'rsi': ('sn', True, lambda data, x, n: indicators.rsi(x, n)),
+    'atr': ('n', True, lambda data, n: indicators.atr(data['最高价'], data['最低价'], data['收盘价'], n)),
+    'adx': ('n', True, lambda data, n: indicators.adx(data['最高价'], data['最低价'], data['收盘价'], n)[0]),
+    'macd': ('snnn', True, lambda data, x, fast, slow, signal: indicators.macd(x, fast, slow, signal)[0]),
+    'macd_signal': ('snnn', True, lambda data, x, fast, slow, signal: indicators.macd(x, fast, slow, signal)[1]),
+    'macd_hist': ('snnn', True, lambda data, x, fast, slow, signal: indicators.macd(x, fast, slow, signal)[2]),
+    'boll_upper': ('snk', True, lambda data, x, n, k: indicators.bollinger_bands(x, n, k)[1]),
+    'boll_lower': ('snk', True, lambda data, x, n, k: indicators.bollinger_bands(x, n, k)[2]),
+    'ref': ('sn', False, lambda data, x, n: _shift(x, n)),
+    'cross_above': ('ss', False, lambda data, a, b: _cross(a, b, above=True)),
+    'cross_below': ('ss', False, lambda data, a, b: _cross(a, b, above=False)),
+    'abs': ('s', False, lambda data, x: np.abs(x)),
+    'max': ('ss', False, lambda data, a, b: np.maximum(a, b)),
+    'min': ('ss', False, lambda data, a, b: np.minimum(a, b)),
+}
+
+# 不通过参数、直接从行情列字典读取数据的函数 -> 用到的行情列
+_FUNCTION_COLUMNS = {
+    'atr': ('最高价', '最低价', '收盘价'),
+    'adx': ('最高价', '最低价', '收盘价'),
+}
+
+# 运算符：名称 -> 实现
+_OPERATORS = {
+    'add': np.add, 'sub': np.subtract, 'mul': np.multiply, 'div': np.divide, 'neg': np.negative,
+    'lt': np.less, 'le': np.less_equal, 'eq': np.equal, 'ne': np.not_equal,
+    'and': np.logical_and, 'or': np.logical_or, 'not': np.logical_not,
+}
+_COMMUTATIVE = {'add', 'mul', 'eq', 'ne', 'and', 'or'}
+_LOGICAL = {'and', 'or', 'not'}
+_BOOLEAN = {'lt', 'le', 'eq', 'ne', 'and', 'or', 'not', 'cross_above', 'cross_below'}
+
+_BINARY = {ast.Add: 'add', ast.Sub: 'sub', ast.Mult: 'mul', ast.Div: 'div', ast.BitAnd: 'and', ast.BitOr: 'or'}
+# 比较统一为 lt/le/eq/ne，a > b 记为 b < a，便于识别相同的子表达式
+_COMPARE = {ast.Lt: ('lt', False), ast.LtE: ('le', False), ast.Gt: ('lt', True), ast.GtE: ('le', True),
+            ast.Eq: ('eq', False), ast.NotEq: ('ne', False)}
+
+_PARAM_PATTERN = re.compile(r'^(?:param|参数)\s+(\w+)\s*=\s*([-+]?[\d.]+)\s*(?:\[([^\]]*)\])?$')
+_REQUIRE_PATTERN = re.compile(r'^(?:require|约束)\s+(.+)$')
+_EVENT_PATTERN = re.compile(r'^(buy|sell|买入|卖出)\s*[:：]\s*(.+)$')
+_DEFINE_PATTERN = re.compile(r'^(\w+)\s*=(?!=)\s*(.+)$')
+_EVENTS = {'buy': 'buy', '买入': 'buy', 'sell': 'sell', '卖出': 'sell'}
+
+
+class _Compiler:
+    """把规则语句编译为表达式 DAG：节点按 (运算, 子节点) 去重，子节点总是排在父节点之前"""
+
+    def __init__(self):
+        self.nodes = []  # (运算, 参数)，参数为子节点编号或常量/名称
+        self.scalar = []  # 节点是否为标量（只依赖常数和参数）
+        self.boolean = []  # 节点是否为条件
+        self._index = {}
+        self.names = {}  # 中间变量 -> 节点编号
+        self.params = {}  # 参数名 -> (默认值字符串, 范围字符串)
+        self.period_params = set()  # 用作指标周期的参数
+
+    def _node(self, op: str, args: tuple, scalar: bool, boolean: bool) -> int:
+        key = (op, args)
+        if key not in self._index:
+            self._index[key] = len(self.nodes)
+            self.nodes.append(key)
+            self.scalar.append(scalar)
+            self.boolean.append(boolean)
+        return self._index[key]
+
+    def _apply(self, op: str, args: list) -> int:
+        if op in _LOGICAL and not all(self.boolean[a] for a in args):
+            raise ValueError("and/or/not 只能用于条件")
+        if op in _COMMUTATIVE:
+            args = sorted(args)
+        return self._node(op, tuple(args), all(self.scalar[a] for a in args), op in _BOOLEAN)
+
+    def _params_in(self, index: int) -> set:
+        """节点依赖的参数名"""
+        op, args = self.nodes[index]
+        if op == 'param':
+            return {args[0]}
+        if op in ('const', 'col'):
+            return set()
+        return set().union(*(self._params_in(a) for a in args))
+
+    def expression(self, text: str) -> int:
+        """编译一个表达式，返回节点编号"""
+        try:
+            tree = ast.parse(text.strip(), mode='eval')
+        except SyntaxError:
+            raise ValueError(f"表达式语法错误: {text.strip()}")
+        return self._visit(tree.body)
+
+    def _visit(self, node) -> int:
+        if isinstance(node, ast.Constant) and isinstance(node.value, (bool, int, float)):
+            # 类型也作为键的一部分，避免 True 与 1 被当成同一个节点
+            return self._node('const', (node.value, type(node.value).__name__), True, isinstance(node.value, bool))
+        if isinstance(node, ast.Name):
+            if node.id in self.names:
+                return self.names[node.id]
+            if node.id in self.params:
+                return self._node('param', (node.id,), True, False)
+            if node.id in COLUMNS:
+                return self._node('col', (COLUMNS[node.id],), False, False)
+            raise ValueError(f"未定义的名称: {node.id}（参数需先用 param 声明）")
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+            return self._apply(_BINARY[type(node.op)], [self._visit(node.left), self._visit(node.right)])
+        if isinstance(node, ast.UnaryOp):
+            operand = self._visit(node.operand)
+            if isinstance(node.op, ast.UAdd):
+                return operand
+            if isinstance(node.op, ast.USub):
+                return self._apply('neg', [operand])
+            return self._apply('not', [operand])
+        if isinstance(node, ast.BoolOp):
+            op = 'and' if isinstance(node.op, ast.And) else 'or'
+            return functools.reduce(lambda a, b: self._apply(op, [a, b]), [self._visit(v) for v in node.values])
+        if isinstance(node, ast.Compare):
+            # 连续比较 a < b < c 拆为 a < b and b < c
+            operands = [self._visit(node.left)] + [self._visit(v) for v in node.comparators]
+            parts = []
+            for k, operator in enumerate(node.ops):
+                if type(operator) not in _COMPARE:
+                    raise ValueError(f"不支持的比较运算: {ast.unparse(node) if hasattr(ast, 'unparse') else type(operator).__name__}")
+                op, swap = _COMPARE[type(operator)]
+                left, right = operands[k], operands[k + 1]
+                parts.append(self._apply(op, [right, left] if swap else [left, right]))
+            return functools.reduce(lambda a, b: self._apply('and', [a, b]), parts)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            name = node.func.id
+            if name not in FUNCTIONS:
+                raise ValueError(f"未知的函数: {name}，可用: {', '.join(FUNCTIONS)}")
+            kinds = FUNCTIONS[name][0]
+            if len(node.args) != len(kinds):
+                raise ValueError(f"{name} 需要 {len(kinds)} 个参数，传入 {len(node.args)} 个")
+            args = [self._visit(arg) for arg in node.args]
+            for arg, kind in zip(args, kinds):
+                if kind in 'nk' and not self.scalar[arg]:
+                    raise ValueError(f"{name} 的周期/系数参数必须是数字或参数")
+                if kind == 'n':
+                    self.period_params.update(self._params_in(arg))
+            return self._node(name, tuple(args), False, name in _BOOLEAN)
+        raise ValueError(f"不支持的语法: {ast.unparse(node) if hasattr(ast, 'unparse') else type(node).__name__}")
+
+    def reachable(self, outputs: list) -> list:
+        """输出依赖的全部节点编号（升序，即计算顺序）"""
+        needed = set()
+        stack = [index for index in outputs if index is not None]
+        while stack:
+            index = stack.pop()
+            if index in needed:
+                continue
+            needed.add(index)
+            op, args = self.nodes[index]
+            if op not in ('const', 'param', 'col'):
+                stack.extend(args)
+        return sorted(needed)
+
+
+def _make_param(name: str, default: str, bounds: str, stage: str) -> Param:
+    """由 param 语句生成参数声明：默认值和范围都不含小数点时为整数参数"""
+    parts = [part.strip() for part in bounds.split(':')] if bounds else []
+    if bounds and not 2 <= len(parts) <= 3:
+        raise ValueError(f"参数 {name} 的范围应为 [起点:终点] 或 [起点:终点:步长]，输入为 [{bounds}]")
+    kind = float if any('.' in text for text in [default] + parts) else int
+    if stage == STAGE_INDICATOR and kind is not int:
+        raise ValueError(f"参数 {name} 用作指标周期，应为整数")
+    try:
+        numbers = [kind(text) for text in [default] + parts]
+    except ValueError:
+        raise ValueError(f"参数 {name} 的默认值或范围不是数字")
+    low, high = (numbers[1], numbers[2]) if bounds else (None, None)
+    step = numbers[3] if len(numbers) > 3 else None
+    if bounds and kind is float and not step:
+        raise ValueError(f"小数参数 {name} 的范围需要写步长，如 [{parts[0]}:{parts[1]}:0.5]")
+    # 范围只是参数优化的默认范围，回测时可以取范围外的值；指标周期至少为 1
+    return Param(name, kind, numbers[0], low=1 if stage == STAGE_INDICATOR else None, search_low=low,
+                 search_high=high, step=step, stage=stage, label=name)
+
+
+class RuleStrategy:
+    """
+    编译好的表达式规则，用法与策略模块相同：
+    STRATEGY_DESCRIPTION、STRATEGY_PARAMS、STRATEGY_PARAM_DESCRIPTIONS、equity_signal、equity_signal_batch
+    """
+
+    def __init__(self, text: str, name: str = None):
+        """
+        :param text: 规则文本
+        :param name: 规则名称（注册表中的策略名）
+        """
+        self.source_text = text
+        self.name = name or '表达式规则'
+        compiler = _Compiler()
+        description = None
+        outputs = {}
+        declared = []
+        requires = []
+        for number, raw in enumerate(re.split(r'[\n;]', text), 1):
+            line, _, comment = raw.partition('#')
+            line = line.strip()
+            if not line:
+                if description is None and comment.strip():
+                    description = comment.strip()
+                continue
+            try:
+                match = _PARAM_PATTERN.match(line)
+                if match:
+                    param_name, default, bounds = match.groups()
+                    if param_name in compiler.params or param_name in COLUMNS or param_name in FUNCTIONS:
+                        raise ValueError(f"参数名 {param_name} 重复或与行情列、函数重名")
+                    compiler.params[param_name] = (default, bounds)
+                    declared.append(param_name)
+                    continue
+                match = _REQUIRE_PATTERN.match(line)
+                if match:
+                    index = compiler.expression(match.group(1))
+                    if not (compiler.scalar[index] and compiler.boolean[index]):
+                        raise ValueError("require 只能是参数之间的比较条件")
+                    requires.append(index)
+                    continue
+                match = _EVENT_PATTERN.match(line)
+                if match:
+                    event, expression = _EVENTS[match.group(1)], match.group(2)
+                else:
+                    match = _DEFINE_PATTERN.match(line)
+                    if match:
+                        variable = match.group(1)
+                        if variable in compiler.params or variable in COLUMNS:
+                            raise ValueError(f"变量名 {variable} 与参数或行情列重名")
+                        compiler.names[variable] = compiler.expression(match.group(2))
+                        continue
+                    event, expression = 'state', line
+                if event in outputs:
+                    raise ValueError(f"{event} 条件重复")
+                index = compiler.expression(expression)
+                if not compiler.boolean[index]:
+                    raise ValueError("结果必须是条件（比较、交叉或 and/or/not 的组合）")
+                outputs[event] = index
+            except ValueError as e:
+                raise ValueError(f"规则第 {number} 行有误: {e}\n{raw.strip()}") from None
+        if not outputs:
+            raise ValueError("规则中没有条件：写一个持仓条件，或 buy: / sell: 条件")
+        if 'state' in outputs and len(outputs) > 1:
+            raise ValueError("持仓条件不能与 buy/sell 条件同时使用")
+
+        self._nodes = compiler.nodes
+        self._scalar = compiler.scalar
+        self._outputs = outputs
+        self._order = compiler.reachable(list(outputs.values()))
+        nodes = [self._nodes[i] for i in self._order]
+        self._columns = sorted({args[0] for op, args in nodes if op == 'col'} | {'收盘价'}
+                               | {column for op, _ in nodes for column in _FUNCTION_COLUMNS.get(op, ())})
+        params = [_make_param(param_name, *compiler.params[param_name],
+                              STAGE_INDICATOR if param_name in compiler.period_params else STAGE_SIGNAL)
+                  for param_name in declared]
+        # 参数优化按位置传参：指标周期参数排在前面，网格中相邻的组合共用同一组指标
+        params.sort(key=lambda param: param.stage != STAGE_INDICATOR)
+        params += [
+            Param('principal', float, 100000.0, low=0.0, stage=STAGE_BACKTEST, label='本金金额', example=100000),
+            Param('fee_rate', float, 0.001, low=0.0, high=1.0, stage=STAGE_BACKTEST, label='手续费率'),
+            Param('stops', str, '', stage=STAGE_BACKTEST, label='止损/止盈/跟踪止损', example='0.05/0.1/0.03'),
+        ]
+        constraints = [functools.partial(self._check, index) for index in requires]
+        self.STRATEGY_PARAMS = ParamSpace(params, constraints=constraints)
+        self.STRATEGY_PARAM_DESCRIPTIONS = self.STRATEGY_PARAMS.descriptions()
+        self.STRATEGY_DESCRIPTION = description or f"表达式规则: {'; '.join(line.strip() for line in text.splitlines() if line.strip())}"
+
+    def __reduce__(self):
+        # 传给子进程时只传规则文本，子进程中重新编译（同一文本只编译一次）
+        return compile_rule, (self.source_text, self.name)
+
+    def __repr__(self):
+        return f"RuleStrategy({self.name!r})"
+
+    def _check(self, index: int, values: dict) -> bool:
+        """计算约束条件"""
+        results = {}
+        for i in self._reachable_scalar(index):
+            op, args = self._nodes[i]
+            results[i] = self._apply(op, args, results, values, None)
+        return bool(results[index])
+
+    def _reachable_scalar(self, index: int) -> list:
+        needed, stack = set(), [index]
+        while stack:
+            i = stack.pop()
+            if i not in needed:
+                needed.add(i)
+                op, args = self._nodes[i]
+                if op not in ('const', 'param'):
+                    stack.extend(args)
+        return sorted(needed)
+
+    @staticmethod
+    def _apply(op: str, args: tuple, results: dict, values: dict, data: dict):
+        """计算一个非指标节点"""
+        if op == 'const':
+            return args[0]
+        if op == 'param':
+            return values[args[0]]
+        if op == 'col':
+            return data[args[0]]
+        inputs = [results[a] for a in args]
+        if op in _OPERATORS:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return _OPERATORS[op](*inputs)
+        return FUNCTIONS[op][2](data, *inputs)
+
+    def evaluate(self, data_df: pd.DataFrame, values: dict) -> dict:
+        """
+        对整列数据计算规则的各个条件
+        :param data_df: 行情数据
+        :param values: 参数字典
+        :return: {'buy'/'sell'/'state': 布尔数组}
+        """
+        missing = [column for column in self._columns if column not in data_df.columns]
+        if missing:
+            raise ValueError(f"数据中缺少列: {missing}")
+        bars = len(data_df)
+        cache = get_indicator_cache()
+        data = {column: data_df[column].to_numpy(dtype=np.float64) for column in self._columns}
+        # 指标节点的缓存键：代入参数值后的表达式 + 各行情列的数据指纹
+        data_key = tuple(cache.fingerprint(data[column]) for column in self._columns)
+        results, keys = {}, {}
+        for index in self._order:
+            op, args = self._nodes[index]
+            if op == 'const':
+                keys[index] = args
+            elif op == 'param':
+                keys[index] = (values[args[0]],)
+            elif op == 'col':
+                keys[index] = args
+            else:
+                keys[index] = (op,) + tuple(keys[a] for a in args)
+            if op in FUNCTIONS:
+                kinds, cached, compute = FUNCTIONS[op]
+                inputs = [results[a] for a in args]
+                for k, kind in enumerate(kinds):
+                    if kind == 'n':
+                        period = inputs[k]
+                        if period != int(period) or period < 1:
+                            raise ValueError(f"{op} 的周期应为正整数，输入为 {period}")
+                        inputs[k] = int(period)
+                if cached:
+                    results[index] = cache.get(data['收盘价'], 'strategy_rules', (keys[index], data_key),
+                                               functools.partial(compute, data, *inputs))
+                else:
+                    results[index] = compute(data, *inputs)
+            else:
+                results[index] = self._apply(op, args, results, values, data)
+        return {event: np.broadcast_to(np.asarray(results[index], dtype=bool), (bars,))
+                for event, index in self._outputs.items()}
+
+    def signal_array(self, data_df: pd.DataFrame, values: dict) -> np.ndarray:
+        """
+        生成信号数组
+        :return: 1=做多，0=空仓，NaN=沿用上一状态
+        """
+        conditions = self.evaluate(data_df, values)
+        if 'state' in conditions:
+            return conditions['state'].astype(np.float64)
+        signals = np.full(len(data_df), np.nan)
+        if 'buy' in conditions:
+            signals[conditions['buy']] = 1.0
+        if 'sell' in conditions:
+            signals[conditions['sell']] = 0.0
+        return signals
+
+    def __call__(self, btc_df: pd.DataFrame, *args) -> pd.Series:
+        """
+        equity_signal：按规则生成择时信号
+        :param btc_df: 行情数据
+        :param args: 按 STRATEGY_PARAMS 的顺序传入的参数，留空的使用默认值
+        :return: 信号Series（1=做多，0=空仓，NaN=沿用上一状态）
+        """
+        values = self.STRATEGY_PARAMS.validate(self.STRATEGY_PARAMS.bind(args))
+        return pd.Series(self.signal_array(btc_df, values), index=btc_df.index)
+
+    @property
+    def equity_signal(self):
+        return self
+
+    def equity_signal_batch(self, btc_df: pd.DataFrame, param_grid) -> np.ndarray:
+        """
+        一次生成多组参数的信号矩阵，参数优化时使用
+        :param btc_df: 行情数据
+        :param param_grid: 参数组合列表，每个组合按 STRATEGY_PARAMS 的顺序排列
+        :return: (K线数 × 组合数) 的 int8 信号矩阵
+        """
+        matrix = np.full((len(btc_df), len(param_grid)), SIGNAL_HOLD, dtype=np.int8)
+        for j, combination in enumerate(param_grid):
+            signals = self.signal_array(btc_df, self.STRATEGY_PARAMS.bind(tuple(combination)))
+            matrix[signals == 1.0, j] = SIGNAL_LONG
+            matrix[signals == 0.0, j] = SIGNAL_FLAT
+        return matrix
+
+
+@functools.lru_cache(maxsize=RULE_CACHE_SIZE)
+def compile_rule(text: str, name: str = None) -> RuleStrategy:
+    """
+    编译规则文本（同一文本只编译一次）
+    :param text: 规则文本
+    :param name: 规则名称
+    :return: RuleStrategy
+    """
+    return RuleStrategy(text, name)
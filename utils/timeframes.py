@@ -0,0 +1,163 @@
+"""
+多周期数据对齐模块
+策略模块可以声明需要的其他周期或其他数据集，例如在 1h 数据上使用 1d 均线过滤：
+
+    STRATEGY_TIMEFRAMES = ['1d']                         # 同一币种的其他周期
+    STRATEGY_TIMEFRAMES = {'eth': 'eth_data_1h.csv'}     # 同目录下的其他数据文件，键为列名前缀
+
+回测或参数优化开始前，由 prepare_strategy_data 一次性读取这些文件并计算 as-of 对齐行号，
+把对齐后的列以 '前缀_列名'（如 '1d_收盘价'）加入传给策略的 DataFrame。
+对齐不使用未来数据：主周期K线收盘时，只能看到在此之前已经收盘的高周期K线。
+参数优化的所有组合共用同一份对齐结果（多进程模式下随行情数据一起放入共享内存），不会重复读取和对齐。
+"""
+
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# 已对齐数据的缓存数量（同一数据文件反复回测、优化时直接复用）
+PREPARED_CACHE_SIZE = 4
+
+_PREPARED = OrderedDict()
+
+# 对齐时默认加入的列
+DEFAULT_TIMEFRAME_COLUMNS = ('开盘价', '最高价', '最低价', '收盘价', '成交量')
+
+
+def bar_close_times(times, cap_gaps: bool = False) -> np.ndarray:
+    """
+    由K线开盘时间得到收盘时间：下一根K线的开盘时间，最后一根按K线间隔的中位数推算
+    （按下一根开盘时间计算，月线等不等长的周期也准确）
+    数据有缺口时，缺口前一根K线按下一根开盘时间计算会晚于实际收盘时间：
+    用于判断"已经收盘"的其他数据时这样更保守，用于主周期则会看到未来数据，此时 cap_gaps=True，
+    收盘时间不晚于开盘时间加K线间隔的中位数
+    :param times: K线开盘时间（升序）
+    :param cap_gaps: 是否按K线间隔中位数限制缺口前K线的收盘时间
+    :return: datetime64[ns] 数组
+    """
+    times = pd.to_datetime(pd.Series(times), format='ISO8601').to_numpy(dtype='datetime64[ns]')
+    close_times = np.empty_like(times)
+    if len(times) == 0:
+        return close_times
+    close_times[:-1] = times[1:]
+    step = np.timedelta64(int(np.median(np.diff(times).astype(np.int64)) if len(times) > 1 else 0), 'ns')
+    close_times[-1] = times[-1] + step
+    if cap_gaps:
+        close_times = np.minimum(close_times, times + step)
+    return close_times
+
+
+def asof_index(base_times, other_times) -> np.ndarray:
+    """
+    计算 as-of 对齐行号：主周期每根K线收盘时，其他数据中最近一根已经收盘的K线行号
+    :param base_times: 主周期K线开盘时间（升序）
+    :param other_times: 其他数据的K线开盘时间（升序）
+    :return: int64 行号数组，长度等于主周期K线数，尚无已收盘K线时为 -1
+    """
+    # 主周期缺口前的K线不能按下一根开盘时间收盘，否则会对齐到缺口期间才收盘的数据
+    base_close = bar_close_times(base_times, cap_gaps=True)
+    other_close = bar_close_times(other_times)
+    return np.searchsorted(other_close, base_close, side='right').astype(np.int64) - 1
+
+
+def align_columns(index: np.ndarray, other_df: pd.DataFrame, columns=DEFAULT_TIMEFRAME_COLUMNS) -> dict:
+    """
+    按对齐行号取出其他数据的列（向前填充，没有已收盘K线的位置为 NaN）
+    :param index: asof_index 的结果
+    :param other_df: 其他数据的 DataFrame
+    :param columns: 需要对齐的列，缺少的列跳过
+    :return: 列名 -> 只读 float64 数组
+    """
+    aligned = {}
+    missing = index < 0
+    for column in columns:
+        if column not in other_df.columns:
+            continue
+        values = other_df[column].to_numpy(dtype=np.float64)[np.maximum(index, 0)]
+        values[missing] = np.nan
+        values.flags.writeable = False
+        aligned[column] = values
+    return aligned
+
+
+def timeframe_specs(strategy_module) -> dict:
+    """
+    读取策略模块声明的其他周期/数据集
+    :param strategy_module: 策略模块
+    :return: 列名前缀 -> 周期或文件名，没有声明时为空字典
+    """
+    specs = getattr(strategy_module, 'STRATEGY_TIMEFRAMES', None) or {}
+    if not isinstance(specs, dict):
+        specs = {spec: spec for spec in specs}
+    return dict(specs)
+
+
+def resolve_timeframe_path(base_path: str, spec: str) -> str:
+    """
+    由主数据文件路径和声明得到其他数据文件路径
+    :param base_path: 主数据文件路径，如 数据/btc_data_1h.csv
+    :param spec: 周期（如 '1d'，替换文件名中的周期部分）或同目录下的文件名/路径
+    :return: 数据文件路径
+    """
+    directory, name = os.path.split(base_path)
+    if spec.endswith('.csv'):
+        return spec if os.path.isabs(spec) else os.path.join(directory, spec)
+    stem, ext = os.path.splitext(name)
+    if '_data_' not in stem:
+        raise ValueError(f"无法从文件名 {name} 推断周期，请在 STRATEGY_TIMEFRAMES 中直接写文件名")
+    return os.path.join(directory, stem.rsplit('_', 1)[0] + f"_{spec}{ext}")
+
+
+def add_timeframes(data_df: pd.DataFrame, frames: dict, columns=DEFAULT_TIMEFRAME_COLUMNS) -> pd.DataFrame:
+    """
+    把其他周期/数据集的列对齐后加入主数据
+    :param data_df: 主周期数据，需包含 '交易时间' 列
+    :param frames: 列名前缀 -> 其他数据的 DataFrame（需包含 '交易时间' 列）
+    :param columns: 需要对齐的列
+    :return: 新的 DataFrame，原有列不变，新增 '前缀_列名' 列
+    """
+    extra = {}
+    for prefix, other_df in frames.items():
+        index = asof_index(data_df['交易时间'], other_df['交易时间'])
+        for column, values in align_columns(index, other_df, columns).items():
+            extra[f"{prefix}_{column}"] = values
+    if not extra:
+        return data_df
+    return pd.concat([data_df, pd.DataFrame(extra, index=data_df.index)], axis=1)
+
+
+def prepare_strategy_data(strategy_module, data_df: pd.DataFrame, base_path: str) -> pd.DataFrame:
+    """
+    按策略声明加载并对齐其他周期/数据集，结果按数据文件、数据范围和声明缓存
+    :param strategy_module: 策略模块
+    :param data_df: 主周期数据
+    :param base_path: 主数据文件路径
+    :return: 加入对齐列后的 DataFrame；策略没有声明时原样返回 data_df
+    """
+    specs = timeframe_specs(strategy_module)
+    if not specs or data_df is None or data_df.empty:
+        return data_df
+
+    paths = {prefix: resolve_timeframe_path(base_path, spec) for prefix, spec in specs.items()}
+    for path in paths.values():
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"策略需要的数据文件不存在: {path}")
+    # 其他数据文件被更新（修改时间变化）后重新对齐
+    key = (os.path.abspath(base_path), tuple(sorted((prefix, path, os.path.getmtime(path)) for prefix, path in paths.items())),
+           len(data_df), str(data_df['交易时间'].iloc[0]), str(data_df['交易时间'].iloc[-1]))
+    if key in _PREPARED:
+        _PREPARED.move_to_end(key)
+        return _PREPARED[key]
+
+    frames = {}
+    for prefix, path in paths.items():
+        frames[prefix] = pd.read_csv(path)
+        print(f"已加载 {prefix} 数据: {os.path.basename(path)}，{len(frames[prefix])} 条")
+    prepared = add_timeframes(data_df, frames)
+
+    _PREPARED[key] = prepared
+    while len(_PREPARED) > PREPARED_CACHE_SIZE:
+        _PREPARED.popitem(last=False)
+    return prepared
@@ -0,0 +1,204 @@
+"""
+滚动前推（Walk-Forward）分析模块
+在每个训练窗口上选出最优参数，再在紧随其后的测试窗口上检验，
+把各测试窗口的样本外权益拼接成一条连续的曲线。
+每个参数组合的信号在完整数据上只生成一次，所有折的训练/测试窗口都从同一份信号矩阵切片回测，
+因此折数增加时主要开销不变；参数组合按批分配到常驻进程池，行情数据通过共享内存共享
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from utils.batch_backtest import batch_backtest, equity_curve, signals_to_matrix
+from utils.indicator_bank import MovingAverageBank, accepts_ma_bank
+from utils.money_management import calculate_trade_details
+
+# 支持的窗口方式
+WINDOW_MODES = ('rolling', 'anchored')
+
+
+def make_folds(n_bars: int, n_folds: int = 10, train_ratio: float = 4.0, mode: str = 'rolling') -> list:
+    """
+    划分训练/测试窗口（左闭右开的K线序号区间）
+    数据划分为 1 个初始训练段 + n_folds 个等长测试段，训练段长度为测试段的 train_ratio 倍
+    :param n_bars: K线数量
+    :param n_folds: 折数
+    :param train_ratio: 训练窗口长度 / 测试窗口长度
+    :param mode: 'rolling' 为固定长度滚动窗口，'anchored' 为训练窗口起点固定在数据开头
+    :return: [(训练开始, 训练结束, 测试开始, 测试结束), ...]
+    """
+    if mode not in WINDOW_MODES:
+        raise ValueError(f"不支持的窗口方式: {mode}，可选: {', '.join(WINDOW_MODES)}")
+    n_folds = max(1, int(n_folds))
+    test_size = int(n_bars // (train_ratio + n_folds))
+    train_size = n_bars - test_size * n_folds
+    if test_size < 2 or train_size < 2:
+        raise ValueError(f"数据量 {n_bars} 不足以划分 {n_folds} 折")
+
+    folds = []
+    for k in range(n_folds):
+        test_start = train_size + k * test_size
+        test_end = n_bars if k == n_folds - 1 else test_start + test_size
+        train_start = 0 if mode == 'anchored' else test_start - train_size
+        folds.append((train_start, test_start, test_start, test_end))
+    return folds
+
+
+def evaluate_window_chunk(data_df: pd.DataFrame, strategy_func, chunk: list, windows: list,
+                          principal: float, fee_rate: float, ma_bank: MovingAverageBank = None) -> list:
+    """
+    在完整数据上生成一批参数组合的信号，再按各窗口切片批量回测
+    :param data_df: 完整行情数据
+    :param strategy_func: 策略函数（信号只能依赖当前及之前的K线）
+    :param chunk: [(组合序号, 参数元组), ...]
+    :param windows: [(开始, 结束), ...]
+    :param principal: 本金
+    :param fee_rate: 手续费率
+    :param ma_bank: 共享的均线库（可选）
+    :return: [(组合序号, 各窗口收益率数组, 各窗口夏普数组, 错误信息), ...]
+    """
+    if ma_bank is not None and accepts_ma_bank(strategy_func):
+        ma_bank.ensure({int(w) for _, combination in chunk for w in combination[:2]})
+        strategy_func = partial(strategy_func, ma_bank=ma_bank)
+
+    results = []
+    valid = []
+    signal_list = []
+    for index, combination in chunk:
+        try:
+            signal_list.append(strategy_func(data_df, *combination))
+            valid.append(index)
+        except Exception as e:
+            empty = np.full(len(windows), -np.inf)
+            results.append((index, empty, empty.copy(), str(e)))
+    if not valid:
+        return results
+
+    close = data_df['收盘价'].to_numpy(dtype=np.float64)
+    matrix = signals_to_matrix(signal_list)
+    returns = np.empty((len(valid), len(windows)))
+    sharpes = np.empty((len(valid), len(windows)))
+    for w, (start, end) in enumerate(windows):
+        # 切片后从空仓开始，窗口首根K线信号为做多时按该K线收盘价开仓
+        metrics = batch_backtest(close[start:end], matrix[start:end], principal, fee_rate)
+        returns[:, w] = metrics['total_return_rate'] / 100.0
+        sharpes[:, w] = metrics['sharpe']
+    for row, index in enumerate(valid):
+        results.append((index, returns[row], sharpes[row], None))
+    return results
+
+
+def _evaluate_window_chunk_shared(descriptor: dict, strategy_func, chunk: list, windows: list,
+                                  principal: float, fee_rate: float) -> list:
+    """子进程入口：挂载共享行情数据并复用子进程内的均线库"""
+    from utils.process_pool import attach_market_data
+
+    dataset = attach_market_data(descriptor)
+    ma_bank = None
+    if accepts_ma_bank(strategy_func):
+        ma_bank = dataset.get('ma_bank')
+        if ma_bank is None:
+            ma_bank = dataset['ma_bank'] = MovingAverageBank(dataset['data_df']['收盘价'])
+    return evaluate_window_chunk(dataset['data_df'], strategy_func, chunk, windows, principal, fee_rate, ma_bank)
+
+
+def iter_window_results(data_df: pd.DataFrame, strategy_func, combinations: list, windows: list,
+                        principal: float, fee_rate: float, executor: str = 'process', max_workers: int = None):
+    """
+    并行评估所有参数组合在各窗口上的表现
+    :param data_df: 完整行情数据
+    :param strategy_func: 策略函数
+    :param combinations: 参数元组列表
+    :param windows: [(开始, 结束), ...]
+    :param principal: 本金
+    :param fee_rate: 手续费率
+    :param executor: 'process' 为共享内存 + 常驻进程池，'thread' 为线程池
+    :param max_workers: 并行数
+    :return: 生成器，按完成顺序产出每批结果列表
+    """
+    if not combinations:
+        return
+    if max_workers is None:
+        max_workers = 4
+    indexed = list(enumerate(combinations))
+    # 每批组合数兼顾负载均衡和信号矩阵内存（bars × 批大小 的 int8 矩阵）
+    chunk_size = max(1, min(64, len(indexed) // (max_workers * 8)))
+    chunks = [indexed[i:i + chunk_size] for i in range(0, len(indexed), chunk_size)]
+
+    if executor == 'process':
+        from utils.process_pool import SharedMarketData, get_worker_pool, shutdown_worker_pool
+        from concurrent.futures.process import BrokenProcessPool
+
+        pool = get_worker_pool(max_workers)
+        with SharedMarketData(data_df) as market_data:
+            futures = [pool.submit(_evaluate_window_chunk_shared, market_data.descriptor, strategy_func,
+                                   chunk, windows, principal, fee_rate) for chunk in chunks]
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            except BrokenProcessPool:
+                shutdown_worker_pool()
+                raise
+            finally:
+                for future in futures:
+                    future.cancel()
+        return
+
+    ma_bank = MovingAverageBank(data_df['收盘价']) if accepts_ma_bank(strategy_func) else None
+    if ma_bank is not None:
+        # 线程共享的均线库提前补齐全部周期，线程中只读
+        ma_bank.ensure({int(w) for combination in combinations for w in combination[:2]})
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(evaluate_window_chunk, data_df, strategy_func, chunk, windows,
+                               principal, fee_rate, ma_bank) for chunk in chunks]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def out_of_sample_run(data_df: pd.DataFrame, strategy_func, folds: list, fold_params: list,
+                      principal: float, fee_rate: float) -> dict:
+    """
+    按各折选出的参数在测试窗口回测，并拼接样本外权益曲线
+    :param data_df: 完整行情数据
+    :param strategy_func: 策略函数
+    :param folds: make_folds 的返回值
+    :param fold_params: 每折选出的参数元组
+    :param principal: 本金
+    :param fee_rate: 手续费率
+    :return: {'fold_details': 每折测试窗口的交易详情, 'equity': 样本外权益Series, 'trades': 全部样本外交易}
+    """
+    close = data_df['收盘价'].to_numpy(dtype=np.float64)
+    signal_cache = {}
+    fold_details = []
+    equity_parts = []
+    trades = []
+    offset = 0.0  # 之前各折累计的盈亏
+    for (_, _, test_start, test_end), combination in zip(folds, fold_params):
+        # 信号在完整数据上生成（指标有足够的预热数据），相同参数只生成一次
+        if combination not in signal_cache:
+            signal_cache[combination] = strategy_func(data_df, *combination)
+        signals = signal_cache[combination].iloc[test_start:test_end]
+        test_df = data_df.iloc[test_start:test_end]
+        details = calculate_trade_details(test_df, signals, principal, fee_rate)
+        fold_details.append(details)
+        trades.extend(details['trades'])
+
+        matrix = signals_to_matrix([signals])
+        equity = equity_curve(close[test_start:test_end], matrix, principal, fee_rate)[:, 0]
+        equity_parts.append(equity + offset)
+        offset += details['total_return']
+
+    index = data_df['交易时间'].iloc[folds[0][2]:folds[-1][3]] if folds else data_df['交易时间'].iloc[:0]
+    values = np.concatenate(equity_parts) if equity_parts else np.empty(0)
+    return {
+        'fold_details': fold_details,
+        'equity': pd.Series(values, index=pd.Index(index.to_numpy(), name='交易时间'), name='样本外权益'),
+        'trades': trades,
+    }
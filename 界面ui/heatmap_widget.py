@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+参数热力图控件
+将参数优化的整张网格指标矩阵渲染为一张图片，支持切换指标、悬停查看数值、点击查看该组参数的回测详情
+"""
+
+import numpy as np
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QSizePolicy
+from PyQt5.QtCore import Qt, QRect, pyqtSignal
+from PyQt5.QtGui import QImage, QPainter, QColor
+
+# 可选择的指标（显示名称, 指标键, 显示倍数）
+HEATMAP_METRICS = [
+    ('收益率(%)', 'return', 100.0),
+    ('夏普比率', 'sharpe', 1.0),
+    ('交易次数', 'trade_count', 1.0),
+    ('胜率(%)', 'win_rate', 100.0),
+    ('盈亏比', 'profit_loss_ratio', 1.0),
+]
+
+# 颜色映射锚点：低值蓝色 → 中间浅黄 → 高值红色
+_COLOR_ANCHORS = np.array([
+    [49, 54, 149],
+    [69, 117, 180],
+    [171, 217, 233],
+    [255, 255, 191],
+    [253, 174, 97],
+    [215, 48, 39],
+    [165, 0, 38],
+], dtype=np.float32)
+
+# 未评估格子的颜色
+_EMPTY_COLOR = (235, 235, 235)
+
+
+def values_to_rgb(values: np.ndarray) -> np.ndarray:
+    """
+    将二维指标矩阵映射为RGB图像数组
+    :param values: 二维 float 数组，NaN 表示未评估
+    :return: 形状为 (rows, cols, 3) 的 uint8 数组
+    """
+    finite = np.isfinite(values)
+    rgb = np.empty(values.shape + (3,), dtype=np.uint8)
+    rgb[:] = _EMPTY_COLOR
+    if not finite.any():
+        return rgb
+
+    # 用1%/99%分位数作为色阶范围，避免极端值压缩整体对比度
+    low, high = np.percentile(values[finite], [1, 99])
+    if high <= low:
+        high = low + 1.0
+    clipped = np.where(np.isnan(values), low, np.clip(values, low, high))
+    scaled = (clipped - low) / (high - low) * (len(_COLOR_ANCHORS) - 1)
+    lower = np.clip(np.floor(scaled).astype(np.intp), 0, len(_COLOR_ANCHORS) - 2)
+    frac = (scaled - lower)[..., None]
+    colors = _COLOR_ANCHORS[lower] * (1 - frac) + _COLOR_ANCHORS[lower + 1] * frac
+
+    # +inf/-inf 按色阶两端着色，NaN 保持空白
+    valid = ~np.isnan(values)
+    rgb[valid] = colors[valid].astype(np.uint8)
+    return rgb
+
+
+class _HeatmapCanvas(QWidget):
+    """热力图绘制区域"""
+    cell_hovered = pyqtSignal(int, int)
+    cell_clicked = pyqtSignal(int, int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMouseTracking(True)
+        self.setMinimumSize(200, 200)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self._image = None
+        self._rgb = None
+        self._shape = (0, 0)
+
+    def set_values(self, values: np.ndarray):
+        """设置要显示的二维矩阵（行=纵轴参数，列=横轴参数）"""
+        self._shape = values.shape
+        rows, cols = self._shape
+        if rows == 0 or cols == 0:
+            self._rgb = None
+            self._image = None
+        else:
+            # QImage 不复制数据，需要保留数组引用
+            self._rgb = np.ascontiguousarray(values_to_rgb(values))
+            self._image = QImage(self._rgb.data, cols, rows, cols * 3, QImage.Format_RGB888)
+        self.update()
+
+    def _plot_rect(self) -> QRect:
+        return self.rect().adjusted(2, 2, -2, -2)
+
+    def _cell_at(self, pos):
+        rows, cols = self._shape
+        rect = self._plot_rect()
+        if rows == 0 or cols == 0 or not rect.contains(pos):
+            return None
+        col = int((pos.x() - rect.left()) * cols / max(rect.width(), 1))
+        row = int((pos.y() - rect.top()) * rows / max(rect.height(), 1))
+        return min(row, rows - 1), min(col, cols - 1)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(*_EMPTY_COLOR))
+        if self._image is not None:
+            # 不做平滑插值，保证每个格子边界清晰
+            painter.setRenderHint(QPainter.SmoothPixmapTransform, False)
+            painter.drawImage(self._plot_rect(), self._image)
+        painter.end()
+
+    def mouseMoveEvent(self, event):
+        cell = self._cell_at(event.pos())
+        if cell is not None:
+            self.cell_hovered.emit(*cell)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            cell = self._cell_at(event.pos())
+            if cell is not None:
+                self.cell_clicked.emit(*cell)
+
+
+class ParameterHeatmap(QWidget):
+    """参数网格热力图：指标选择 + 热力图 + 悬停信息"""
+    # 点击格子时发出对应的参数字典
+    params_clicked = pyqtSignal(dict)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._grid = None
+        self._values = None
+        self._rest_index = None
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        top_layout = QHBoxLayout()
+        top_layout.addWidget(QLabel("热力图指标:"))
+        self.metric_combo = QComboBox()
+        for display_name, _, _ in HEATMAP_METRICS:
+            self.metric_combo.addItem(display_name)
+        self.metric_combo.currentIndexChanged.connect(self._refresh)
+        top_layout.addWidget(self.metric_combo)
+        self.axis_label = QLabel("")
+        top_layout.addWidget(self.axis_label)
+        top_layout.addStretch()
+        layout.addLayout(top_layout)
+
+        self.canvas = _HeatmapCanvas()
+        self.canvas.cell_hovered.connect(self._on_cell_hovered)
+        self.canvas.cell_clicked.connect(self._on_cell_clicked)
+        layout.addWidget(self.canvas)
+
+        self.info_label = QLabel("悬停查看参数，点击查看回测详情")
+        layout.addWidget(self.info_label)
+        self.setLayout(layout)
+
+    def set_grid(self, grid: dict):
+        """
+        设置参数网格（optimize_parameters 返回结果中的 'grid'）
+        只显示前两个参数构成的二维平面
+        :param grid: {'param_names', 'axes', 'metrics'}
+        """
+        if not grid or len(grid.get('axes', [])) < 2:
+            self._grid = None
+            self.canvas.set_values(np.full((0, 0), np.nan, dtype=np.float32))
+            return
+        self._grid = grid
+        names = grid['param_names']
+        self.axis_label.setText(f"纵轴: {names[0]}  横轴: {names[1]}")
+        self._refresh()
+
+    def _current_metric(self):
+        return HEATMAP_METRICS[max(self.metric_combo.currentIndex(), 0)]
+
+    def _refresh(self):
+        if self._grid is None:
+            return
+        _, key, _ = self._current_metric()
+        values = self._grid['metrics'][key]
+        self._rest_index = None
+        # 超过两个参数时，其余维度取该指标最优的格子投影到前两维
+        if values.ndim > 2:
+            rest = values.reshape(values.shape[0], values.shape[1], -1)
+            self._rest_index = np.where(np.isnan(rest), -np.inf, rest).argmax(axis=2)
+            values = np.take_along_axis(rest, self._rest_index[..., None], axis=2)[..., 0]
+        self._values = values
+        self.canvas.set_values(values)
+
+    def _params_at(self, row: int, col: int) -> dict:
+        names = self._grid['param_names']
+        axes = self._grid['axes']
+        params = {names[0]: axes[0][row], names[1]: axes[1][col]}
+        if self._rest_index is not None:
+            rest_shape = tuple(len(values) for values in axes[2:])
+            for d, position in enumerate(np.unravel_index(self._rest_index[row, col], rest_shape)):
+                params[names[2 + d]] = axes[2 + d][position]
+        return params
+
+    def _on_cell_hovered(self, row, col):
+        if self._grid is None or self._values is None:
+            return
+        display_name, _, scale = self._current_metric()
+        value = self._values[row, col]
+        params = ", ".join(f"{k}={v}" for k, v in self._params_at(row, col).items())
+        if np.isnan(value):
+            self.info_label.setText(f"{params}: 未评估")
+        else:
+            self.info_label.setText(f"{params}: {display_name} = {value * scale:.4f}")
+
+    def _on_cell_clicked(self, row, col):
+        if self._grid is None or self._values is None or np.isnan(self._values[row, col]):
+            return
+        self.params_clicked.emit(self._params_at(row, col))
@@ -1,19 +1,31 @@
+import sys
+import os
+
 import pandas as pd
 import numpy as np
 
+# 添加项目根目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from utils.indicator_cache import shared_ma_bank
+from utils.param_space import Param, ParamSpace, STAGE_BACKTEST, STAGE_INDICATOR
+
 # 策略描述
 STRATEGY_DESCRIPTION = "双均线择时策略：通过计算短期和长期均线的交叉来产生买卖信号。当短期均线上穿长期均线时买入，下穿时卖出。"
 
+# 策略参数声明：两个均线周期属于指标阶段，本金、手续费和止损只影响回测记账
+STRATEGY_PARAMS = ParamSpace([
+    Param('short_ma', int, 5, low=1, search_high=360, stage=STAGE_INDICATOR, label='短期均线周期'),
+    Param('long_ma', int, 20, low=1, search_high=360, stage=STAGE_INDICATOR, label='长期均线周期'),
+    Param('principal', float, 100000.0, low=0.0, stage=STAGE_BACKTEST, label='本金金额', example=100000),
+    Param('fee_rate', float, 0.001, low=0.0, high=1.0, stage=STAGE_BACKTEST, label='手续费率'),
+    Param('stops', str, '', stage=STAGE_BACKTEST, label='止损/止盈/跟踪止损', example='0.05/0.1/0.03'),
+], constraints=['short_ma < long_ma'])
+
 # 策略参数描述
-STRATEGY_PARAM_DESCRIPTIONS = [
-    "短期均线周期(如: 5)",
-    "长期均线周期(如: 20)",
-    "本金金额(如: 100000)",
-    "手续费率(如: 0.001)",
-    "参数 5"
-]
-
-def equity_signal(btc_df: pd.DataFrame, *args) -> pd.Series:
+STRATEGY_PARAM_DESCRIPTIONS = STRATEGY_PARAMS.descriptions()
+
+def equity_signal(btc_df: pd.DataFrame, *args, ma_bank=None) -> pd.Series:
     """
     根据BTC数据，使用短期和长期均线择时信号
     :param btc_df: 包含 BTC 数据的 DataFrame，必须包含 '收盘价' 列
@@ -22,6 +34,7 @@ def equity_signal(btc_df: pd.DataFrame, *args) -> pd.Series:
                  args[1]=长期均线周期，
                  args[2]=本金金额（可选），
                  args[3]=手续费率（可选）
+    :param ma_bank: 预先计算好的均线库（可选），参数优化时由优化器传入以复用均线
     :return: 返回包含信号的 Series（1=做多，0=空仓）
     """
     # ===== 获取策略参数
@@ -31,21 +44,21 @@ def equity_signal(btc_df: pd.DataFrame, *args) -> pd.Series:
     principal = float(args[2]) if len(args) > 2 and args[2] else 100000.0  # 默认本金10万元
     fee_rate = float(args[3]) if len(args) > 3 and args[3] else 0.001  # 默认手续费率0.1%
 
-    # ===== 计算均线
-    ma_short = btc_df['收盘价'].rolling(short_n, min_periods=1).mean()
-    ma_long = btc_df['收盘价'].rolling(long_n, min_periods=1).mean()
+    # ===== 计算均线（等价于 rolling(n, min_periods=1).mean()），未传入时使用指标缓存中与优化器共用的均线库
+    if ma_bank is None:
+        ma_bank = shared_ma_bank(btc_df['收盘价'])
 
-    # ===== 初始化信号 Series，默认空仓
-    signals = pd.Series(np.nan, index=btc_df.index)
+    # ===== 金叉买入、死叉平仓，信号延续，首个信号之前默认开仓
+    signals = ma_bank.crossover_series(short_n, long_n, index=btc_df.index)
+    return signals
 
-    # ===== 找出金叉买入信号（短期均线上穿长期均线）
-    condition_buy = (ma_short > ma_long) & (ma_short.shift(1) <= ma_long.shift(1))
-    signals[condition_buy] = 1.0
 
-    # ===== 找出死叉平仓信号（短期均线下穿长期均线）
-    condition_sell = (ma_short < ma_long) & (ma_short.shift(1) >= ma_long.shift(1))
-    signals[condition_sell] = 0.0
-
-    # ===== 持续持仓：将前一日信号延续到当前（信号填充）
-    signals = signals.ffill().fillna(1)  # 默认开仓
-    return signals
\ No newline at end of file
+def equity_signal_batch(btc_df: pd.DataFrame, param_grid) -> np.ndarray:
+    """
+    批量计算多组参数的信号，参数优化时自动使用
+    :param btc_df: 包含 BTC 数据的 DataFrame，必须包含 '收盘价' 列
+    :param param_grid: 参数组合列表，每个组合的前两项为 (短期均线周期, 长期均线周期)
+    :return: 形状为 (K线数, 组合数) 的 int8 信号矩阵（1=做多，0=空仓），与逐组合调用 equity_signal 的结果一致
+    """
+    ma_bank = shared_ma_bank(btc_df['收盘价'])
+    return ma_bank.crossover_signals([(combination[0], combination[1]) for combination in param_grid])
@@ -0,0 +1,68 @@
+import sys
+import os
+
+import pandas as pd
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from utils.param_space import Param, ParamSpace, STAGE_BACKTEST, STAGE_INDICATOR, STAGE_SIGNAL, run_stages
+from k线图.indicators import rsi
+
+# 策略描述
+STRATEGY_DESCRIPTION = "RSI超买超卖策略：RSI 上穿超卖线时买入，下穿超买线时卖出。"
+
+# 策略参数声明：RSI 周期属于指标阶段，超买/超卖线只影响信号规则，参数优化时同一周期的 RSI 只计算一次
+STRATEGY_PARAMS = ParamSpace([
+    Param('rsi_period', int, 14, low=2, high=50, step=2, stage=STAGE_INDICATOR, label='RSI周期'),
+    Param('oversold', float, 30.0, low=0.0, high=50.0, step=5.0, stage=STAGE_SIGNAL, label='超卖线'),
+    Param('overbought', float, 70.0, low=50.0, high=100.0, step=5.0, stage=STAGE_SIGNAL, label='超买线'),
+    Param('principal', float, 100000.0, low=0.0, stage=STAGE_BACKTEST, label='本金金额', example=100000),
+    Param('fee_rate', float, 0.001, low=0.0, high=1.0, stage=STAGE_BACKTEST, label='手续费率'),
+], constraints=['oversold < overbought'])
+
+# 策略参数描述
+STRATEGY_PARAM_DESCRIPTIONS = STRATEGY_PARAMS.descriptions()
+
+
+def compute_indicators(data_df: pd.DataFrame, rsi_period: int) -> np.ndarray:
+    """
+    指标阶段：计算 RSI
+    :param data_df: 行情数据，必须包含 '收盘价' 列
+    :param rsi_period: RSI 周期
+    :return: RSI 数组
+    """
+    return rsi(data_df['收盘价'], rsi_period)
+
+
+def generate_signals(data_df: pd.DataFrame, indicators: np.ndarray, oversold: float, overbought: float) -> pd.Series:
+    """
+    信号阶段：由 RSI 生成信号
+    :param data_df: 行情数据
+    :param indicators: compute_indicators 的结果
+    :param oversold: 超卖线
+    :param overbought: 超买线
+    :return: 信号Series（1=做多，0=空仓，NaN=沿用上一状态）
+    """
+    value = indicators
+    previous = np.roll(value, 1)
+    previous[0] = np.nan
+    with np.errstate(invalid='ignore'):
+        buy = (previous <= oversold) & (value > oversold)
+        sell = (previous >= overbought) & (value < overbought)
+    signals = np.full(len(value), np.nan)
+    signals[buy] = 1.0
+    signals[sell] = 0.0
+    return pd.Series(signals, index=data_df.index)
+
+
+def equity_signal(btc_df: pd.DataFrame, *args) -> pd.Series:
+    """
+    根据RSI超买超卖生成择时信号
+    :param btc_df: 包含 BTC 数据的 DataFrame，必须包含 '收盘价' 列
+    :param args: 按 STRATEGY_PARAMS 的顺序传入：RSI周期、超卖线、超买线、本金、手续费率，留空的使用默认值
+    :return: 返回包含信号的 Series（1=做多，0=空仓）
+    """
+    values = STRATEGY_PARAMS.validate(STRATEGY_PARAMS.bind(args))
+    return run_stages(sys.modules[__name__], btc_df, values)
@@ -8,15 +8,21 @@ import numpy as np
 from itertools import product
 import sys
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import multiprocessing
+from functools import partial
 import time  # 添加时间模块用于性能测试
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 # 导入资金管理模块
-from utils.money_management import calculate_trade_details
+from utils.money_management import calculate_trade_details, calculate_bar_returns, calculate_sharpe_ratio
+from utils.indicator_bank import accepts_ma_bank
+from utils.indicator_cache import get_indicator_cache, shared_ma_bank
+from utils.result_collector import TopKCollector, build_metric_grid
+from utils.batch_backtest import batch_backtest, batch_signal_func, check_signal_matrix
+from utils.param_space import STAGE_INDICATOR, strategy_param_space
 
 # 策略描述
 STRATEGY_DESCRIPTION = "参数优化策略：通过遍历不同的参数组合，寻找最优的策略参数配置，适用于各种金融数据类型。支持生成所有可能的短期和长期均线组合（短期 < 长期）。"
@@ -24,7 +30,7 @@ STRATEGY_DESCRIPTION = "参数优化策略：通过遍历不同的参数组合
 # 策略参数描述
 STRATEGY_PARAM_DESCRIPTIONS = [
     "优化策略名称(默认: MA双均线择时)",
-    "参数范围开始值(如: 5)",
+    "参数范围开始值(如: 5)，或按参数名设置范围(如: rsi_period=6:30:2; oversold=20,30)",
     "参数范围结束值(如: 60)",
     "本金金额(如: 100000)",
     "手续费率(如: 0.001)"
@@ -56,51 +62,47 @@ def equity_signal(data_df: pd.DataFrame, *args) -> pd.Series:
     signals = pd.Series(1.0, index=data_df.index)
     return signals
 
-def calculate_returns(data_df: pd.DataFrame, signals: pd.Series, principal: float = 100000.0, fee_rate: float = 0.001) -> tuple:
+def calculate_returns(data_df: pd.DataFrame, signals: pd.Series, principal: float = 100000.0, fee_rate: float = 0.001, trade_details: dict = None, bar_returns: np.ndarray = None) -> tuple:
     """
     计算策略收益（与手动回测保持一致）
     :param data_df: 包含金融数据的 DataFrame
     :param signals: 交易信号
     :param principal: 本金
     :param fee_rate: 手续费率
+    :param trade_details: 已计算好的交易详情（可选），传入时不再重复回测
+    :param bar_returns: 预先计算的逐K线收益率（可选），传入时不再重复计算
     :return: 总收益和夏普比率
     """
     # 使用与手动回测相同的收益计算方式
-    from utils.money_management import calculate_trade_details
-    trade_details = calculate_trade_details(data_df, signals, principal, fee_rate)
+    if trade_details is None:
+        trade_details = calculate_trade_details(data_df, signals, principal, fee_rate)
     
     # 总收益（以百分比表示）
     total_return = trade_details['total_return_rate'] / 100.0
     
-    # 计算夏普比率（基于每日收益率）
-    returns = data_df['收盘价'].pct_change().fillna(0)
-    strategy_returns = returns * signals.shift(1).fillna(0)
-    
-    # 计算夏普比率（年化）
-    if strategy_returns.std() > 0:
-        sharpe_ratio = strategy_returns.mean() / strategy_returns.std() * np.sqrt(252)
-    else:
-        sharpe_ratio = 0
+    # 计算夏普比率（基于每日收益率，年化）
+    if bar_returns is None:
+        bar_returns = calculate_bar_returns(data_df)
+    sharpe_ratio = calculate_sharpe_ratio(bar_returns, signals)
     
     return total_return, sharpe_ratio
 
 def _evaluate_single_combination(args):
     """
-    评估单个参数组合的内部函数
-    :param args: 包含(data_df, strategy_func, param_combination, principal, fee_rate)的元组
+    评估单个参数组合的内部函数（每个组合只回测一次）
+    :param args: 包含(data_df, strategy_func, param_combination, principal, fee_rate, params, bar_returns)的元组
     :return: 评估结果
     """
-    data_df, strategy_func, param_combination, principal, fee_rate, params = args
+    data_df, strategy_func, param_combination, principal, fee_rate, params, bar_returns = args
     
     try:
         # 运行策略
         signals = strategy_func(data_df, *param_combination)
         
-        # 计算收益（使用与手动回测一致的方式）
-        total_return, sharpe_ratio = calculate_returns(data_df, signals, principal, fee_rate)
-        
-        # 计算交易详情
+        # 计算交易详情（收益和夏普比率共用这一次回测结果）
         trade_details = calculate_trade_details(data_df, signals, principal, fee_rate)
+        total_return, sharpe_ratio = calculate_returns(data_df, signals, principal, fee_rate,
+                                                       trade_details=trade_details, bar_returns=bar_returns)
         
         # 记录结果
         result = {
@@ -122,32 +124,321 @@ def _evaluate_single_combination(args):
         }
         return result
 
-def optimize_parameters(data_df: pd.DataFrame, strategy_func, param_ranges: dict, principal: float = 100000.0, fee_rate: float = 0.001, max_workers: int = None, progress_callback=None) -> dict:
+# 批量信号矩阵每批的元素数上限（K线数 × 组合数），控制信号矩阵和批量回测中间数组的内存
+BATCH_SIGNAL_ELEMENTS = 1 << 25
+
+def _iter_thread_results(evaluation_args: list, max_workers: int):
+    """
+    使用线程池评估参数组合，按完成顺序产出结果
+    同时在途的任务数有上限，已完成的结果交给调用方后即可释放
+    :param evaluation_args: _evaluate_single_combination 的参数元组列表
+    :param max_workers: 线程数
+    :return: 生成器，产出 (组合序号, 评估结果字典)
     """
-    优化策略参数（支持多线程加速）
+    max_pending = max_workers * 4
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+        next_index = 0
+        while pending or next_index < len(evaluation_args):
+            # 补充任务直到达到在途上限
+            while next_index < len(evaluation_args) and len(pending) < max_pending:
+                future = executor.submit(_evaluate_single_combination, evaluation_args[next_index])
+                pending[future] = next_index
+                next_index += 1
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+
+class _CombinationEvaluator:
+    """
+    参数组合评估器：按批评估参数组合，线程和进程两种执行方式共用
+    同一次优化中的多批评估共享逐K线收益率、均线库和共享内存行情数据
+    策略模块提供 equity_signal_batch 时，按批生成信号矩阵并批量回测，出错时改为逐组合调用 equity_signal
+    """
+    
+    def __init__(self, data_df: pd.DataFrame, strategy_func, param_names: list, principal: float, fee_rate: float, executor: str, max_workers: int, cache_path: str = None):
+        self.data_df = data_df
+        self.strategy_func = strategy_func
+        self.param_names = param_names
+        self.principal = principal
+        self.fee_rate = fee_rate
+        self.executor = executor
+        self.max_workers = max_workers
+        # 逐K线收益率每次优化只计算一次，所有组合共享
+        self.bar_returns = calculate_bar_returns(data_df)
+        # 支持均线库的策略：均线周期只计算一次，与普通回测共用指标缓存中的均线库（进程模式下由子进程各自构建）
+        self.ma_bank = None
+        if executor != 'process' and accepts_ma_bank(strategy_func):
+            self.ma_bank = shared_ma_bank(data_df['收盘价'])
+        self._market_data = None
+        # 策略模块提供的批量信号函数（可选）
+        self.batch_func = batch_signal_func(strategy_func)
+        # 结果缓存：已完成的组合直接读取，新结果边算边写入
+        self.cache = None
+        self.cache_hits = 0
+        if cache_path:
+            from utils.result_cache import ResultCache
+            self.cache = ResultCache(cache_path, data_df, strategy_func, principal, fee_rate)
+    
+    def make_params(self, param_combination: tuple) -> dict:
+        """构建参数字典"""
+        return dict(zip(self.param_names, param_combination))
+    
+    def evaluate(self, combinations: list):
+        """
+        评估一批参数组合
+        :param combinations: 参数元组列表
+        :return: 生成器，产出 (批内序号, 评估结果字典)
+        """
+        if not combinations:
+            return
+        if self.cache is None:
+            yield from self._evaluate(combinations)
+            return
+        
+        cached = self.cache.get_many([self.make_params(combination) for combination in combinations])
+        for index, values in cached.items():
+            self.cache_hits += 1
+            yield index, self._compact_result(combinations[index], *values)
+        remaining = [index for index in range(len(combinations)) if index not in cached]
+        for local_index, result in self._evaluate([combinations[index] for index in remaining]):
+            if 'error' not in result:
+                details = result.get('trade_details', {})
+                self.cache.put(result['params'], (result['return'], result['sharpe'], details.get('trade_count', 0),
+                                                  details.get('win_rate', 0), details.get('profit_loss_ratio', 0)))
+            yield remaining[local_index], result
+    
+    def _compact_result(self, combination: tuple, total_return, sharpe, trade_count, win_rate, profit_loss_ratio) -> dict:
+        """只含精简指标的结果，交易明细在排序后按需补算"""
+        return {
+            'params': self.make_params(combination),
+            'return': total_return,
+            'sharpe': sharpe,
+            'param_combination': combination,
+            'trade_details': {
+                'trade_count': trade_count,
+                'win_rate': win_rate,
+                'profit_loss_ratio': profit_loss_ratio
+            }
+        }
+    
+    def _evaluate(self, combinations: list):
+        """评估一批参数组合：优先使用批量信号函数，其余组合按执行方式逐个评估"""
+        if not combinations:
+            return
+        done = 0
+        if self.batch_func is not None:
+            for index, result in self._iter_batch_results(combinations):
+                done = index + 1
+                yield index, result
+        for index, result in self._evaluate_each(combinations[done:]):
+            yield done + index, result
+    
+    def _iter_batch_results(self, combinations: list):
+        """
+        调用策略的批量信号函数得到 (bars × combos) 信号矩阵，用 batch_backtest 一次回测
+        批量信号函数出错时停止，剩余组合由调用方逐个评估
+        """
+        bars = len(self.data_df)
+        chunk_size = max(1, BATCH_SIGNAL_ELEMENTS // max(bars, 1))
+        close = self.data_df['收盘价'].to_numpy()
+        for start in range(0, len(combinations), chunk_size):
+            chunk = combinations[start:start + chunk_size]
+            try:
+                signal_matrix = check_signal_matrix(self.batch_func(self.data_df, chunk), bars, len(chunk))
+            except Exception as e:
+                print(f"批量信号函数执行出错，改为逐组合计算: {e}")
+                self.batch_func = None
+                return
+            metrics = batch_backtest(close, signal_matrix, self.principal, self.fee_rate)
+            for offset, combination in enumerate(chunk):
+                yield start + offset, self._compact_result(
+                    combination, metrics['total_return_rate'][offset] / 100.0, metrics['sharpe'][offset],
+                    int(metrics['trade_count'][offset]), metrics['win_rate'][offset], metrics['profit_loss_ratio'][offset])
+    
+    def _evaluate_each(self, combinations: list):
+        """按执行方式逐个评估参数组合"""
+        if not combinations:
+            return
+        if self.executor == 'process':
+            if self._market_data is None:
+                from utils.process_pool import SharedMarketData
+                self._market_data = SharedMarketData(self.data_df)
+            yield from self._iter_process_results(combinations)
+            return
+        
+        eval_func = self.strategy_func
+        if self.ma_bank is not None:
+            # 在提交任务前补算本批需要的均线周期，线程中只读
+            self.ma_bank.ensure({int(w) for combination in combinations for w in combination[:2]})
+            eval_func = partial(self.strategy_func, ma_bank=self.ma_bank)
+        evaluation_args = [(self.data_df, eval_func, combination, self.principal, self.fee_rate,
+                            self.make_params(combination), self.bar_returns)
+                           for combination in combinations]
+        yield from _iter_thread_results(evaluation_args, self.max_workers)
+    
+    def _iter_process_results(self, combinations: list):
+        """
+        使用共享内存 + 常驻进程池评估参数组合
+        子进程只返回精简指标，交易明细在排序后为前若干名单独补算
+        """
+        from utils.process_pool import iter_process_results
+        
+        for index, total_return, sharpe, trade_count, win_rate, profit_loss_ratio, error in iter_process_results(
+                self.data_df, self.strategy_func, combinations, self.principal, self.fee_rate,
+                self.max_workers, market_data=self._market_data):
+            params = self.make_params(combinations[index])
+            if error is not None:
+                print(f"参数组合 {params} 执行出错: {error}")
+                yield index, {'params': params, 'return': total_return, 'sharpe': sharpe, 'error': error}
+                continue
+            yield index, self._compact_result(combinations[index], total_return, sharpe, trade_count, win_rate, profit_loss_ratio)
+    
+    def fill_trade_details(self, results: list):
+        """为只有精简指标的结果补算完整交易明细"""
+        for result in results:
+            if 'param_combination' in result:
+                signals = self.strategy_func(self.data_df, *result.pop('param_combination'))
+                result['trade_details'] = calculate_trade_details(self.data_df, signals, self.principal, self.fee_rate)
+    
+    def close(self):
+        """释放共享内存，提交缓存"""
+        # 均线库在优化过程中补算了大量周期、分阶段策略缓存了各组指标，重新计量后按内存预算淘汰
+        get_indicator_cache().trim()
+        self.ma_bank = None
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+        if self._market_data is not None:
+            self._market_data.close()
+            self._market_data = None
+
+def _resolve_search_space(param_ranges: dict, space=None) -> tuple:
+    """
+    解析参数范围
+    :param param_ranges: 参数范围字典
+    :param space: 策略声明的参数空间（STRATEGY_PARAMS），声明了时参数名、默认范围和约束都以声明为准
+    :return: (参数名列表, 各参数取值列表, 约束函数)
+    """
+    if space is not None:
+        overrides = dict(param_ranges or {})
+        # 单一的 ma_range 作用于指标阶段的全部整数参数（如两个均线周期），按各参数声明的 low/high 截取
+        shared_range = overrides.pop('ma_range', None)
+        if shared_range is not None:
+            for name in space.stage_names(STAGE_INDICATOR):
+                if space[name].kind is int and name not in overrides:
+                    values = space[name].within(shared_range)
+                    if not values:
+                        raise ValueError(f"参数范围 {min(shared_range)}-{max(shared_range)} 不在 {space[name].label} 允许的范围内")
+                    overrides[name] = values
+        ranges = space.search_ranges(overrides)
+        param_names = list(ranges)
+        return param_names, list(ranges.values()), space.constraint_for(param_names)
+    
+    param_names = list(param_ranges.keys())
+    param_values = [list(values) for values in param_ranges.values()]
+    
+    # 如果只有一个参数范围，生成所有可能的短期和长期均线组合
+    if len(param_names) == 1 and param_names[0] == 'ma_range':
+        param_names = ['short_ma', 'long_ma']
+        param_values = [param_values[0], param_values[0]]
+    
+    constraint = None
+    if param_names[:2] == ['short_ma', 'long_ma']:
+        # 确保短期均线小于长期均线
+        constraint = lambda combination: combination[0] < combination[1]
+    return param_names, param_values, constraint
+
+# 逐级减半筛选：每级保留 1/HALVING_ETA 的组合，最多 HALVING_RUNGS 级（最后一级为完整数据）
+HALVING_ETA = 4
+HALVING_RUNGS = 4
+# 低保真度数据窗口的最少K线数
+HALVING_MIN_BARS = 1000
+
+def _successive_halving(data_df: pd.DataFrame, strategy_func, combinations: list, param_names: list, principal: float, fee_rate: float, executor: str, max_workers: int, objective: str, keep: int, report, cache_path: str = None) -> list:
+    """
+    逐级减半（Successive Halving）筛选参数组合
+    先在最近一小段数据上评估全部组合，只把排名靠前的组合晋级到更长的数据窗口，
+    最终返回需要在完整数据上评估的组合（排名只以完整数据结果为准）
+    :param data_df: 完整行情数据
+    :param combinations: 候选参数组合
+    :param keep: 进入完整数据评估的最少组合数
+    :param report: 进度输出函数
+    :param cache_path: 结果缓存数据库路径
+    :return: 晋级到完整数据的参数组合列表
+    """
+    total_bars = len(data_df)
+    # 各级数据窗口：完整数据的 1/eta^k，太短的级别直接跳过
+    windows = []
+    for level in range(HALVING_RUNGS - 1, 0, -1):
+        rows = total_bars // (HALVING_ETA ** level)
+        if rows >= HALVING_MIN_BARS:
+            windows.append(rows)
+    
+    survivors = list(combinations)
+    for rung, rows in enumerate(windows, 1):
+        n_keep = max(int(np.ceil(len(survivors) / HALVING_ETA)), keep)
+        if len(survivors) <= n_keep:
+            break
+        # 使用最近的一段数据，保持与完整数据相同的K线周期，参数含义不变
+        subset = data_df.iloc[-rows:].reset_index(drop=True)
+        report(f"逐级筛选 第{rung}级: 在最近 {rows} 根K线上评估 {len(survivors)} 种组合，保留 {n_keep} 种")
+        evaluator = _CombinationEvaluator(subset, strategy_func, param_names, principal, fee_rate, executor, max_workers, cache_path)
+        scores = np.full(len(survivors), -np.inf)
+        try:
+            for index, result in evaluator.evaluate(survivors):
+                value = result.get(objective, -np.inf)
+                if value is not None and np.isfinite(value):
+                    scores[index] = value
+        finally:
+            evaluator.close()
+        # 分数相同时保持原有顺序
+        order = np.argsort(-scores, kind='stable')[:n_keep]
+        survivors = [survivors[i] for i in sorted(order)]
+    return survivors
+
+def optimize_parameters(data_df: pd.DataFrame, strategy_func, param_ranges: dict, principal: float = 100000.0, fee_rate: float = 0.001, max_workers: int = None, progress_callback=None, executor: str = 'thread', top_k: int = 50, objective: str = 'return', search: str = 'grid', budget: int = None, seed: int = None, cache_path: str = None, state_path: str = None) -> dict:
+    """
+    优化策略参数（支持多线程/多进程加速）
     :param data_df: 包含金融数据的 DataFrame
     :param strategy_func: 策略函数
     :param param_ranges: 参数范围字典，格式如 {'short_ma': range(5, 21), 'long_ma': range(20, 61)}
-                         如果只有一个范围，会自动生成合适的短期和长期均线范围
+                         如果只有一个范围，会自动生成合适的短期和长期均线范围；
+                         策略模块声明了 STRATEGY_PARAMS 时，未给出范围的参数使用声明中的默认范围，约束也以声明为准
     :param principal: 本金
     :param fee_rate: 手续费率
     :param max_workers: 最大工作线程数，默认为CPU核心数
     :param progress_callback: 进度更新回调函数
-    :return: 包含优化结果的字典
+    :param executor: 执行方式，'thread' 为线程池，'process' 为共享内存 + 常驻进程池
+    :param top_k: 保留完整交易明细的最优结果数量
+    :param objective: 排序指标，'return' 或 'sharpe'
+    :param search: 搜索方式，'grid' 为穷举，'random' 为随机搜索，'tpe' 为贝叶斯优化（TPE），
+                   'halving' 为逐级减半：先在最近一小段数据上筛选，只有靠前的组合用完整数据评估
+    :param budget: 非穷举搜索时的评估次数上限，默认200；逐级减半时为参与筛选的组合数上限（默认不限）
+    :param seed: 随机搜索的随机种子，相同种子结果可复现
+    :param cache_path: 结果缓存数据库（SQLite）路径，设置后已完成的组合不再重复计算，中断后重新运行即可继续
+    :param state_path: 增量状态文件（.npz）路径，设置后保存每个组合在数据末尾的状态，
+                       数据追加新K线后再次运行只回测新增部分（仅支持双均线网格）
+    :return: 包含优化结果的字典，'all_results' 为前 top_k 个结果，
+             'metrics' 为所有已评估组合的精简指标数组，'grid' 为按参数网格排列的指标矩阵
     """
     start_time = time.time()  # 记录开始时间
     
+    def report(message):
+        print(message)
+        if progress_callback:
+            progress_callback(message)
+    
     best_params = None
     best_return = -float('inf')
     best_sharpe = -float('inf')
-    results = []
+    collector = TopKCollector(k=top_k, objective=objective)
     
-    # 检查参数范围
-    param_names = list(param_ranges.keys())
-    param_values = list(param_ranges.values())
+    # 策略声明的参数空间（可选）
+    space = strategy_param_space(strategy_func)
     
     # 如果没有参数范围，直接返回默认结果
-    if not param_names:
+    if not param_ranges and space is None:
         return {
             'best_params': {},
             'best_return': 0.0,
@@ -155,131 +446,242 @@ def optimize_parameters(data_df: pd.DataFrame, strategy_func, param_ranges: dict
             'all_results': []
         }
     
-    # 如果只有一个参数范围，生成所有可能的短期和长期均线组合
-    if len(param_names) == 1 and param_names[0] == 'ma_range':
-        # 获取单一范围
-        ma_range = param_values[0]
-        # 生成所有可能的短期和长期均线组合（短期 < 长期）
-        combinations = []
-        ma_list = list(ma_range)
-        for i in range(len(ma_list)):
-            for j in range(i+1, len(ma_list)):
-                combinations.append((ma_list[i], ma_list[j]))
-        
-        # 更新参数名称
-        param_names = ['short_ma', 'long_ma']
-    else:
-        # 如果已经有明确的短期和长期均线范围，使用笛卡尔积
-        # 遍历所有参数组合
-        combinations = list(product(*param_values))
-    
-    total_combinations = len(combinations)
-    progress_message = f"开始参数优化，总共需要测试 {total_combinations} 种参数组合"
-    print(progress_message)
-    if progress_callback:
-        progress_callback(progress_message)
+    param_names, axis_values, constraint = _resolve_search_space(param_ranges, space)
     
     # 设置最大工作线程数
     if max_workers is None:
-        max_workers = min(4, multiprocessing.cpu_count())  # 限制最大线程数以避免系统过载
-    progress_message = f"使用 {max_workers} 个线程进行并行计算"
-    print(progress_message)
-    if progress_callback:
-        progress_callback(progress_message)
-    
-    # 准备参数列表
-    evaluation_args = []
-    for param_combination in combinations:
-        # 构建参数字典
-        if len(param_names) == 2 and param_names == ['short_ma', 'long_ma']:
-            # 确保短期均线小于长期均线
-            if param_combination[0] >= param_combination[1]:
-                continue
-            params = {param_names[0]: param_combination[0], param_names[1]: param_combination[1]}
+        if executor == 'process':
+            max_workers = multiprocessing.cpu_count()  # 进程不受GIL限制，默认使用全部核心
         else:
-            params = dict(zip(param_names, param_combination))
-        
-        evaluation_args.append((data_df, strategy_func, param_combination, principal, fee_rate, params))
+            max_workers = min(4, multiprocessing.cpu_count())  # 限制最大线程数以避免系统过载
+    
+    if search in ('grid', 'halving'):
+        # 穷举所有合法的参数组合
+        combinations = [combination for combination in product(*axis_values)
+                        if constraint is None or constraint(combination)]
+        searcher = None
+        if search == 'halving':
+            if budget and budget < len(combinations):
+                rng = np.random.default_rng(seed)
+                combinations = [combinations[i] for i in sorted(rng.choice(len(combinations), int(budget), replace=False))]
+            report(f"开始参数优化（逐级减半），候选 {len(combinations)} 种参数组合")
+            report(f"使用 {max_workers} 个{'进程' if executor == 'process' else '线程'}进行并行计算")
+            combinations = _successive_halving(data_df, strategy_func, combinations, param_names, principal, fee_rate,
+                                               executor, max_workers, objective, min(top_k, len(combinations)), report, cache_path)
+            report(f"逐级筛选完成，{len(combinations)} 种组合进入完整数据评估")
+        else:
+            report(f"开始参数优化，总共需要测试 {len(combinations)} 种参数组合")
+            report(f"使用 {max_workers} 个{'进程' if executor == 'process' else '线程'}进行并行计算")
+        total_combinations = len(combinations)
+    else:
+        from utils.param_search import make_searcher
+        budget = int(budget) if budget else 200
+        searcher = make_searcher(search, axis_values, constraint, seed, budget)
+        total_combinations = min(budget, searcher.space_size)
+        report(f"开始参数优化（{search} 搜索），参数空间 {searcher.space_size} 种组合，评估预算 {total_combinations} 次")
+        report(f"使用 {max_workers} 个{'进程' if executor == 'process' else '线程'}进行并行计算")
+    
+    # 增量模式只支持双均线网格（信号由均线库的交叉规则生成），其余情况按完整回测处理
+    incremental = bool(state_path) and search == 'grid'
+    if incremental and not (param_names == ['short_ma', 'long_ma'] and accepts_ma_bank(strategy_func)):
+        report("增量模式仅支持使用均线库的双均线策略，改为完整回测")
+        incremental = False
+    
+    evaluator = _CombinationEvaluator(data_df, strategy_func, param_names, principal, fee_rate, executor, max_workers, cache_path)
+    evaluated = []  # 已评估的参数组合，collector 中的序号指向这里
     
-    # 使用线程池并行计算
+    # 并行计算
     completed = 0
     last_progress = 0
-    progress_message = f"进度: {completed}/{len(evaluation_args)} (0.00%) 完成"
-    print(progress_message)
-    if progress_callback:
-        progress_callback(progress_message)
+    best_objective = -float('inf')
+    report(f"进度: {completed}/{total_combinations} (0.00%) 完成")
     
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # 提交所有任务
-        future_to_args = {executor.submit(_evaluate_single_combination, args): args for args in evaluation_args}
-        
-        # 收集结果
-        for future in as_completed(future_to_args):
-            result = future.result()
-            results.append(result)
+    def run_batch(batch, results=None):
+        """评估一批组合并流式收集结果：只有当前前 top_k 名保留交易明细"""
+        nonlocal completed, last_progress, best_objective, best_params, best_return, best_sharpe
+        offset = len(evaluated)
+        evaluated.extend(batch)
+        if results is None:
+            results = evaluator.evaluate(batch)
+        for index, result in results:
+            collector.add(result, offset + index)
+            if searcher is not None:
+                searcher.tell(batch[index], result.get(objective, -float('inf')))
             
             # 更新最优参数
-            if result.get('return', -float('inf')) > best_return:
-                best_return = result['return']
+            if result.get(objective, -float('inf')) > best_objective:
+                best_objective = result[objective]
                 best_params = result['params']
                 # 显示找到更好结果的信息
-                progress_message = f"  -> 找到更优参数组合: {best_params}, 收益: {best_return*100:.4f}%"
-                print(progress_message)
-                if progress_callback:
-                    progress_callback(progress_message)
+                if objective == 'return':
+                    report(f"  -> 找到更优参数组合: {best_params}, 收益: {best_objective*100:.4f}%")
+                else:
+                    report(f"  -> 找到更优参数组合: {best_params}, {objective}: {best_objective:.4f}")
+            if result.get('return', -float('inf')) > best_return:
+                best_return = result['return']
             if result.get('sharpe', -float('inf')) > best_sharpe:
                 best_sharpe = result['sharpe']
             
             completed += 1
             # 计算进度百分比
-            progress_percent = (completed / len(evaluation_args)) * 100
+            progress_percent = (completed / max(total_combinations, 1)) * 100
             
             # 每完成5%或每10个任务显示一次进度
-            if completed == len(evaluation_args) or progress_percent >= last_progress + 5 or completed % 10 == 0:
+            if completed == total_combinations or progress_percent >= last_progress + 5 or completed % 10 == 0:
                 elapsed_time = time.time() - start_time
-                progress_message = f"进度: {completed}/{len(evaluation_args)} ({progress_percent:.2f}%) 完成, 耗时: {elapsed_time:.2f} 秒"
-                print(progress_message)
-                if progress_callback:
-                    progress_callback(progress_message)
+                report(f"进度: {completed}/{total_combinations} ({progress_percent:.2f}%) 完成, 耗时: {elapsed_time:.2f} 秒")
                 last_progress = (progress_percent // 5) * 5  # 更新上次显示的进度
     
-    # 按收益排序结果，增加安全检查
     try:
-        results.sort(key=lambda x: x.get('return', -float('inf')), reverse=True)
-    except Exception as e:
-        progress_message = f"排序结果时出错: {e}"
-        print(progress_message)
-        if progress_callback:
-            progress_callback(progress_message)
-        # 如果排序失败，至少确保结果列表不为空
-        pass
+        if incremental:
+            # 增量模式：读取上次保存的各组合末尾状态，只回测新增K线
+            from utils.incremental import refresh_crossover_sweep
+            state, new_bars = refresh_crossover_sweep(data_df, combinations, principal, fee_rate, state_path)
+            report(f"增量更新: 处理 {new_bars} 根新K线（共 {len(data_df)} 根）")
+            sweep = state.metrics()
+            run_batch(combinations, ((index, evaluator._compact_result(
+                combination, sweep['total_return_rate'][index] / 100.0, sweep['sharpe'][index], int(sweep['trade_count'][index]),
+                sweep['win_rate'][index], sweep['profit_loss_ratio'][index])) for index, combination in enumerate(combinations)))
+        elif searcher is None:
+            run_batch(combinations)
+        else:
+            # 每批数量与并行度相当，兼顾并行效率和模型更新频率
+            batch_size = max(1, max_workers) * 2
+            while completed < total_combinations:
+                batch = searcher.ask(min(batch_size, total_combinations - completed))
+                if not batch:
+                    break  # 合法组合已全部评估
+                run_batch(batch)
+        
+        if evaluator.cache_hits:
+            report(f"其中 {evaluator.cache_hits} 种组合的结果来自缓存")
+        
+        # 前 top_k 个结果（按排序指标从高到低）
+        top_results = collector.top()
+        
+        # 进程模式和缓存命中的结果只有精简指标，这里为入选结果补算完整交易明细
+        evaluator.fill_trade_details(top_results)
+    finally:
+        evaluator.close()
     
-    # 安全地获取前50个结果
-    top_results = []
-    try:
-        top_results = results[:50] if len(results) >= 50 else results
-    except Exception as e:
-        progress_message = f"获取前50个结果时出错: {e}"
-        print(progress_message)
-        if progress_callback:
-            progress_callback(progress_message)
-        top_results = results  # 如果出错，返回所有结果
+    # 全部已评估组合的指标整理为参数网格（float32），供热力图查看参数平稳性
+    metrics = collector.metrics()
+    grid = build_metric_grid(metrics, evaluated, param_names, axis_values)
     
     end_time = time.time()  # 记录结束时间
     elapsed_time = end_time - start_time
-    progress_message = f"参数优化完成，耗时: {elapsed_time:.2f} 秒"
-    print(progress_message)
-    if progress_callback:
-        progress_callback(progress_message)
+    report(f"参数优化完成，耗时: {elapsed_time:.2f} 秒")
     
     return {
         'best_params': best_params,
         'best_return': best_return,
         'best_sharpe': best_sharpe,
-        'all_results': top_results,  # 使用安全获取的结果
+        'all_results': top_results,  # 前 top_k 个结果（含交易明细）
+        'metrics': metrics,  # 所有已评估组合的精简指标
+        'grid': grid,  # 参数网格指标矩阵
+        'evaluated_count': completed,  # 实际评估的组合数
         'elapsed_time': elapsed_time  # 添加耗时信息
     }
 
+def walk_forward_optimize(data_df: pd.DataFrame, strategy_func, param_ranges: dict, n_folds: int = 10, train_ratio: float = 4.0, mode: str = 'rolling', principal: float = 100000.0, fee_rate: float = 0.001, objective: str = 'return', executor: str = 'process', max_workers: int = None, progress_callback=None) -> dict:
+    """
+    滚动前推（Walk-Forward）优化：每个训练窗口选出最优参数，在随后的测试窗口上检验
+    所有参数组合的信号在完整数据上只生成一次，各折共享，折数增加时耗时基本不变
+    :param data_df: 包含金融数据的 DataFrame
+    :param strategy_func: 策略函数（信号只能依赖当前及之前的K线）
+    :param param_ranges: 参数范围字典，格式同 optimize_parameters
+    :param n_folds: 折数
+    :param train_ratio: 训练窗口长度 / 测试窗口长度
+    :param mode: 'rolling' 为滚动窗口，'anchored' 为训练窗口起点固定
+    :param principal: 本金
+    :param fee_rate: 手续费率
+    :param objective: 训练窗口上的选优指标，'return' 或 'sharpe'
+    :param executor: 'process' 为共享内存 + 常驻进程池，'thread' 为线程池
+    :param max_workers: 并行数，默认为CPU核心数（进程）或 min(4, CPU核心数)（线程）
+    :param progress_callback: 进度更新回调函数
+    :return: 字典：'folds' 为每折的窗口、最优参数和训练/测试指标，
+             'oos_equity' 为拼接后的样本外权益曲线，'oos_return' 为样本外总收益率，
+             'oos_trades' 为全部样本外交易，'train_metrics'/'test_metrics' 为所有组合在各折的指标矩阵
+    """
+    from utils.walk_forward import make_folds, iter_window_results, out_of_sample_run
+    
+    start_time = time.time()
+    
+    def report(message):
+        print(message)
+        if progress_callback:
+            progress_callback(message)
+    
+    param_names, axis_values, constraint = _resolve_search_space(param_ranges, strategy_param_space(strategy_func))
+    combinations = [combination for combination in product(*axis_values)
+                    if constraint is None or constraint(combination)]
+    folds = make_folds(len(data_df), n_folds, train_ratio, mode)
+    if max_workers is None:
+        max_workers = multiprocessing.cpu_count() if executor == 'process' else min(4, multiprocessing.cpu_count())
+    report(f"开始滚动前推优化（{'滚动' if mode == 'rolling' else '锚定'}窗口），{len(folds)} 折，"
+           f"{len(combinations)} 种参数组合，使用 {max_workers} 个{'进程' if executor == 'process' else '线程'}")
+    
+    # 训练窗口和测试窗口一起评估：测试指标可用于观察样本内外的衰减
+    windows = [(a, b) for a, b, _, _ in folds] + [(c, d) for _, _, c, d in folds]
+    metric_index = 0 if objective == 'return' else 1
+    scores = np.full((len(combinations), len(windows)), -np.inf)
+    other = np.full((len(combinations), len(windows)), -np.inf)
+    completed = 0
+    last_progress = 0
+    for chunk_results in iter_window_results(data_df, strategy_func, combinations, windows,
+                                             principal, fee_rate, executor, max_workers):
+        for index, returns, sharpes, error in chunk_results:
+            if error is not None:
+                print(f"参数组合 {dict(zip(param_names, combinations[index]))} 执行出错: {error}")
+            chosen, rest = (returns, sharpes) if metric_index == 0 else (sharpes, returns)
+            scores[index] = np.where(np.isfinite(chosen), chosen, -np.inf)
+            other[index] = rest
+        completed += len(chunk_results)
+        progress_percent = completed / max(len(combinations), 1) * 100
+        if completed == len(combinations) or progress_percent >= last_progress + 5:
+            report(f"进度: {completed}/{len(combinations)} ({progress_percent:.2f}%) 完成, 耗时: {time.time() - start_time:.2f} 秒")
+            last_progress = (progress_percent // 5) * 5
+    
+    n = len(folds)
+    returns_matrix = scores if metric_index == 0 else other
+    sharpe_matrix = other if metric_index == 0 else scores
+    best_rows = [int(np.argmax(scores[:, k])) for k in range(n)]
+    fold_params = [combinations[row] for row in best_rows]
+    
+    oos = out_of_sample_run(data_df, strategy_func, folds, fold_params, principal, fee_rate)
+    times = data_df['交易时间']
+    fold_results = []
+    for k, ((train_start, train_end, test_start, test_end), row) in enumerate(zip(folds, best_rows)):
+        details = oos['fold_details'][k]
+        fold_results.append({
+            'train_range': (times.iloc[train_start], times.iloc[train_end - 1]),
+            'test_range': (times.iloc[test_start], times.iloc[test_end - 1]),
+            'best_params': dict(zip(param_names, fold_params[k])),
+            'train_return': returns_matrix[row, k],
+            'train_sharpe': sharpe_matrix[row, k],
+            'test_return': details['total_return_rate'] / 100.0,
+            'test_sharpe': sharpe_matrix[row, n + k],
+            'trade_details': details
+        })
+        report(f"第{k + 1}折: 最优参数 {fold_results[-1]['best_params']}, "
+               f"训练收益 {returns_matrix[row, k]*100:.2f}%, 测试收益 {fold_results[-1]['test_return']*100:.2f}%")
+    
+    oos_return = sum(details['total_return'] for details in oos['fold_details']) / principal if principal > 0 else 0.0
+    elapsed_time = time.time() - start_time
+    report(f"滚动前推优化完成，样本外总收益率: {oos_return*100:.2f}%，耗时: {elapsed_time:.2f} 秒")
+    
+    return {
+        'folds': fold_results,
+        'oos_equity': oos['equity'],
+        'oos_return': oos_return,
+        'oos_trades': oos['trades'],
+        'param_names': param_names,
+        'combinations': combinations,
+        'train_metrics': {'return': returns_matrix[:, :n], 'sharpe': sharpe_matrix[:, :n]},
+        'test_metrics': {'return': returns_matrix[:, n:], 'sharpe': sharpe_matrix[:, n:]},
+        'elapsed_time': elapsed_time
+    }
+
 # 示例参数范围（可根据具体策略调整）
 DEFAULT_PARAM_RANGES = {
     'short_ma': range(5, 21),    # 短期均线周期 5-20
@@ -0,0 +1,41 @@
+import sys
+import os
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from utils.cross_section import STRATEGY_TYPE_CROSS_SECTIONAL, momentum, quantile_weights
+
+# 策略类型：截面策略，回测时加载数据文件所在目录中同一周期的全部币种
+STRATEGY_TYPE = STRATEGY_TYPE_CROSS_SECTIONAL
+
+# 策略描述
+STRATEGY_DESCRIPTION = "截面动量策略：每根K线按过去一段时间的涨幅对所有币种排序，等权持有涨幅最大的一组，定期调仓。"
+
+# 策略参数描述
+STRATEGY_PARAM_DESCRIPTIONS = [
+    "动量回看K线数(如: 20)",
+    "分组数(如: 10)",
+    "调仓间隔K线数(如: 5)",
+    "本金金额(如: 100000)",
+    "手续费率(如: 0.001)"
+]
+
+
+def cross_sectional_signal(panel, *args) -> np.ndarray:
+    """
+    根据多币种行情矩阵计算目标权重
+    :param panel: PricePanel，panel.close 为 (bars × assets) 收盘价矩阵
+    :param args: 策略参数
+                 args[0]=动量回看K线数，
+                 args[1]=分组数
+    :return: (bars × assets) 目标权重矩阵
+    """
+    # ===== 获取策略参数
+    lookback = int(args[0]) if len(args) > 0 and args[0] else 20
+    quantiles = int(args[1]) if len(args) > 1 and args[1] else 10
+
+    # ===== 动量最大的一组等权做多
+    return quantile_weights(momentum(panel.close, lookback), quantiles, long_bucket=-1)